@@ -0,0 +1,300 @@
+import math
+import os
+import struct
+import threading
+import time
+import wave
+from collections import deque
+from contextlib import contextmanager
+
+from PIL import Image
+
+
+# Working copies an effect render holds next to its source: the effect output,
+# the RGB conversion for the encoder and the encoder's own buffer
+RENDER_COPIES = 3
+# Concurrent renders of one request; matches image_effects.RENDER_WORKERS' upper bound
+MAX_PARALLEL_RENDERS = 4
+
+# pydub keeps ffmpeg's whole WAV output plus the decoded segment, the effect
+# engine makes one writable copy, and layering overlays whole segments
+AUDIO_WORKING_COPIES = 4
+# A streamed file is read, scaled and written a block at a time, whatever its length
+AUDIO_STREAM_BYTES = 32 * 1024 * 1024
+# Fallback when a header cannot be parsed: decoded size relative to file size
+UNKNOWN_EXPANSION = 12
+UNKNOWN_FRAME_RATE = 44100
+# The mixer sums layers into float32 samples
+MIX_SAMPLE_BYTES = 4
+
+# Layer III bitrates in kbit/s by bitrate index, for MPEG-1 and MPEG-2/2.5
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)
+}
+MP3_SAMPLE_RATES = {
+    3: (44100, 48000, 32000),  # MPEG-1
+    2: (22050, 24000, 16000),  # MPEG-2
+    0: (11025, 12000, 8000)    # MPEG-2.5
+}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot get memory within its queueing deadline"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class MemoryBudget:
+    """Admit memory-hungry work against a fixed byte budget.
+
+    Callers ask for their estimated peak memory. Work that fits runs at
+    once; the rest waits in FIFO order, so a large request is not starved
+    by a stream of small ones. Requests with a timeout are rejected when the
+    queue is full or the deadline passes; background work may wait forever.
+    A single request larger than the whole budget is admitted alone.
+    """
+
+    def __init__(self, max_bytes, max_queue=16, timeout=10.0):
+        self.max_bytes = max_bytes
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.in_use = 0
+        self.active = 0
+        self.admitted = 0
+        self.waited = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self.peak_queue_depth = 0
+        self.wait_seconds = 0.0
+        self._queue = deque()
+        self._condition = threading.Condition()
+
+    def _fits(self, nbytes):
+        return self.in_use + nbytes <= self.max_bytes or self.active == 0
+
+    def acquire(self, nbytes, timeout=None):
+        """Reserve nbytes, waiting up to timeout seconds (None waits indefinitely)"""
+        nbytes = min(nbytes, self.max_bytes)
+        with self._condition:
+            if not self._queue and self._fits(nbytes):
+                self._grant(nbytes)
+                return nbytes
+
+            if timeout is not None and len(self._queue) >= self.max_queue:
+                self.rejected += 1
+                raise AdmissionRejected("Server is busy", retry_after=self._retry_after())
+
+            ticket = object()
+            self._queue.append(ticket)
+            self.waited += 1
+            self.peak_queue_depth = max(self.peak_queue_depth, len(self._queue))
+            start = time.monotonic()
+            deadline = start + timeout if timeout is not None else None
+            try:
+                while self._queue[0] is not ticket or not self._fits(nbytes):
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if remaining is not None and remaining <= 0:
+                        self.timed_out += 1
+                        raise AdmissionRejected("Timed out waiting for memory", retry_after=self._retry_after())
+                    self._condition.wait(remaining)
+                self._grant(nbytes)
+                return nbytes
+            finally:
+                self._queue.remove(ticket)
+                self.wait_seconds += time.monotonic() - start
+                # The next ticket in line may fit now that this one left the queue
+                self._condition.notify_all()
+
+    def _grant(self, nbytes):
+        self.in_use += nbytes
+        self.active += 1
+        self.admitted += 1
+
+    def release(self, nbytes):
+        with self._condition:
+            self.in_use -= nbytes
+            self.active -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self, nbytes, timeout='default'):
+        """Hold nbytes of the budget for the duration of a with-block"""
+        if timeout == 'default':
+            timeout = self.timeout
+        granted = self.acquire(nbytes, timeout)
+        try:
+            yield
+        finally:
+            self.release(granted)
+
+    def _retry_after(self):
+        # Rough guess: one queueing deadline for the current queue to drain
+        return max(1, math.ceil(self.timeout))
+
+    def stats(self):
+        with self._condition:
+            return {
+                'max_bytes': self.max_bytes,
+                'in_use_bytes': self.in_use,
+                'active': self.active,
+                'queue_depth': len(self._queue),
+                'peak_queue_depth': self.peak_queue_depth,
+                'admitted': self.admitted,
+                'waited': self.waited,
+                'rejected': self.rejected,
+                'timed_out': self.timed_out,
+                'wait_seconds_total': round(self.wait_seconds, 4)
+            }
+
+
+def estimate_image_bytes(path, max_dimension=None, renders=1):
+    """Estimate the peak memory of decoding an image and rendering `renders` effects from it.
+
+    Only the header is read. JPEGs are decoded in draft mode at a reduced
+    scale, other formats at full size before being shrunk to max_dimension.
+    """
+    # Imported here so the app can catch AdmissionRejected without loading numpy
+    from animation import MAX_STACK_BYTES
+
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+            frames = getattr(image, 'n_frames', 1)
+            format = image.format
+            bands = max(len(image.getbands()), 3)
+    except Exception:
+        return os.path.getsize(path) * UNKNOWN_EXPANSION
+
+    work_width, work_height = width, height
+    if max_dimension and max(width, height) > max_dimension:
+        ratio = max_dimension / max(width, height)
+        work_width, work_height = int(width * ratio), int(height * ratio)
+
+    scale = 1
+    if format == 'JPEG' and max_dimension:
+        while scale < 8 and max(width, height) / (scale * 2) >= max_dimension:
+            scale *= 2
+    decode_bytes = (width // scale) * (height // scale) * bands
+
+    work_bytes = work_width * work_height * 3
+    if frames > 1:
+        # Animations hold every frame (capped by load_frames), but decode one full-size frame at a time
+        work_bytes = min(work_bytes * frames, MAX_STACK_BYTES)
+
+    return decode_bytes + work_bytes * (1 + RENDER_COPIES * min(renders, MAX_PARALLEL_RENDERS))
+
+
+def _mp3_pcm_format(path):
+    """Decoded PCM format of an MP3 from its first frame header (and Xing/Info header if present)"""
+    file_size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        offset = 0
+        head = f.read(10)
+        if head[:3] == b'ID3' and len(head) == 10:
+            # ID3v2 sizes are 4 bytes of 7 significant bits each
+            offset = 10 + ((head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9])
+            if head[5] & 0x10:
+                offset += 10
+        f.seek(offset)
+        data = f.read(64 * 1024)
+
+    for i in range(len(data) - 4):
+        if data[i] != 0xFF or data[i + 1] & 0xE0 != 0xE0:
+            continue
+        version = (data[i + 1] >> 3) & 3
+        layer = (data[i + 1] >> 1) & 3
+        bitrate_index = data[i + 2] >> 4
+        rate_index = (data[i + 2] >> 2) & 3
+        if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            continue
+
+        sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+        bitrate = MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+        channels = 1 if data[i + 3] >> 6 == 3 else 2
+        samples_per_frame = 1152 if version == 3 else 576
+
+        # A Xing/Info header after the side information gives the exact frame count of VBR files
+        side_info = (32 if channels == 2 else 17) if version == 3 else (17 if channels == 2 else 9)
+        tag = data[i + 4 + side_info:i + 4 + side_info + 12]
+        if tag[:4] in (b'Xing', b'Info') and struct.unpack('>I', tag[4:8])[0] & 1:
+            frame_count = struct.unpack('>I', tag[8:12])[0]
+            duration = frame_count * samples_per_frame / sample_rate
+        else:
+            duration = (file_size - offset - i) * 8 / bitrate
+
+        # ffmpeg hands pydub 16-bit samples
+        return int(duration * sample_rate), sample_rate, channels, 2
+
+    return None
+
+
+def audio_pcm_format(path):
+    """(frames, frame_rate, channels, sample_width) of an audio file's decoded PCM, from its header where possible.
+
+    Without a usable header the size is guessed from the file size, as 16-bit
+    stereo at UNKNOWN_FRAME_RATE.
+    """
+    pcm_format = None
+    try:
+        if path.lower().endswith('.wav'):
+            with wave.open(path, 'rb') as wav:
+                # pydub widens 24-bit samples to 32 bits
+                sample_width = 4 if wav.getsampwidth() == 3 else wav.getsampwidth()
+                pcm_format = wav.getnframes(), wav.getframerate(), wav.getnchannels(), sample_width
+        elif path.lower().endswith('.mp3'):
+            pcm_format = _mp3_pcm_format(path)
+        guess_bytes = os.path.getsize(path) * UNKNOWN_EXPANSION
+    except (wave.Error, EOFError, OSError):
+        # e.g. float WAVs, which the wave module cannot parse
+        guess_bytes = os.path.getsize(path) * 2
+    return pcm_format or (guess_bytes // 4, UNKNOWN_FRAME_RATE, 2, 2)
+
+
+def audio_pcm_bytes(path):
+    """Decoded PCM size of an audio file, from its header where possible"""
+    frames, _, channels, sample_width = audio_pcm_format(path)
+    return frames * channels * sample_width
+
+
+def estimate_audio_bytes(path, stream_threshold=None):
+    """Estimate the peak memory of loading and processing an audio file.
+
+    Files whose decoded PCM is over stream_threshold are streamed by
+    AudioProcessor.process_audio and cost a flat AUDIO_STREAM_BYTES.
+    """
+    pcm_bytes = audio_pcm_bytes(path)
+    if stream_threshold is not None and pcm_bytes > stream_threshold:
+        return AUDIO_STREAM_BYTES
+    return pcm_bytes * AUDIO_WORKING_COPIES
+
+
+def estimate_mix_bytes(layers):
+    """Estimate the peak memory of layering (path, effects) pairs of audio files.
+
+    Every layer is decoded with its working copies, and audio_mixer.mix
+    adds them into a float32 accumulator that lasts until the end of the
+    layer that ends last, offset, speed and loop included, then converts it
+    to output PCM of the same length.
+    """
+    tracks = []
+    decoded_bytes = 0
+    for path, effects in layers:
+        frames, frame_rate, channels, sample_width = audio_pcm_format(path)
+        decoded_bytes += frames * channels * sample_width * AUDIO_WORKING_COPIES
+        speed = effects.get('speed', 1.0)
+        if speed != 1.0:
+            frame_rate = max(int(frame_rate * speed), 1)
+        tracks.append((frames * max(effects.get('loop', 1), 1), frame_rate, channels, sample_width,
+                       max(effects.get('offset', 0), 0)))
+    if not tracks:
+        return 0
+
+    mix_rate = max(track[1] for track in tracks)
+    mix_channels = max(track[2] for track in tracks)
+    mix_width = max(track[3] for track in tracks)
+    mix_frames = max(int(offset_ms * mix_rate / 1000.0) + int(frames * mix_rate / frame_rate)
+                     for frames, frame_rate, _, _, offset_ms in tracks)
+    return decoded_bytes + mix_frames * mix_channels * (MIX_SAMPLE_BYTES + mix_width)
@@ -0,0 +1,141 @@
+import io
+import os
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image, ImageSequence
+
+
+# File extension and mimetype used when re-encoding each animated format
+ANIMATED_FORMATS = {
+    'GIF': ('gif', 'image/gif'),
+    'WEBP': ('webp', 'image/webp'),
+    'PNG': ('png', 'image/apng')
+}
+
+# Upper bound on the decoded frame stack; larger animations are scaled down further
+MAX_STACK_BYTES = 192 * 1024 * 1024
+
+# cv2 handles at most 512 channels, so spatial effects see up to 170 RGB frames per call
+MAX_FRAMES_PER_CALL = 512 // 3
+
+GIF_PALETTE_SAMPLE_FRAMES = 8
+
+
+class FrameStack:
+    """All frames of an animation as one (frames, height, width, 3) BGR array plus timing"""
+
+    def __init__(self, frames, durations, loop, format):
+        self.frames = frames
+        self.durations = durations
+        self.loop = loop
+        self.format = format
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    def setflags(self, **flags):
+        self.frames.setflags(**flags)
+
+    @property
+    def extension(self):
+        return ANIMATED_FORMATS[self.format][0]
+
+    @property
+    def mimetype(self):
+        return ANIMATED_FORMATS[self.format][1]
+
+
+@lru_cache(maxsize=1024)
+def _animated_format(path, mtime_ns):
+    with Image.open(path) as image:
+        if image.format in ANIMATED_FORMATS and getattr(image, 'n_frames', 1) > 1:
+            return image.format
+    return None
+
+
+def animated_format(path):
+    """Return 'GIF', 'WEBP' or 'PNG' for multi-frame images, None for still images"""
+    try:
+        return _animated_format(os.path.abspath(path), os.stat(path).st_mtime_ns)
+    except Exception:
+        return None
+
+
+def load_frames(path, max_dimension=None):
+    """Decode every frame of an animation into a single BGR FrameStack"""
+    with Image.open(path) as image:
+        frame_count = image.n_frames
+        width, height = image.size
+
+        scale = 1.0
+        if max_dimension and max(width, height) > max_dimension:
+            scale = max_dimension / max(width, height)
+        stack_bytes = frame_count * width * height * 3 * scale * scale
+        if stack_bytes > MAX_STACK_BYTES:
+            scale *= (MAX_STACK_BYTES / stack_bytes) ** 0.5
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+
+        frames = np.empty((frame_count, size[1], size[0], 3), dtype=np.uint8)
+        durations = []
+        for index, frame in enumerate(ImageSequence.Iterator(image)):
+            rgb = frame.convert('RGB')
+            if rgb.size != size:
+                rgb = rgb.resize(size, Image.Resampling.LANCZOS)
+            # RGB to BGR by reversing the channel axis while copying into the stack
+            frames[index] = np.asarray(rgb)[..., ::-1]
+            durations.append(frame.info.get('duration', image.info.get('duration', 100)))
+
+        return FrameStack(frames, durations, image.info.get('loop'), image.format)
+
+
+def apply_stacked(func, frames, pixelwise):
+    """Apply a single-image effect to a whole (N, H, W, 3) stack in as few calls as possible.
+
+    Per-pixel effects see the stack as one tall image. Spatial effects
+    (blur, resize) see it as one image whose channels are the frames'
+    channels side by side, so neighbouring frames never bleed into each other.
+    """
+    count, height, width, channels = frames.shape
+    if pixelwise:
+        tall = np.ascontiguousarray(frames).reshape(count * height, width, channels)
+        return func(tall).reshape(count, height, width, channels)
+
+    result = np.empty_like(frames)
+    for start in range(0, count, MAX_FRAMES_PER_CALL):
+        chunk = frames[start:start + MAX_FRAMES_PER_CALL]
+        n = len(chunk)
+        wide = np.ascontiguousarray(chunk.transpose(1, 2, 0, 3)).reshape(height, width, n * channels)
+        processed = func(wide)
+        result[start:start + n] = processed.reshape(height, width, n, channels).transpose(2, 0, 1, 3)
+    return result
+
+
+def _gif_palette(rgb_frames):
+    """Build one adaptive palette from a sample of frames, shared by every frame"""
+    picks = np.linspace(0, len(rgb_frames) - 1, min(len(rgb_frames), GIF_PALETTE_SAMPLE_FRAMES)).astype(int)
+    sample = np.concatenate([rgb_frames[i, ::2, ::2] for i in picks], axis=0)
+    return Image.fromarray(np.ascontiguousarray(sample)).quantize(256, method=Image.Quantize.MEDIANCUT)
+
+
+def encode_frames(frames, stack, quality=85):
+    """Encode a processed BGR frame stack in the source animation's format"""
+    rgb_frames = frames[..., ::-1]
+    save_kwargs = {'save_all': True, 'duration': stack.durations}
+    if stack.loop is not None:
+        save_kwargs['loop'] = stack.loop
+
+    if stack.format == 'GIF':
+        palette = _gif_palette(rgb_frames)
+        images = [Image.fromarray(np.ascontiguousarray(frame)).quantize(palette=palette, dither=Image.Dither.NONE)
+                  for frame in rgb_frames]
+        save_kwargs.update(optimize=False, disposal=1)
+    else:
+        images = [Image.fromarray(np.ascontiguousarray(frame)) for frame in rgb_frames]
+        if stack.format == 'WEBP':
+            save_kwargs['quality'] = quality
+
+    buffer = io.BytesIO()
+    images[0].save(buffer, format=stack.format, append_images=images[1:], **save_kwargs)
+    return buffer.getvalue()
@@ -1,549 +1,178 @@
-import uuid
-import pygame
-from flask import Flask, render_template, request, jsonify, send_file, url_for, redirect
-from pydub import AudioSegment
-from drawing_tool import DrawingTool
 import os
-from datetime import datetime
-import base64
-from generative import turtle_art_image, pygame_art_image
-from visualization import DataVisualization
-from image_effects import ImageEffects
-from io import BytesIO
-from PIL import Image
-import traceback
-from werkzeug.utils import secure_filename
-import imghdr
-from audio_processor import AudioProcessor
-# from generate_descriptions import MLProcessor
-# import torchvision.transforms as transforms
-# from style_transfer import StyleTransfer
-
-
-app = Flask(__name__)
-
-
-app.config['ARTWORK_FOLDER'] = os.path.join(app.root_path, 'static', 'gallery', 'artworks')
-app.config['VISUALIZATION_FOLDER'] = os.path.join(app.root_path, 'static', 'gallery', 'visualizations')
-
-os.makedirs(app.config['ARTWORK_FOLDER'], exist_ok=True)
-os.makedirs(app.config['VISUALIZATION_FOLDER'], exist_ok=True)
-
-app.config['DEFAULT_IMAGE'] = os.path.join(app.root_path, 'static', 'default.jpg')
-
-@app.route('/')
-def welcome():
-    return render_template('welcome.html')
-
-@app.route('/home')
-def home():
-    return render_template('index.html')
-
-@app.route('/draw')
-def draw():
-    drawing_tool = DrawingTool()
-    image_data = drawing_tool.run_tool()
-
-    if image_data is None:
-        return render_template('index.html')
-
-    if ',' in image_data:
-        image_data = image_data.split(',')[1]
-
-    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f'drawing_{timestamp}.png'
-    filepath = os.path.join(app.config['ARTWORK_FOLDER'], filename)
-
-    with open(filepath, 'wb') as f:
-        f.write(base64.b64decode(image_data))
-
-    return redirect(url_for('gallery'))
-
-@app.route('/free-draw')
-def free_draw():
-    return render_template('free_draw.html')
-
-@app.route('/save-drawing', methods=['POST'])
-def save_drawing():
-    try:
-        image_data = request.form.get('image')
-        if not image_data:
-            return "No image data received", 400
-
-        if ',' in image_data:
-            image_data = image_data.split(',')[1]
-
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'drawing_{timestamp}.png'
-        filepath = os.path.join(app.config['ARTWORK_FOLDER'], filename)
-
-        with open(filepath, 'wb') as f:
-            f.write(base64.b64decode(image_data))
-
-        return redirect(url_for('gallery'))
-    except Exception as e:
-        return f"Error saving drawing: {str(e)}", 500
-
-@app.route('/gallery')
-def gallery():
-    try:
-        # Ensure artwork folder exists
-        if not os.path.exists(app.config['ARTWORK_FOLDER']):
-            os.makedirs(app.config['ARTWORK_FOLDER'])
-
-        # Get all image files (both PNG and JPG)
-        artwork_files = []
-        if os.path.exists(app.config['ARTWORK_FOLDER']):
-            artwork_files = [f for f in os.listdir(app.config['ARTWORK_FOLDER'])
-                             if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-
-            # Sort by modification time (newest first)
-            artwork_files.sort(key=lambda x: os.path.getmtime(
-                os.path.join(app.config['ARTWORK_FOLDER'], x)), reverse=True)
-
-        return render_template('gallery.html', artworks=artwork_files)
-    except Exception as e:
-        print(f"Error in gallery route: {str(e)}")
-        return f"Error loading gallery: {str(e)}", 500
-
-@app.route('/generate_turtle_art')
-def generate_turtle_art():
-    try:
-        print("Calling turtle_art_image()...")
-        turtle_art_image(app.config['ARTWORK_FOLDER'])
-        print("Turtle Art Generated! Redirecting to gallery...")
-        return redirect(url_for('gallery'))
-    except Exception as e:
-        print(f"Error in /generate_turtle_art: {e}")
-        return f"Error: {e}", 500
-
-@app.route('/generate_pygame_art')
-def generate_pygame_art():
-    try:
-        print("Calling pygame_art_image()...")
-        pygame_art_image(app.config['ARTWORK_FOLDER'])
-        print("Pygame Art Generated! Redirecting to gallery...")
-        return redirect(url_for('gallery'))
-    except Exception as e:
-        print(f"Error in /generate_pygame_art: {e}")
-        return f"Error: {e}", 500
-
-@app.route('/delete_artwork/<artwork>', methods=['POST'])
-def delete_artwork(artwork):
-    """Delete an artwork file from the gallery"""
-    try:
-        if artwork.lower().endswith(('.png', '.jpg', '.jpeg')):
-            filepath = os.path.join(app.config['ARTWORK_FOLDER'], artwork)
-            if os.path.exists(filepath):
-                os.remove(filepath)
-                print(f"Successfully deleted {filepath}")
-                return redirect(url_for('gallery'))
-            else:
-                print(f"File not found: {filepath}")
-                return "File not found", 404
-        else:
-            return "Invalid file type", 400
-    except Exception as e:
-        print(f"Error deleting artwork: {str(e)}")
-        return f"Error deleting file: {str(e)}", 500
-
-@app.route('/visualization')
-def visualization():
-    """Display happiness data visualizations"""
-    dv = DataVisualization()
-    plots = dv.get_all_plots()
-    return render_template('visualization.html', plots=plots)
-
-
-app.config['ARTWORK_FOLDER'] = os.path.join('static', 'gallery', 'artworks')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
-
-
-def validate_image(stream):
-    """Validate if the file is a valid image"""
-    header = stream.read(512)
-    stream.seek(0)
-    format = imghdr.what(None, header)
-    if not format:
-        return None
-    return '.' + format if format != 'jpeg' else '.jpg'
-
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
-
-def allowed_file(filename):
-    return '.' in filename and \
-        filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
-
-@app.route('/effects', methods=['GET', 'POST'])
-def effects_page():
-    """Show the effects page with available images and handle uploads"""
-    message = None
-
-    if request.method == 'POST':
-        # Check if a file was uploaded
-        if 'file' not in request.files:
-            message = "No file selected"
-            return redirect(request.url)
-
-        file = request.files['file']
-
-        if file.filename == '':
-            message = "No file selected"
-            return redirect(request.url)
-
-        if file and allowed_file(file.filename):
-            # Secure the filename
-            filename = secure_filename(file.filename)
-            # Add timestamp to filename to make it unique
-            filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
-            filepath = os.path.join(app.config['ARTWORK_FOLDER'], filename)
-
-            try:
-                # Validate and save the image
-                file_ext = validate_image(file.stream)
-                if not file_ext:
-                    message = "Invalid image file"
-                    return redirect(request.url)
-
-                file.save(filepath)
-                # Redirect to effects selection page for this image
-                return redirect(url_for('image_effects', image_name=filename))
-            except Exception as e:
-                message = f"Error saving file: {str(e)}"
-                return redirect(request.url)
-        else:
-            message = "Invalid file type. Allowed types: PNG, JPG, JPEG, GIF"
-            return redirect(request.url)
-
-    # Get list of available images
-    artwork_files = []
-    if os.path.exists(app.config['ARTWORK_FOLDER']):
-        artwork_files = [f for f in os.listdir(app.config['ARTWORK_FOLDER'])
-                         if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]
-
-    # Get available effects list
-    effects_processor = ImageEffects()
-    effects_list = {
-        name: {
-            'title': name.capitalize(),
-            'description': effect_data['description']
-        }
-        for name, effect_data in effects_processor.effects.items()
+import sys
+from functools import partial
+
+from flask import Flask
+
+import metrics
+import request_metrics
+from admission import AdmissionRejected
+from jobs import QUEUED
+from services import Services
+import audio_routes
+import draw_routes
+import effects_routes
+import gallery_routes
+import ml_routes
+import system_routes
+import visualization_routes
+
+
+BLUEPRINTS = (gallery_routes, draw_routes, effects_routes, audio_routes, visualization_routes, ml_routes,
+              system_routes)
+
+
+def default_config(root_path):
+    static_folder = os.path.join(root_path, 'static')
+    return {
+        'ARTWORK_FOLDER': os.path.join(static_folder, 'gallery', 'artworks'),
+        'VISUALIZATION_FOLDER': os.path.join(static_folder, 'gallery', 'visualizations'),
+        'AUDIO_FOLDER': os.path.join(static_folder, 'audio'),
+        'DEFAULT_IMAGE': os.path.join(static_folder, 'default.jpg'),
+        'THUMBNAIL_FOLDER': os.path.join(static_folder, 'gallery', 'thumbnails'),
+        # Blobs must live on the same filesystem as ARTWORK_FOLDER so aliases can be hard links,
+        # but outside the static folder, which would serve them and their alias records
+        'BLOB_FOLDER': os.path.join(root_path, 'cache', 'blobs'),
+        'RENDER_CACHE_FOLDER': os.path.join(root_path, 'cache', 'renders'),
+        # Decoded audio, memory-mapped by later jobs instead of decoding the source again
+        'PCM_CACHE_FOLDER': os.path.join(root_path, 'cache', 'pcm'),
+        'PCM_CACHE_MAX_BYTES': 2 * 1024 * 1024 * 1024,
+        'ARTWORK_INDEX': os.path.join(root_path, 'cache', 'artworks.sqlite3'),
+        'JOB_DATABASE': os.path.join(root_path, 'cache', 'jobs.sqlite3'),
+        'MAX_CONTENT_LENGTH': 16 * 1024 * 1024,  # 16MB max file size
+        # Decode-heavy work is admitted against this budget; requests wait up to
+        # ADMISSION_TIMEOUT seconds in a queue of ADMISSION_QUEUE_SIZE, then get a 503
+        'MEMORY_BUDGET_BYTES': 1024 * 1024 * 1024,
+        'ADMISSION_QUEUE_SIZE': 16,
+        'ADMISSION_TIMEOUT': 10.0,
+        # Audio that decodes to more than this many bytes is processed from disk a block
+        # at a time instead of being loaded whole; None loads every file
+        'AUDIO_STREAM_THRESHOLD': 64 * 1024 * 1024,
+        # Opt-in: requests slower than this many seconds get a sampled stack profile in PROFILE_FOLDER
+        'SLOW_REQUEST_SECONDS': float(os.environ.get('SLOW_REQUEST_SECONDS', 0)) or None,
+        'PROFILE_FOLDER': os.path.join(root_path, 'cache', 'profiles'),
+        # Subsystems are built on first use; turn off to build them all in create_app,
+        # e.g. before a pre-forking server copies the process
+        'LAZY_SUBSYSTEMS': os.environ.get('LAZY_SUBSYSTEMS', '1') != '0',
+        # The ML features need PyTorch, which is not installed by default
+        'ENABLE_DESCRIPTIONS': False,
+        'ENABLE_STYLE_TRANSFER': False
     }
 
-    return render_template('effects_select.html',
-                           images=artwork_files,
-                           effects=effects_list,
-                           message=message)
 
-@app.route('/effects/<image_name>', methods=['GET', 'POST'])
-def image_effects(image_name):
-    """Apply effects to a specific image"""
-    try:
-        image_path = os.path.join(app.config['ARTWORK_FOLDER'], image_name)
-        print(f"Processing image: {image_path}")
-
-        if not os.path.exists(image_path):
-            print(f"Image not found: {image_path}")
-            return "Image not found", 404
-
-        effects_processor = ImageEffects()
-
-        if request.method == 'POST':
-            # Get selected effects from form
-            selected_effects = request.form.getlist('effects')
-            if not selected_effects:
-                selected_effects = ['original']
-
-            all_effects = effects_processor.process_image(image_path, selected_effects)
-        else:
-            # On GET request, just show original image and effects selection
-            all_effects = effects_processor.process_image(image_path, ['original'])
-
-        if not all_effects:
-            return "Error processing image effects", 500
-
-        # Get list of available effects for the form
-        available_effects = {
-            name: {
-                'title': name.capitalize(),
-                'description': effect_data['description']
-            }
-            for name, effect_data in effects_processor.effects.items()
-        }
-
-        return render_template('effects.html',
-                               effects=all_effects,
-                               available_effects=available_effects,
-                               original_image=image_name)
-
-    except Exception as e:
-        print(f"Error in image_effects: {str(e)}")
-        traceback.print_exc()
-        return f"Error processing image: {str(e)}", 500
-
-@app.route('/save_effect/<image_name>', methods=['POST'])
-def save_effect(image_name):
-    """Save a processed effect as a new image in the gallery"""
-    try:
-        # Get the base64 image and effect name from the form
-        base64_image = request.form.get('image_data')
-        effect_name = request.form.get('effect_name')
-
-        if not base64_image or not effect_name:
-            print("Missing data - Image data or effect name not provided")
-            return jsonify({
-                'success': False,
-                'message': "Missing image data or effect name"
-            }), 400
-
-        # Ensure ARTWORK_FOLDER exists
-        if not os.path.exists(app.config['ARTWORK_FOLDER']):
-            os.makedirs(app.config['ARTWORK_FOLDER'])
-            print(f"Created artwork folder: {app.config['ARTWORK_FOLDER']}")
-
-        # Extract the base64 data after the comma
-        try:
-            base64_data = base64_image.split(',')[1]
-        except IndexError:
-            base64_data = base64_image
-
-        effects_processor = ImageEffects()
-        new_filename, image = effects_processor.save_processed_image(
-            base64_data,
-            image_name,
-            effect_name
-        )
-
-        if not new_filename or not image:
-            print("Failed to process image - new_filename or image is None")
-            return jsonify({
-                'success': False,
-                'message': 'Failed to process image'
-            }), 500
-
-        # Save the new image with full path
-        save_path = os.path.join(app.config['ARTWORK_FOLDER'], new_filename)
-        print(f"Attempting to save image to: {save_path}")
-
-        try:
-            image.save(save_path, 'JPEG', quality=85, optimize=True)
-            print(f"Successfully saved image to: {save_path}")
-
-            # Verify file exists after saving
-            if os.path.exists(save_path):
-                print(f"Verified file exists at: {save_path}")
-                return jsonify({
-                    'success': True,
-                    'message': 'Image saved successfully',
-                    'filename': new_filename
-                })
-            else:
-                print(f"File not found after saving: {save_path}")
-                return jsonify({
-                    'success': False,
-                    'message': 'File not found after saving'
-                }), 500
-
-        except Exception as save_error:
-            print(f"Error saving file to disk: {str(save_error)}")
-            return jsonify({
-                'success': False,
-                'message': f"Error saving file: {str(save_error)}"
-            }), 500
-
-    except Exception as e:
-        print(f"Error in save_effect route: {str(e)}")
-        return jsonify({
-            'success': False,
-            'message': f"Error saving image: {str(e)}"
-        }), 500
-
-app.config['AUDIO_FOLDER'] = os.path.join(app.root_path, 'static', 'audio')
-audio_processor = AudioProcessor(app.config['AUDIO_FOLDER'])
-
-@app.route('/audio')
-def audio_page():
-    audio_files = audio_processor.get_audio_files()
-    return render_template('audio.html', audio_files=audio_files)
-
-@app.route('/process_audio', methods=['POST'])
-def process_audio():
-    if 'file' not in request.files:
-        return redirect(request.url)
+def create_app(config=None):
+    """Build the app: configuration, blueprints, background job handlers and metrics.
 
-    file = request.files['file']
-    if file.filename == '' or not file:
-        return redirect(request.url)
+    Nothing heavy is imported here. Each subsystem (effects, audio,
+    visualization, ML) imports its libraries and builds its state the first
+    time one of its routes or jobs needs it; see Services.
+    """
+    app = Flask(__name__)
+    app.config.update(default_config(app.root_path))
+    app.config.update(config or {})
 
-    if audio_processor.allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        filepath = os.path.join(app.config['AUDIO_FOLDER'], filename)
-        file.save(filepath)
+    os.makedirs(app.config['ARTWORK_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['VISUALIZATION_FOLDER'], exist_ok=True)
+    move_legacy_blob_folder(os.path.join(app.static_folder, 'gallery', 'blobs'), app.config['BLOB_FOLDER'])
 
-        effects = {
-            'speed': float(request.form.get('speed', 1.0)),
-            'fade_in': int(request.form.get('fade_in', 0)),
-            'fade_out': int(request.form.get('fade_out', 0)),
-            'volume': float(request.form.get('volume', 0)),
-            'reverse': request.form.get('reverse') == 'on',
-            'loop': int(request.form.get('loop', 1)),
-            'trim_start': int(request.form.get('trim_start', 0)),
-            'trim_end': int(request.form.get('trim_end', 0))
-        }
+    services = Services(app)
+    app.extensions['services'] = services
 
-        preview_filename, _ = audio_processor.process_audio(
-            filepath,
-            effects=effects,
-            save_as_preview=True
-        )
+    for module in BLUEPRINTS:
+        app.register_blueprint(module.bp)
 
-    return redirect(url_for('audio_page'))
+    @app.errorhandler(AdmissionRejected)
+    def admission_rejected(e):
+        """Shed load instead of running out of memory; clients should retry after the given delay"""
+        return system_routes.overloaded_response(e)
 
-@app.route('/layer_audio', methods=['POST'])
-def layer_audio():
-    file_ids = request.form.getlist('audio_files')
-    effects_list = []
+    # Background jobs: routes queue work here and answer straight away.
+    # Concurrency caps per job type: pydub holds whole files in memory, so audio runs one at a time
+    job_queue = services.job_queue
+    job_queue.register('generate', partial(draw_routes.run_generate_job, services), max_concurrency=2)
+    job_queue.register('process_audio', partial(audio_routes.run_process_audio_job, services), max_concurrency=1)
+    job_queue.register('layer_audio', partial(audio_routes.run_layer_audio_job, services), max_concurrency=1)
+    job_queue.register('style_transfer', partial(ml_routes.run_style_transfer_job, services), max_concurrency=1)
 
-    for i in range(len(file_ids)):
-        if file_ids[i]:  # Only add effects for selected files
-            effects = {
-                'volume': float(request.form.get(f'volume_{i}', 0)),
-                'speed': float(request.form.get(f'speed_{i}', 1.0)),
-                'loop': int(request.form.get(f'loop_{i}', 1))
-            }
-            effects_list.append(effects)
+    # Resume jobs queued before the last restart
+    if job_queue.stats()[QUEUED]:
+        job_queue.start()
 
-    output_filename = audio_processor.layer_audio(file_ids, effects_list)
-    return redirect(url_for('audio_page'))
+    profiler = None
+    if app.config['SLOW_REQUEST_SECONDS']:
+        profiler = request_metrics.SlowRequestProfiler(app.config['SLOW_REQUEST_SECONDS'],
+                                                       app.config['PROFILE_FOLDER'])
+    request_metrics.instrument_app(app, profiler=profiler)
+    metrics.REGISTRY.add_collector(partial(collect_app_metrics, services), name='app')
 
-@app.route('/save_modified/<filename>')
-def save_modified(filename):
-    preview_path = os.path.join(app.config['AUDIO_FOLDER'], 'previews', filename)
+    if not app.config['LAZY_SUBSYSTEMS']:
+        services.warm()
 
-    if os.path.exists(preview_path):
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        new_filename = f"modified_{timestamp}.wav"
-        new_path = os.path.join(app.config['AUDIO_FOLDER'], new_filename)
+    return app
 
-        audio = AudioSegment.from_wav(preview_path)
-        audio.export(new_path, format="wav")
 
-    return redirect(url_for('audio_page'))
-
-@app.route('/delete_audio/<path:filename>')
-def delete_audio(filename):
-    try:
-        if filename.startswith('layers/'):
-            filepath = os.path.join(app.config['AUDIO_FOLDER'], 'layers', os.path.basename(filename))
-        else:
-            filepath = os.path.join(app.config['AUDIO_FOLDER'], filename)
-
-        if os.path.exists(filepath):
-            os.remove(filepath)
-
-            # Delete associated previews
-            filename_without_ext = os.path.splitext(os.path.basename(filename))[0]
-            preview_folder = os.path.join(app.config['AUDIO_FOLDER'], 'previews')
-            for preview in os.listdir(preview_folder):
-                if preview.startswith(filename_without_ext + '_preview_'):
-                    os.remove(os.path.join(preview_folder, preview))
-    except Exception as e:
-        print(f"Error deleting file: {e}")
-
-    return redirect(url_for('audio_page'))
-
-# ml_processor = MLProcessor(app)
-
-@app.route('/generate_descriptions')
-def generate_descriptions_page():
-    """Display description generation page"""
-    artwork_files = []
-    if os.path.exists(app.config['ARTWORK_FOLDER']):
-        artwork_files = [f for f in os.listdir(app.config['ARTWORK_FOLDER'])
-                         if f.lower().endswith(('.png', '.jpg', '.jpeg'))]
-
-    return render_template('generate_descriptions.html', images=artwork_files)
-
-@app.route('/generate_description/<image_name>', methods=['POST'])
-def generate_description(image_name):
-    """Generate a description for an artwork"""
-    try:
-        image_path = os.path.join(app.config['ARTWORK_FOLDER'], image_name)
-        if not os.path.exists(image_path):
-            return jsonify({'error': 'Image not found'}), 404
-
-        description = ml_processor.generate_artwork_description(image_path)
-        return jsonify({'description': description})
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-app.config.update(dict(
-    ARTWORK_FOLDER=os.path.join(app.static_folder, 'gallery', 'artworks'),
-    MAX_CONTENT_LENGTH=16 * 1024 * 1024,  # 16MB max file size
-    ALLOWED_EXTENSIONS={'.png', '.jpg', '.jpeg'}
-))
-
-# Ensure upload folder exists
-os.makedirs(app.config['ARTWORK_FOLDER'], exist_ok=True)
-# Initialize style transfer instance
-# style_transfer_model = StyleTransfer()
-
-@app.route('/style_transfer')
-def style_transfer_page():
-    """Display style transfer page"""
-    try:
-        artwork_files = []
-        if os.path.exists(app.config['ARTWORK_FOLDER']):
-            artwork_files = [f for f in os.listdir(app.config['ARTWORK_FOLDER'])
-                             if os.path.splitext(f.lower())[1] in app.config['ALLOWED_EXTENSIONS']]
-
-        return render_template('style_transfer.html',
-                               images=sorted(artwork_files),
-                               max_file_size=app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024))
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-
-
-@app.route('/style_transfer', methods=['POST'])
-def apply_style_transfer():
-    """Apply style transfer to images"""
+def move_legacy_blob_folder(legacy_folder, blob_folder):
+    """Move blobs stored under the static folder to BLOB_FOLDER; a rename keeps every alias linked"""
+    if not os.path.isdir(legacy_folder) or os.path.exists(blob_folder):
+        return
     try:
-        # Validate request
-        if 'content_image' not in request.form or 'style_image' not in request.form:
-            return jsonify({'error': 'Missing required images'}), 400
-
-        content_image = secure_filename(request.form['content_image'])
-        style_image = secure_filename(request.form['style_image'])
-
-        content_path = os.path.join(app.config['ARTWORK_FOLDER'], content_image)
-        style_path = os.path.join(app.config['ARTWORK_FOLDER'], style_image)
-
-        # Validate files exist
-        if not os.path.exists(content_path):
-            return jsonify({'error': 'Content image not found'}), 404
-        if not os.path.exists(style_path):
-            return jsonify({'error': 'Style image not found'}), 404
-
-        # Create style transfer instance if not exists
-        return jsonify({
-    "error": "Style transfer is disabled in this version (PyTorch not installed)."
-}), 501
-        # Save result
-        output_filename = f"style_transfer_{uuid.uuid4().hex[:8]}.png"
-        output_path = os.path.join(app.config['ARTWORK_FOLDER'], output_filename)
-        result_img.save(output_path, 'PNG')
-
-        return jsonify({
-            'output_image': url_for('static',
-                                    filename=f'gallery/artworks/{output_filename}'),
-            'filename': output_filename,
-            'message': 'Style transfer complete!'
-        })
-
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        os.makedirs(os.path.dirname(blob_folder), exist_ok=True)
+        os.rename(legacy_folder, blob_folder)
+        print(f"Moved artwork blobs from {legacy_folder} to {blob_folder}")
+    except OSError as e:
+        print(f"Error moving artwork blobs from {legacy_folder} to {blob_folder}: {e}")
+
+
+def collect_app_metrics(services):
+    """Export the counters the caches, memory budget and job queue already keep.
+
+    Subsystems that have not been used yet are skipped rather than built.
+    """
+    memory_budget = services.loaded('memory_budget')
+    if memory_budget is not None:
+        admission = memory_budget.stats()
+        yield ('artgallery_admission_in_use_bytes', 'gauge', 'Bytes of the memory budget currently reserved',
+               [({}, admission['in_use_bytes'])])
+        yield ('artgallery_admission_max_bytes', 'gauge', 'Size of the memory budget',
+               [({}, admission['max_bytes'])])
+        yield ('artgallery_admission_queue_depth', 'gauge', 'Requests waiting for memory',
+               [({}, admission['queue_depth'])])
+        yield ('artgallery_admission_requests_total', 'counter', 'Admission decisions by outcome',
+               [({'outcome': outcome}, admission[outcome])
+                for outcome in ('admitted', 'waited', 'rejected', 'timed_out')])
+        yield ('artgallery_admission_wait_seconds_total', 'counter', 'Time spent waiting for memory',
+               [({}, admission['wait_seconds_total'])])
+
+    jobs = services.job_queue.stats()
+    running_by_type = jobs.pop('running_by_type')
+    yield ('artgallery_jobs', 'gauge', 'Jobs in the queue database by status',
+           [({'status': status}, count) for status, count in jobs.items()])
+    yield ('artgallery_jobs_running', 'gauge', 'Jobs running in this process by type',
+           [({'type': job_type}, count) for job_type, count in running_by_type.items()])
+
+    lookups = []
+    render_cache = services.loaded('render_cache')
+    if render_cache is not None:
+        renders = render_cache.stats()
+        lookups += [({'cache': 'renders', 'result': 'hit'}, renders['hits']),
+                    ({'cache': 'renders', 'result': 'miss'}, renders['misses'])]
+    pcm_cache = services.loaded('pcm_cache')
+    if pcm_cache is not None:
+        decoded_audio = pcm_cache.stats()
+        lookups += [({'cache': 'decoded_audio', 'result': 'hit'}, decoded_audio['hits']),
+                    ({'cache': 'decoded_audio', 'result': 'miss'}, decoded_audio['misses'])]
+        yield ('artgallery_pcm_cache_bytes', 'gauge', 'Bytes of decoded audio in the PCM cache',
+               [({}, decoded_audio['bytes'])])
+    image_effects = sys.modules.get('image_effects')
+    if image_effects is not None:
+        decoded = image_effects.decoded_image_cache.stats()
+        lookups += [({'cache': 'decoded_images', 'result': 'hit'}, decoded['hits']),
+                    ({'cache': 'decoded_images', 'result': 'miss'}, decoded['misses'])]
+        yield ('artgallery_decoded_image_cache_bytes', 'gauge', 'Bytes held by the decoded image cache',
+               [({}, decoded['bytes'])])
+    if lookups:
+        yield ('artgallery_cache_lookups_total', 'counter', 'Cache lookups by cache and result', lookups)
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,232 @@
+import base64
+import binascii
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+
+from PIL import Image
+
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.webp')
+
+ORIGINS = ('drawing', 'effect', 'generated', 'upload', 'unknown')
+
+# Used only for files that appeared on disk without going through the app
+ORIGIN_PATTERNS = (
+    (re.compile(r'^drawing_'), 'drawing'),
+    (re.compile(r'^(turtle_art|pygame_art|style_transfer)_'), 'generated'),
+    (re.compile(r'^\d{8}_\d{6}_'), 'upload')
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artworks (
+    filename TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    format TEXT,
+    size INTEGER NOT NULL,
+    sha256 TEXT,
+    origin TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artworks_by_mtime ON artworks (mtime_ns DESC, filename);
+CREATE INDEX IF NOT EXISTS artworks_by_origin ON artworks (origin, mtime_ns DESC);
+CREATE INDEX IF NOT EXISTS artworks_by_sha256 ON artworks (sha256);
+"""
+
+COLUMNS = ('filename', 'mtime_ns', 'width', 'height', 'format', 'size', 'sha256', 'origin')
+
+HASH_CHUNK_BYTES = 1024 * 1024
+
+
+def guess_origin(filename):
+    for pattern, origin in ORIGIN_PATTERNS:
+        if pattern.match(filename):
+            return origin
+    return 'unknown'
+
+
+def encode_cursor(key):
+    """Turn a (mtime_ns, filename) page key into an opaque URL-safe token"""
+    mtime_ns, filename = key
+    return base64.urlsafe_b64encode(f"{mtime_ns}:{filename}".encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for malformed tokens"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        mtime_ns, filename = raw.split(':', 1)
+        return int(mtime_ns), filename
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor}")
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ArtworkIndex:
+    """SQLite index of the artwork folder, so listing the gallery is one query.
+
+    Every row mirrors one file: its mtime, pixel size, image format, byte
+    size, content hash and where it came from. The app updates the index on
+    each write and delete; sync() reconciles it with the folder at startup
+    to pick up files changed behind the app's back.
+    """
+
+    def __init__(self, db_path, artwork_folder):
+        self.db_path = db_path
+        self.artwork_folder = artwork_folder
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def connection(self):
+        """Return this thread's connection; sqlite3 connections are not shared between threads"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            # WAL lets request threads read while another thread writes
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _describe(self, filename, origin, stat=None):
+        path = os.path.join(self.artwork_folder, filename)
+        if stat is None:
+            stat = os.stat(path)
+
+        width = height = format = None
+        try:
+            # Only the header is parsed; no pixels are decoded
+            with Image.open(path) as image:
+                width, height = image.size
+                format = image.format
+        except Exception as e:
+            print(f"Could not read image header of {filename}: {e}")
+
+        return (filename, stat.st_mtime_ns, width, height, format, stat.st_size,
+                file_sha256(path), origin or guess_origin(filename))
+
+    def _upsert(self, conn, row, keep_origin):
+        """Write a row; keep_origin='same_bytes' keeps the stored origin only if the file's hash is unchanged"""
+        if keep_origin:
+            # Overwriting a file keeps the origin it was first recorded with
+            existing = conn.execute('SELECT origin, sha256 FROM artworks WHERE filename = ?', (row[0],)).fetchone()
+            if existing is not None and (keep_origin != 'same_bytes' or existing['sha256'] == row[6]):
+                row = row[:-1] + (existing['origin'],)
+        conn.execute(f"INSERT OR REPLACE INTO artworks ({', '.join(COLUMNS)}) "
+                     f"VALUES ({', '.join('?' * len(COLUMNS))})", row)
+        return row
+
+    def record(self, filename, origin=None):
+        """Add or refresh one artwork after it has been written.
+
+        A name that already held these exact bytes, such as the existing
+        name a deduplicated save returns, keeps the origin it was first
+        recorded with rather than taking the caller's.
+        """
+        row = self._describe(filename, origin)
+        with self.connection() as conn:
+            row = self._upsert(conn, row, keep_origin=True if origin is None else 'same_bytes')
+        return dict(zip(COLUMNS, row))
+
+    def remove(self, filename):
+        with self.connection() as conn:
+            conn.execute('DELETE FROM artworks WHERE filename = ?', (filename,))
+
+    def get(self, filename):
+        row = self.connection().execute('SELECT * FROM artworks WHERE filename = ?', (filename,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def find_by_sha256(self, sha256):
+        """Return the names of every indexed artwork with these exact bytes"""
+        return [row['filename'] for row in self.connection().execute(
+            'SELECT filename FROM artworks WHERE sha256 = ? ORDER BY mtime_ns', (sha256,))]
+
+    @staticmethod
+    def _filters(formats, origin):
+        conditions = []
+        params = []
+        if formats:
+            conditions.append(f"format IN ({', '.join('?' * len(formats))})")
+            params.extend(formats)
+        if origin:
+            conditions.append('origin = ?')
+            params.append(origin)
+        return conditions, params
+
+    def list_filenames(self, formats=None, origin=None, order_by='mtime'):
+        """Return indexed filenames, newest first (or by name), optionally filtered by format and origin"""
+        query = 'SELECT filename FROM artworks'
+        conditions, params = self._filters(formats, origin)
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY filename' if order_by == 'filename' else ' ORDER BY mtime_ns DESC, filename'
+        return [row['filename'] for row in self.connection().execute(query, params)]
+
+    def page(self, limit, after=None, formats=None, origin=None):
+        """Return up to `limit` rows, newest first, starting after the (mtime_ns, filename) key `after`.
+
+        Keyset pagination: every page is one range scan of the mtime index,
+        however deep into the collection it starts. Returns the rows and the
+        key to pass as `after` for the next page (None on the last page).
+        """
+        query = 'SELECT * FROM artworks'
+        conditions, params = self._filters(formats, origin)
+        if after is not None:
+            mtime_ns, filename = after
+            conditions.append('(mtime_ns < ? OR (mtime_ns = ? AND filename > ?))')
+            params.extend((mtime_ns, mtime_ns, filename))
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        query += ' ORDER BY mtime_ns DESC, filename LIMIT ?'
+        # Fetch one extra row to know whether another page follows
+        params.append(limit + 1)
+
+        rows = [dict(row) for row in self.connection().execute(query, params)]
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, (rows[-1]['mtime_ns'], rows[-1]['filename'])
+
+    def sync(self):
+        """Reconcile the index with the folder: index new or changed files, drop deleted ones"""
+        indexed = {row['filename']: (row['mtime_ns'], row['size'])
+                   for row in self.connection().execute('SELECT filename, mtime_ns, size FROM artworks')}
+
+        changed = []
+        on_disk = set()
+        with os.scandir(self.artwork_folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                on_disk.add(entry.name)
+                stat = entry.stat()
+                if indexed.get(entry.name) != (stat.st_mtime_ns, stat.st_size):
+                    changed.append((entry.name, stat))
+
+        rows = []
+        for filename, stat in changed:
+            try:
+                rows.append(self._describe(filename, None, stat))
+            except OSError as e:
+                print(f"Error indexing {filename}: {e}")
+        removed = [(filename,) for filename in indexed.keys() - on_disk]
+
+        with self.connection() as conn:
+            for row in rows:
+                self._upsert(conn, row, keep_origin=True)
+            conn.executemany('DELETE FROM artworks WHERE filename = ?', removed)
+
+        return {'indexed': len(rows), 'removed': len(removed), 'total': len(on_disk)}
@@ -0,0 +1,275 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+
+from artwork_index import file_sha256
+
+
+# Uploads are copied in chunks of this size, so memory per upload stays constant
+STREAM_CHUNK_BYTES = 64 * 1024
+
+
+class ArtworkStore:
+    """Content-addressed storage for artworks, with human-readable names as aliases.
+
+    Every artwork's bytes are written once to blob_folder/<ab>/<sha256>.<ext>
+    with an atomic rename, and the gallery name in artwork_folder is a hard
+    link to that blob. Identical bytes therefore take disk space once, and
+    because aliases are created exclusively, two saves that pick the same
+    name in the same second get distinct names instead of overwriting each
+    other. Next to each blob, <sha256>.<ext>.alias records its gallery name;
+    it is created exclusively too, so concurrent saves of the same bytes,
+    in any process, agree on one name.
+    """
+
+    def __init__(self, artwork_folder, blob_folder, index=None):
+        self.artwork_folder = artwork_folder
+        self.blob_folder = blob_folder
+        self.index = index
+        os.makedirs(self.artwork_folder, exist_ok=True)
+        os.makedirs(self.blob_folder, exist_ok=True)
+
+    def blob_path(self, sha256, extension):
+        return os.path.join(self.blob_folder, sha256[:2], f"{sha256}{extension}")
+
+    @staticmethod
+    def alias_record_path(blob_path):
+        return f"{blob_path}.alias"
+
+    def temp_file(self):
+        """Open a temporary file on the blob filesystem, so committing it is a rename"""
+        fd, temp_path = tempfile.mkstemp(dir=self.blob_folder, suffix='.tmp')
+        return os.fdopen(fd, 'wb'), temp_path
+
+    def save_bytes(self, data, filename, overwrite=False):
+        """Store bytes under a gallery name and return the name actually used"""
+        f, temp_path = self.temp_file()
+        try:
+            with f:
+                f.write(data)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return self.save_file(temp_path, filename, overwrite=overwrite,
+                              sha256=hashlib.sha256(data).hexdigest())
+
+    def save_stream(self, stream, filename, validate=None, overwrite=False, chunk_size=STREAM_CHUNK_BYTES):
+        """Copy a file-like stream into the store chunk by chunk and return the gallery name used.
+
+        validate is called with the first chunk before anything is written to
+        disk and returns the file extension to use (e.g. '.png'), or None to
+        reject the upload with a ValueError. The content hash is computed
+        while copying, so the bytes are read exactly once.
+        """
+        first_chunk = stream.read(chunk_size)
+        if not first_chunk:
+            raise ValueError("Empty upload")
+        if validate is not None:
+            extension = validate(first_chunk)
+            if not extension:
+                raise ValueError("Invalid image file")
+            filename = os.path.splitext(filename)[0] + extension
+
+        digest = hashlib.sha256()
+        f, temp_path = self.temp_file()
+        try:
+            with f:
+                chunk = first_chunk
+                while chunk:
+                    digest.update(chunk)
+                    f.write(chunk)
+                    chunk = stream.read(chunk_size)
+        except Exception:
+            os.remove(temp_path)
+            raise
+        return self.save_file(temp_path, filename, overwrite=overwrite, sha256=digest.hexdigest())
+
+    def save_file(self, temp_path, filename, overwrite=False, sha256=None):
+        """Move a finished temporary file into the store and return the gallery name used.
+
+        If identical bytes are already in the gallery, their existing name is
+        returned and nothing new is written. Otherwise a new alias is linked:
+        with overwrite the name is atomically replaced, without it a numeric
+        suffix is added until the name is free.
+        """
+        try:
+            if sha256 is None:
+                sha256 = file_sha256(temp_path)
+            extension = os.path.splitext(filename)[1].lower()
+            blob_path = self.blob_path(sha256, extension)
+
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            if os.path.exists(blob_path):
+                os.remove(temp_path)
+            else:
+                # Concurrent writers of the same bytes all rename onto the same blob
+                os.replace(temp_path, blob_path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        existing = self.find_alias(sha256, blob_path)
+        if existing is not None:
+            return existing
+
+        if overwrite:
+            self._replace_alias(blob_path, filename)
+            self._record_alias(blob_path, filename)
+            return filename
+
+        alias = self._link_new_alias(blob_path, filename)
+        recorded = self._record_alias(blob_path, alias)
+        if recorded != alias:
+            # A concurrent save of the same bytes recorded its name first
+            os.remove(os.path.join(self.artwork_folder, alias))
+        return recorded
+
+    def find_alias(self, sha256, blob_path):
+        """Return the gallery name already holding these bytes, if any"""
+        alias = self._recorded_alias(blob_path)
+        if alias is not None:
+            return alias
+        if self.index is None:
+            return None
+        # Blobs stored before alias records existed are only known to the index
+        for filename in self.index.find_by_sha256(sha256):
+            if self._is_alias_of(filename, blob_path):
+                return self._record_alias(blob_path, filename)
+        return None
+
+    def _recorded_alias(self, blob_path):
+        """The name in a blob's alias record, if that name still holds the blob"""
+        try:
+            with open(self.alias_record_path(blob_path), 'r', encoding='utf-8') as f:
+                alias = f.read()
+        except OSError:
+            return None
+        return alias if alias and self._is_alias_of(alias, blob_path) else None
+
+    def _is_alias_of(self, filename, blob_path):
+        alias_path = os.path.join(self.artwork_folder, filename)
+        try:
+            if os.path.samefile(alias_path, blob_path):
+                return True
+            # Without hard links aliases are copies, recognisable only by their bytes
+            return (os.stat(blob_path).st_nlink <= 1
+                    and file_sha256(alias_path) == os.path.basename(os.path.splitext(blob_path)[0]))
+        except OSError:
+            return False
+
+    def _record_alias(self, blob_path, filename):
+        """Record filename as the gallery name of a blob, unless a live one is recorded already.
+
+        Returns the name recorded. The record is published complete, by
+        linking a finished temporary file into place, so the first of any
+        number of concurrent saves wins and the others read its name.
+        """
+        record_path = self.alias_record_path(blob_path)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(record_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(filename)
+            try:
+                os.link(temp_path, record_path)
+                return filename
+            except FileExistsError:
+                pass
+            except OSError as e:
+                if e.errno not in (errno.EPERM, errno.EXDEV, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                # No hard links on this filesystem: create the record exclusively instead
+                try:
+                    with open(record_path, 'x', encoding='utf-8') as f:
+                        f.write(filename)
+                    return filename
+                except FileExistsError:
+                    pass
+
+            recorded = self._recorded_alias(blob_path)
+            if recorded is not None:
+                return recorded
+            # The recorded name was deleted or now holds other bytes
+            os.replace(temp_path, record_path)
+            return filename
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def _forget_alias(self, blob_path, filename):
+        """Drop a blob's alias record if it names filename"""
+        record_path = self.alias_record_path(blob_path)
+        try:
+            with open(record_path, 'r', encoding='utf-8') as f:
+                if f.read() != filename:
+                    return
+            os.remove(record_path)
+        except OSError:
+            pass
+
+    def _link(self, blob_path, alias_path):
+        try:
+            os.link(blob_path, alias_path)
+        except FileExistsError:
+            raise
+        except OSError as e:
+            if e.errno not in (errno.EPERM, errno.EXDEV, errno.EMLINK, errno.ENOTSUP):
+                raise
+            # No hard links on this filesystem: fall back to an exclusive copy
+            with open(blob_path, 'rb') as src, open(alias_path, 'xb') as dst:
+                shutil.copyfileobj(src, dst)
+
+    def _link_new_alias(self, blob_path, filename):
+        stem, extension = os.path.splitext(filename)
+        counter = 0
+        while True:
+            candidate = filename if counter == 0 else f"{stem}_{counter}{extension}"
+            try:
+                self._link(blob_path, os.path.join(self.artwork_folder, candidate))
+                return candidate
+            except FileExistsError:
+                counter += 1
+
+    def _replace_alias(self, blob_path, filename):
+        alias_path = os.path.join(self.artwork_folder, filename)
+        while True:
+            temp_alias = os.path.join(self.artwork_folder, f".{filename}.{os.urandom(4).hex()}.tmp")
+            try:
+                self._link(blob_path, temp_alias)
+                break
+            except FileExistsError:
+                continue
+        previous_blob = self._blob_of(filename)
+        os.replace(temp_alias, alias_path)
+        if previous_blob is not None and previous_blob != blob_path:
+            self._forget_alias(previous_blob, filename)
+            self._release_blob(previous_blob)
+
+    def _blob_of(self, filename):
+        """Find the blob behind an existing alias from the index's recorded hash"""
+        if self.index is None:
+            return None
+        row = self.index.get(filename)
+        if row is None or not row['sha256']:
+            return None
+        return self.blob_path(row['sha256'], os.path.splitext(filename)[1].lower())
+
+    def _release_blob(self, blob_path):
+        # A blob whose only remaining link is itself is no longer in the gallery.
+        # With the copy fallback this drops the blob early, which only costs dedup.
+        try:
+            if os.stat(blob_path).st_nlink <= 1:
+                os.remove(blob_path)
+                os.remove(self.alias_record_path(blob_path))
+        except OSError:
+            pass
+
+    def delete(self, filename):
+        """Remove a gallery name, and its blob once no other name points to it"""
+        blob_path = self._blob_of(filename)
+        os.remove(os.path.join(self.artwork_folder, filename))
+        if blob_path is not None:
+            self._forget_alias(blob_path, filename)
+            self._release_blob(blob_path)
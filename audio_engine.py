@@ -0,0 +1,731 @@
+import os
+import struct
+import subprocess
+import tempfile
+import wave
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.exceptions import CouldntDecodeError, InvalidDuration, TooManyMissingFrames
+from pydub.utils import db_to_float
+
+
+# PCM sample type by sample width; pydub stores 8-bit audio signed and 24-bit audio as 32-bit
+PCM_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+# Gains are computed in double precision, and PCM is written, this many frames at a time
+BLOCK_FRAMES = 1 << 16
+
+
+class AudioBuffer:
+    """Decoded audio as a (frames, channels) PCM array, edited in place.
+
+    Each operation reproduces the pydub operation of the same name sample
+    for sample: positions are converted from milliseconds with pydub's
+    rounding (including its zero padding at the end of slices), and gains
+    are applied the way audioop.mul does, multiplying in double precision
+    and rounding down. The difference is in how the data is handled:
+    trims and reverse are views, gains and fades scale the array in place
+    a block at a time, and a loop is only expanded while the output is
+    written.
+
+    Since audioop rounds to PCM after every operation, keeping the samples
+    in a float array would change nothing but the memory use; they stay
+    integers, and the decoded data is copied once, by the first operation
+    that writes to it. Operations return the buffer they were called on.
+    """
+
+    def __init__(self, samples, frame_rate, sample_width, repeat=1):
+        self.samples = samples
+        self.frame_rate = frame_rate
+        self.sample_width = sample_width
+        self.repeat = repeat
+        bits = 8 * sample_width
+        self.min_value = -(1 << (bits - 1))
+        self.max_value = (1 << (bits - 1)) - 1
+
+    @classmethod
+    def from_pcm(cls, data, frame_rate, sample_width, channels):
+        """Wrap interleaved PCM bytes without copying them; a writable buffer is edited in place.
+
+        A partial frame at the end, as in a truncated file, is dropped.
+        """
+        samples = np.frombuffer(data, dtype=PCM_DTYPES[sample_width])
+        samples = samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+        return cls(samples, frame_rate, sample_width)
+
+    @classmethod
+    def from_segment(cls, segment):
+        return cls.from_pcm(segment.raw_data, segment.frame_rate, segment.sample_width, segment.channels)
+
+    @property
+    def channels(self):
+        return self.samples.shape[1]
+
+    def frame_count(self):
+        return self._frames() * self.repeat
+
+    def _frames(self):
+        """Frames before a pending loop is expanded"""
+        return len(self.samples)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        """Length in milliseconds, rounded the way pydub rounds it"""
+        return round(1000 * (self.frame_count() / self.frame_rate))
+
+    def iter_pcm(self, block_frames=BLOCK_FRAMES):
+        """Yield the samples as contiguous PCM blocks, with any loop expanded"""
+        for _ in range(self.repeat):
+            for start in range(0, len(self.samples), block_frames):
+                yield np.ascontiguousarray(self.samples[start:start + block_frames])
+
+    def to_pcm(self):
+        """Interleaved PCM bytes, with any loop expanded"""
+        return np.ascontiguousarray(self.samples).tobytes() * self.repeat
+
+    def to_segment(self):
+        return AudioSegment(data=self.to_pcm(), sample_width=self.sample_width,
+                            frame_rate=self.frame_rate, channels=self.channels)
+
+    def export(self, out_f, format='wav'):
+        """Write the audio like AudioSegment.export.
+
+        WAV files get the same bytes pydub would write, but are written a
+        block at a time instead of from one copy of the whole output; other
+        formats are converted by pydub.
+        """
+        if format != 'wav':
+            return self.to_segment().export(out_f, format=format)
+        if isinstance(out_f, (str, os.PathLike)):
+            with open(out_f, 'wb') as f:
+                self._write_wav(f)
+        else:
+            self._write_wav(out_f)
+        return out_f
+
+    def _write_wav(self, f):
+        wav = wave.open(f, 'wb')
+        wav.setnchannels(self.channels)
+        wav.setsampwidth(self.sample_width)
+        wav.setframerate(self.frame_rate)
+        wav.setnframes(self.frame_count())
+        for block in self.iter_pcm():
+            if self.sample_width == 1:
+                # WAV stores 8-bit samples unsigned
+                block = block ^ np.int8(-128)
+            wav.writeframesraw(block)
+        wav.close()
+
+    # Effects, in the order AudioProcessor applies them
+
+    def trim(self, start_ms=None, end_ms=None):
+        """Keep [start_ms, end_ms), like segment[start_ms:end_ms]; negative positions count from the end"""
+        self._splice([self._slice_run(start_ms, end_ms)])
+        return self
+
+    def set_speed(self, speed):
+        """Play the same samples at a scaled frame rate, changing pitch and duration together"""
+        self.frame_rate = int(self.frame_rate * speed)
+        return self
+
+    def fade_in(self, duration):
+        return self.fade(from_gain=-120, duration=duration, start=0)
+
+    def fade_out(self, duration):
+        return self.fade(to_gain=-120, duration=duration, end=float('inf'))
+
+    def fade(self, to_gain=0, from_gain=0, start=None, end=None, duration=None):
+        """AudioSegment.fade: a linear gain ramp, one step per ms for fades over 100 ms, else per frame"""
+        if None not in (duration, end, start):
+            raise TypeError('Only two of the three arguments, "start", "end", and "duration" may be specified')
+        if to_gain == 0 and from_gain == 0:
+            return self
+
+        length = len(self)
+        start = min(length, start) if start is not None else None
+        end = min(length, end) if end is not None else None
+        if start is not None and start < 0:
+            start += length
+        if end is not None and end < 0:
+            end += length
+        if duration is not None and duration < 0:
+            raise InvalidDuration("duration must be a positive integer")
+        if duration:
+            if start is not None:
+                end = start + duration
+            elif end is not None:
+                start = end - duration
+        else:
+            duration = end - start
+
+        from_power = db_to_float(from_gain)
+        gain_delta = db_to_float(to_gain) - from_power
+        runs = [self._slice_run(None, start, gain=from_power)]
+
+        if duration > 100:
+            runs.extend(self._step_runs(start, duration, from_power, gain_delta / duration))
+        else:
+            # One step per frame, each step being segment.get_frame(), which never pads
+            start_frame = start * (self.frame_rate / 1000.0)
+            fade_frames = end * (self.frame_rate / 1000.0) - start_frame
+            steps = np.arange(int(fade_frames))
+            frames = (start_frame + steps).astype(np.int64)
+            gains = from_power + (gain_delta / fade_frames) * steps.astype(np.float64)
+            runs.append(self._resolve(frames, frames + 1, gains, pad=False))
+
+        runs.append(self._slice_run(end, None, gain=db_to_float(to_gain)))
+        self._splice(runs)
+        return self
+
+    def apply_gain(self, volume_change):
+        """Change the volume by volume_change dB, like segment + volume_change"""
+        self._make_writable()
+        self._scale(self.samples, db_to_float(float(volume_change)))
+        return self
+
+    def reverse(self):
+        """Reverse the interleaved samples, like audioop.reverse; for stereo this also swaps the channels"""
+        # A looped clip reversed is the reversed clip looped
+        self.samples = self.samples[::-1, ::-1]
+        return self
+
+    def loop(self, times):
+        """Repeat the audio, like segment * times"""
+        self.repeat *= max(times, 0)
+        return self
+
+    # Position arithmetic, matching AudioSegment.__getitem__ and get_frame
+
+    def _step_runs(self, start, duration, from_power, slope):
+        """The runs of a long fade: one step per millisecond, each step being segment[ms]"""
+        steps = np.arange(duration)
+        positions = start + steps
+        gains = from_power + slope * steps.astype(np.float64)
+        return [self._resolve(self._ms_to_frames(positions), self._ms_to_frames(positions + 1), gains, pad=True)]
+
+    def _ms_to_frames(self, ms):
+        """AudioSegment._parse_position for an array of whole milliseconds"""
+        ms = np.where(ms < 0, len(self) - np.abs(ms), ms)
+        return (ms * (self.frame_rate / 1000.0)).astype(np.int64)
+
+    def _slice_run(self, start_ms, end_ms, gain=1.0):
+        """The frames of segment[start_ms:end_ms], as a run for _splice"""
+        length = len(self)
+        start_ms = min(start_ms if start_ms is not None else 0, length)
+        end_ms = min(end_ms if end_ms is not None else length, length)
+        bounds = self._ms_to_frames(np.array([start_ms, end_ms]))
+        return self._resolve(bounds[:1], bounds[1:], np.array([float(gain)]), pad=True)
+
+    def _resolve(self, starts, ends, gains, pad):
+        """Apply Python slice semantics to frame ranges, as pydub's byte slicing does.
+
+        Returns (first frame, frame count, zero frames appended, gain) arrays.
+        With pad, a short slice that still has data is padded with silence
+        up to its expected length, and one missing more than 2 ms raises,
+        exactly like AudioSegment.__getitem__.
+        """
+        self._materialize()
+        frames = self._frames()
+        lo = np.where(starts < 0, np.maximum(starts + frames, 0), np.minimum(starts, frames))
+        hi = np.where(ends < 0, np.maximum(ends + frames, 0), np.minimum(ends, frames))
+        counts = np.maximum(hi - lo, 0)
+        padding = np.zeros_like(counts)
+        if pad:
+            missing = (ends - starts) - counts
+            if np.any(missing > 2 * (self.frame_rate / 1000.0)):
+                raise TooManyMissingFrames("You should never be filling in more than 2 ms with silence here, "
+                                           f"missing frames: {int(missing.max())}")
+            padding = np.where((counts > 0) & (missing > 0), missing, 0)
+        return lo, counts, padding, gains
+
+    def _splice(self, runs):
+        """Replace the samples with the concatenation of runs, scaling each by its gain.
+
+        When the runs are consecutive ranges of the current samples, which
+        is the usual case, the result is a view scaled in place; otherwise
+        the runs are copied into a new array, consecutive ones together.
+        """
+        lo, counts, padding, gains = (np.concatenate(parts) for parts in zip(*runs))
+        sizes = counts + padding
+        keep = sizes > 0
+        lo, counts, padding, gains, sizes = lo[keep], counts[keep], padding[keep], gains[keep], sizes[keep]
+        if not len(sizes):
+            self.samples = self.samples[:0]
+            return
+
+        # A run continues the previous one when it starts where that one's frames end, with no silence between
+        breaks = np.flatnonzero((lo[1:] != lo[:-1] + counts[:-1]) | (padding[:-1] > 0)) + 1
+        scaled = np.flatnonzero(gains != 1.0)
+        if not len(breaks) and not padding[-1]:
+            self.samples = self.samples[lo[0]:lo[0] + counts.sum()]
+            if len(scaled):
+                self._make_writable()
+        else:
+            out = np.zeros((sizes.sum(), self.channels), dtype=self.samples.dtype)
+            position = 0
+            for group in np.split(np.arange(len(lo)), breaks):
+                first, last = group[0], group[-1]
+                frames = lo[last] + counts[last] - lo[first]
+                out[position:position + frames] = self.samples[lo[first]:lo[first] + frames]
+                position += frames + padding[last]
+            self.samples = out
+
+        if len(scaled):
+            # Per-frame gains only span the runs from the first scaled one to the last, e.g. a fade
+            offsets = np.cumsum(sizes) - sizes
+            first, last = scaled[0], scaled[-1]
+            span = self.samples[offsets[first]:offsets[last] + sizes[last]]
+            self._scale(span, np.repeat(gains[first:last + 1], sizes[first:last + 1])[:, None])
+
+    def _materialize(self):
+        """Expand a pending loop before an operation that addresses positions"""
+        if self.repeat != 1:
+            self.samples = np.tile(self.samples, (self.repeat, 1))
+            self.repeat = 1
+
+    def _make_writable(self):
+        """Copy samples that still share memory with the decoded bytes"""
+        if not self.samples.flags.writeable:
+            self.samples = self.samples.copy()
+
+    def _scale(self, samples, gain):
+        """audioop.mul in place: multiply in double precision, clamp to the sample range, round down"""
+        per_frame = np.ndim(gain) > 0
+        for start in range(0, len(samples), BLOCK_FRAMES):
+            block = samples[start:start + BLOCK_FRAMES]
+            factor = gain[start:start + BLOCK_FRAMES] if per_frame else gain
+            result = np.multiply(block, factor, dtype=np.float64)
+            np.clip(result, self.min_value, self.max_value, out=result)
+            np.floor(result, out=result)
+            block[...] = result
+
+
+class WavSource:
+    """The PCM of a WAV file, read a range of frames at a time.
+
+    The header is parsed the way pydub parses it, and samples are converted
+    the same way (8-bit made signed, 24-bit widened to 32-bit), so reading
+    every frame gives the raw_data of AudioSegment.from_wav(path). With
+    delete, the file is removed on close, e.g. for a decoded temporary.
+    """
+
+    def __init__(self, path, delete=False):
+        self.path = path
+        self.delete = delete
+        self._file = open(path, 'rb')
+        try:
+            self._parse_header()
+        except Exception:
+            self.close()
+            raise
+
+    def _parse_header(self):
+        file_size = os.fstat(self._file.fileno()).st_size
+        chunks = {}
+        chunk_id = None
+        position = 12  # After the RIFF descriptor
+        for _ in range(10):
+            if position + 8 > file_size:
+                break
+            self._file.seek(position)
+            chunk_id, chunk_size = struct.unpack('<4sI', self._file.read(8))
+            chunks.setdefault(chunk_id, (position + 8, chunk_size))
+            if chunk_id == b'data':
+                break
+            position += chunk_size + 8
+
+        if b'fmt ' not in chunks or chunks[b'fmt '][1] < 16:
+            raise CouldntDecodeError("Couldn't find fmt header in wav data")
+        if chunk_id != b'data':
+            raise CouldntDecodeError("Couldn't find data header in wav data")
+        self._file.seek(chunks[b'fmt '][0])
+        audio_format, channels, frame_rate, _, _, bits_per_sample = struct.unpack('<HHIIHH', self._file.read(16))
+        if audio_format not in (1, 0xFFFE):
+            raise CouldntDecodeError(f"Unknown audio format 0x{audio_format:X} in wav data")
+        if bits_per_sample // 8 not in (1, 2, 3, 4) or not channels:
+            raise CouldntDecodeError(f"Unsupported wav data: {bits_per_sample} bits, {channels} channels")
+
+        self.channels = channels
+        self.frame_rate = frame_rate
+        self.file_sample_width = bits_per_sample // 8
+        self.sample_width = 4 if self.file_sample_width == 3 else self.file_sample_width
+        self.data_offset = position + 8
+        self.frame_width = channels * self.file_sample_width
+        data_size = max(min(chunk_size, file_size - self.data_offset), 0)
+        self.frames = data_size // self.frame_width
+
+    def read(self, start, count):
+        """Frames [start, start + count) as a (count, channels) array"""
+        self._file.seek(self.data_offset + start * self.frame_width)
+        data = self._file.read(count * self.frame_width)
+        if self.file_sample_width == 3:
+            # pydub widens each sample to 4 bytes by prepending 0x00, or 0xFF for negative samples
+            packed = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3)
+            widened = np.empty((len(packed), 4), dtype=np.uint8)
+            widened[:, 0] = np.where(packed[:, 2] > 0x7F, 0xFF, 0)
+            widened[:, 1:] = packed
+            samples = widened.view('<i4')
+        elif self.file_sample_width == 1:
+            samples = (np.frombuffer(data, dtype=np.uint8) ^ 0x80).view(np.int8)
+        else:
+            samples = np.frombuffer(data, dtype=PCM_DTYPES[self.file_sample_width])
+        return samples.reshape(-1, self.channels)
+
+    def iter_blocks(self, block_frames=BLOCK_FRAMES):
+        for start in range(0, self.frames, block_frames):
+            yield self.read(start, min(block_frames, self.frames - start))
+
+    def close(self):
+        self._file.close()
+        if self.delete:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class AudioStream(AudioBuffer):
+    """An AudioBuffer whose samples stay in a WAV file until they are written.
+
+    Trims, fades, gains, reverse and loop only edit a table of pieces:
+    ranges of source frames (or silence), each with the gain every
+    scaling operation applied to it. The position arithmetic is
+    AudioBuffer's, so the result is the same audio, but nothing is read
+    until iter_pcm() renders the table a block at a time, and memory use
+    depends on the number of pieces (a few per fade), not on the length of
+    the file, of a fade or of the loop. Reversed pieces are read from the
+    end of their range backwards, and a loop renders the table again
+    rather than holding a copy.
+    """
+
+    # The value of each column of a scaling operation on pieces it does not touch
+    STAGE_DEFAULTS = {'gain': 1.0, 'ramp': -1, 'at': 0, 'down': False}
+
+    def __init__(self, source):
+        super().__init__(None, source.frame_rate, source.sample_width)
+        self.source = source
+        self._channels = source.channels
+        pieces = 1 if source.frames else 0
+        self._ramps = []  # (k, shift, rate, from_power, slope) of each ramp, see _step_runs
+        self._set_table(np.zeros(pieces, dtype=np.int64),  # First source frame, -1 for silence
+                        np.full(pieces, source.frames, dtype=np.int64),
+                        np.zeros(pieces, dtype=bool),  # Read backwards, with channels swapped
+                        [])  # The columns of each scaling operation, applied in order
+
+    @classmethod
+    def open(cls, path, temp_folder=None):
+        """Stream a WAV file, or an MP3 decoded to a temporary WAV file in temp_folder first"""
+        return cls(open_source(path, temp_folder))
+
+    @property
+    def channels(self):
+        return self._channels
+
+    def _frames(self):
+        return int(self._count.sum())
+
+    def close(self):
+        self.source.close()
+
+    def to_pcm(self):
+        return b''.join(block.tobytes() for block in self.iter_pcm())
+
+    def apply_gain(self, volume_change):
+        self._stages.append({'gain': np.full(len(self._count), db_to_float(float(volume_change)))})
+        return self
+
+    def reverse(self):
+        stages = [{name: column[::-1] for name, column in stage.items()} for stage in self._stages]
+        for stage in stages:
+            if 'down' in stage:
+                stage['down'] = ~stage['down']
+        self._set_table(self._src[::-1], self._count[::-1], ~self._flip[::-1], stages)
+        return self
+
+    def _materialize(self):
+        if self.repeat != 1:
+            src, count, flip = (np.tile(column, self.repeat) for column in (self._src, self._count, self._flip))
+            stages = [{name: np.tile(column, self.repeat) for name, column in stage.items()}
+                      for stage in self._stages]
+            self.repeat = 1
+            self._set_table(src, count, flip, stages)
+
+    def _set_table(self, src, count, flip, stages):
+        self._src, self._count, self._flip, self._stages = src, count, flip, stages
+        self._starts = None
+
+    def _piece_starts(self):
+        """The position of every piece in the audio, computed once per edit of the table"""
+        if self._starts is None:
+            self._starts = np.cumsum(self._count) - self._count
+        return self._starts
+
+    def _pieces_in(self, lo, hi):
+        """Split [lo, hi) ranges of the audio at piece boundaries.
+
+        Returns, for every part: the index of its range, the piece it
+        falls in, how far into the piece it starts and its length.
+        """
+        starts = self._piece_starts()
+        first = np.searchsorted(starts + self._count, lo, side='right')
+        last = np.searchsorted(starts, hi, side='left') - 1
+        parts = np.where(hi > lo, last - first + 1, 0)
+        owner = np.repeat(np.arange(len(lo)), parts)
+        piece = np.repeat(first, parts) + np.arange(parts.sum()) - np.repeat(np.cumsum(parts) - parts, parts)
+        begin = np.maximum(lo[owner], starts[piece])
+        length = np.minimum(hi[owner], starts[piece] + self._count[piece]) - begin
+        return owner, piece, begin - starts[piece], length
+
+    def _subrange(self, first, down, piece, offset, length):
+        """The lowest position of a part, for pieces covering [first, first + count) upwards or downwards"""
+        return np.where(down, first + self._count[piece] - offset - length, first + offset)
+
+    def _resolve(self, starts, ends, gains, pad):
+        # Runs of an AudioStream also name the ramp their gain follows, if any
+        return super()._resolve(starts, ends, gains, pad) + (np.full(len(starts), -1),)
+
+    def _step_runs(self, start, duration, from_power, slope):
+        """The millisecond steps of a long fade, as few runs as possible.
+
+        Step i covers the frames from trunc((i + k) * rate) + shift to the
+        same bound for i + 1, with one k and shift for positions from 0,
+        one for negative positions, which pydub counts from the end, and
+        one for positions before the start, whose frames wrap around again.
+        Consecutive steps of one shape become a single run whose gain is a
+        ramp, found again for every frame as it is rendered; only the few
+        steps that are clipped or padded stay runs of their own. Steps
+        further outside the audio than these resolve to no frames.
+        """
+        length, frames = len(self), self._frames()
+        rate = self.frame_rate / 1000.0
+        first = max(start, -2 * length - 4)
+        stop = min(start + duration, length + 4)
+        ramps = {}
+        runs = []
+        growing = None  # The ramp of the last run, while the next step can extend it
+
+        for chunk in range(first, stop, BLOCK_FRAMES):
+            positions = np.arange(chunk, min(chunk + BLOCK_FRAMES, stop))
+            steps = positions - start
+            gains = from_power + slope * steps.astype(np.float64)
+            lo, counts, padding, gains, _ = self._resolve(self._ms_to_frames(positions),
+                                                          self._ms_to_frames(positions + 1), gains, pad=True)
+            k = np.where(positions < 0, start + length, start)
+            shift = np.where(positions + length < 0, frames, 0)
+            ramped = ((padding == 0) & (lo == self._step_bound(steps + k, rate, shift))
+                      & (lo + counts == self._step_bound(steps + k + 1, rate, shift)))
+
+            shape = np.stack([ramped, k, shift])
+            for segment in np.split(np.arange(len(steps)), np.flatnonzero((shape[:, 1:] != shape[:, :-1]).any(0)) + 1):
+                if not ramped[segment[0]]:
+                    growing = None
+                    segment = segment[counts[segment] + padding[segment] > 0]
+                    runs.append((lo[segment], counts[segment], padding[segment], gains[segment],
+                                 np.full(len(segment), -1)))
+                    continue
+                key = (int(k[segment[0]]), int(shift[segment[0]]))
+                if key not in ramps:
+                    ramps[key] = len(self._ramps)
+                    self._ramps.append(key + (rate, from_power, slope))
+                frames_in = counts[segment].sum(keepdims=True)
+                if growing == ramps[key]:
+                    previous = runs[-1]
+                    runs[-1] = (previous[0], previous[1] + frames_in) + previous[2:]
+                else:
+                    growing = ramps[key]
+                    runs.append((lo[segment[:1]], frames_in, np.zeros(1, dtype=np.int64), np.ones(1),
+                                 np.array([growing])))
+        return runs
+
+    @staticmethod
+    def _step_bound(q, rate, shift):
+        """The first frame of the step at position q, as AudioBuffer._ms_to_frames and _resolve find it"""
+        return (q * rate).astype(np.int64) + shift
+
+    def _ramp_gains(self, ramp, positions):
+        """The gain of a ramp at each of the given positions of the audio it was applied to"""
+        k, shift, rate, from_power, slope = self._ramps[ramp]
+        q = np.floor((positions - shift) / rate).astype(np.int64)
+        # The estimate can be a step off either way where the bounds were truncated
+        while True:
+            over = self._step_bound(q, rate, shift) > positions
+            if not over.any():
+                break
+            q -= over
+        while True:
+            under = self._step_bound(q + 1, rate, shift) <= positions
+            if not under.any():
+                break
+            q += under
+        return from_power + slope * (q - k).astype(np.float64)
+
+    def _splice(self, runs):
+        lo, counts, padding, gains, ramps = (np.concatenate(parts) for parts in zip(*runs))
+        owner, piece, offset, length = self._pieces_in(lo, lo + counts)
+
+        # Each run becomes its parts followed by a piece of silence for its padding
+        parts = np.bincount(owner, minlength=len(lo))
+        padded = padding > 0
+        sizes = parts + padded
+        run_start = np.cumsum(sizes) - sizes
+        slots = np.repeat(run_start, parts) + np.arange(len(owner)) - np.repeat(np.cumsum(parts) - parts, parts)
+        silence = (run_start + parts)[padded]
+
+        total = int(sizes.sum())
+        new_src = np.full(total, -1, dtype=np.int64)
+        new_count = np.zeros(total, dtype=np.int64)
+        new_flip = np.zeros(total, dtype=bool)
+        src = self._src[piece]
+        new_src[slots] = np.where(src < 0, -1, self._subrange(src, self._flip[piece], piece, offset, length))
+        new_count[slots], new_flip[slots] = length, self._flip[piece]
+        new_count[silence] = padding[padded]
+
+        stages = []
+        for stage in self._stages:
+            taken = {name: column[piece] for name, column in stage.items()}
+            if 'at' in taken:
+                taken['at'] = self._subrange(taken['at'], taken['down'], piece, offset, length)
+            stages.append(taken)
+        new = {'gain': gains[owner]}
+        if (ramps >= 0).any():
+            # A ramp is evaluated at the positions the audio had when it was applied, which are these
+            new.update(ramp=ramps[owner], at=self._piece_starts()[piece] + offset, down=np.zeros(len(piece), dtype=bool))
+        stages.append(new)
+
+        self._set_table(new_src, new_count, new_flip, [])
+        for stage in stages:
+            columns = {}
+            for name, column in stage.items():
+                columns[name] = np.full(total, self.STAGE_DEFAULTS[name], dtype=column.dtype)
+                columns[name][slots] = column
+            if (columns['gain'] != 1.0).any() or ('ramp' in columns and (columns['ramp'] >= 0).any()):
+                self._stages.append(columns)
+
+    def iter_pcm(self, block_frames=BLOCK_FRAMES):
+        frames = self._frames()
+        for _ in range(self.repeat):
+            for start in range(0, frames, block_frames):
+                yield self._render(start, min(start + block_frames, frames))
+
+    def _render(self, start, stop):
+        """Read and scale the frames [start, stop) of the audio"""
+        _, piece, offset, length = self._pieces_in(np.array([start]), np.array([stop]))
+        flip = self._flip[piece]
+        silent = self._src[piece] < 0
+        src = self._subrange(self._src[piece], flip, piece, offset, length)
+        block = np.zeros((stop - start, self.channels), dtype=PCM_DTYPES[self.sample_width])
+
+        # Consecutive parts that are also consecutive in the source are read together
+        continues = ~silent[1:] & ~silent[:-1] & (flip[1:] == flip[:-1]) & np.where(
+            flip[1:], src[1:] + length[1:] == src[:-1], src[1:] == src[:-1] + length[:-1])
+        position = 0
+        for group in np.split(np.arange(len(piece)), np.flatnonzero(~continues) + 1):
+            first, last = group[0], group[-1]
+            frames = int(length[group].sum())
+            if not silent[first]:
+                if flip[first]:
+                    block[position:position + frames] = self.source.read(src[last], frames)[::-1, ::-1]
+                else:
+                    block[position:position + frames] = self.source.read(src[first], frames)
+            position += frames
+
+        for stage in self._stages:
+            gains = stage['gain'][piece]
+            if 'ramp' in stage and (stage['ramp'][piece] >= 0).any():
+                self._scale(block, self._frame_gains(stage, piece, offset, length)[:, None])
+            elif (gains == 1.0).all():
+                continue
+            elif (gains == gains[0]).all():
+                self._scale(block, gains[0])
+            else:
+                self._scale(block, np.repeat(gains, length)[:, None])
+        return block
+
+    def _frame_gains(self, stage, piece, offset, length):
+        """The gain of every frame of a block's parts in a stage with ramps"""
+        gains = np.repeat(stage['gain'][piece], length)
+        ramps = stage['ramp'][piece]
+        down = stage['down'][piece]
+        lowest = self._subrange(stage['at'][piece], down, piece, offset, length)
+        within = np.arange(len(gains)) - np.repeat(np.cumsum(length) - length, length)
+        positions = np.repeat(np.where(down, lowest + length - 1, lowest), length) + np.where(
+            np.repeat(down, length), -within, within)
+        frame_ramps = np.repeat(ramps, length)
+        for ramp in np.unique(ramps[ramps >= 0]):
+            frames = frame_ramps == ramp
+            gains[frames] = self._ramp_gains(ramp, positions[frames])
+        return gains
+
+
+def open_source(path, temp_folder=None):
+    """A WavSource for a WAV file, or for an MP3 decoded to a temporary WAV file in temp_folder"""
+    if not path.lower().endswith('.mp3'):
+        return WavSource(path)
+
+    # ffmpeg is told the format, so the file can end in .tmp, which the PCM cache's pruning skips
+    fd, wav_path = tempfile.mkstemp(suffix='.tmp', dir=temp_folder)
+    os.close(fd)
+    try:
+        decode_to_wav(path, wav_path)
+        return WavSource(wav_path, delete=True)
+    except Exception:
+        os.remove(wav_path)
+        raise
+
+
+def decode_to_wav(path, wav_path):
+    """Decode an MP3 to a WAV file with ffmpeg, using the arguments AudioSegment.from_mp3 uses"""
+    command = [AudioSegment.converter, '-y', '-f', 'mp3', '-i', path, '-acodec', 'pcm_s16le', '-vn', '-f', 'wav',
+               wav_path]
+    result = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True)
+    if result.returncode != 0:
+        raise CouldntDecodeError(f"Decoding failed. ffmpeg returned error code: {result.returncode}\n\n"
+                                 f"{result.stderr.decode(errors='ignore')}")
+
+
+def apply_effects(audio, effects):
+    """Apply the audio page's effect settings to an AudioBuffer, in AudioProcessor's order"""
+    if not effects:
+        return audio
+
+    if 'trim_start' in effects and effects['trim_start'] > 0:
+        if effects['trim_start'] < len(audio):
+            audio.trim(start_ms=effects['trim_start'])
+
+    if 'trim_end' in effects and effects['trim_end'] > 0:
+        if effects['trim_end'] < len(audio):
+            audio.trim(end_ms=-effects['trim_end'])
+
+    if 'speed' in effects and effects['speed'] != 1.0:
+        audio.set_speed(effects['speed'])
+
+    if 'fade_in' in effects and effects['fade_in'] > 0:
+        audio.fade_in(effects['fade_in'])
+
+    if 'fade_out' in effects and effects['fade_out'] > 0:
+        audio.fade_out(effects['fade_out'])
+
+    if 'volume' in effects and effects['volume'] != 0:
+        audio.apply_gain(effects['volume'])
+
+    if 'reverse' in effects and effects['reverse']:
+        audio.reverse()
+
+    if 'loop' in effects and effects['loop'] > 1:
+        audio.loop(effects['loop'])
+
+    return audio
@@ -0,0 +1,132 @@
+import numpy as np
+from pydub.utils import db_to_float
+
+from audio_engine import BLOCK_FRAMES, PCM_DTYPES, AudioBuffer
+
+
+LIMITERS = ('soft_clip', 'normalize', 'clip')
+# Fraction of full scale above which soft_clip starts bending peaks towards full scale
+SOFT_CLIP_KNEE = 0.8
+
+
+class MixTrack:
+    """One input of mix(): decoded audio starting offset_ms into the mix, scaled by gain_db"""
+
+    def __init__(self, audio, offset_ms=0, gain_db=0.0):
+        self.audio = audio
+        self.offset_ms = max(offset_ms, 0)
+        self.gain_db = gain_db
+
+
+def mix(tracks, limiter='soft_clip'):
+    """Sum any number of tracks into one AudioBuffer.
+
+    The mix takes the highest frame rate, channel count and sample width of
+    its tracks, as AudioSegment.overlay does, and lasts until the end of the
+    longest track rather than the first. Each track is resampled (linearly)
+    and channel-matched once, a block at a time, and added into a single
+    float32 accumulator, so the cost is one pass per track however many
+    there are. A looped track is read around its loop rather than copied.
+
+    Peaks over full scale are handled by the limiter: 'soft_clip' bends
+    everything above SOFT_CLIP_KNEE smoothly towards full scale and leaves
+    quieter samples untouched, 'normalize' scales the whole mix down so its
+    peak is at full scale, and 'clip' clamps, as audioop.add does.
+    """
+    if limiter not in LIMITERS:
+        raise ValueError(f"Unknown limiter: {limiter}")
+    if not tracks:
+        raise ValueError("Nothing to mix")
+
+    frame_rate = max(track.audio.frame_rate for track in tracks)
+    channels = max(track.audio.channels for track in tracks)
+    sample_width = max(track.audio.sample_width for track in tracks)
+    for track in tracks:
+        if track.audio.channels not in (1, channels):
+            raise ValueError(f"Cannot mix {track.audio.channels} channels into {channels}")
+
+    starts = [int(track.offset_ms * frame_rate / 1000.0) for track in tracks]
+    lengths = [_resampled_frames(track.audio, frame_rate) for track in tracks]
+    mixed = np.zeros((max(start + length for start, length in zip(starts, lengths)), channels),
+                     dtype=np.float32)
+
+    for track, start, length in zip(tracks, starts, lengths):
+        # Samples are mixed as fractions of full scale, so different sample widths line up
+        scale = np.float32(db_to_float(float(track.gain_db)) / (1 << (8 * track.audio.sample_width - 1)))
+        for position, block in _resampled_blocks(track.audio, frame_rate, length):
+            target = mixed[start + position:start + position + len(block)]
+            target += np.multiply(block, scale, dtype=np.float32)
+
+    full_scale = 1 << (8 * sample_width - 1)
+    if limiter == 'normalize':
+        peak = float(np.abs(mixed).max(initial=0.0))
+        if peak > 1.0:
+            mixed *= np.float32(1.0 / peak)
+
+    # The largest float32 below full scale; full_scale - 1 itself rounds up to full scale for 32-bit samples
+    highest = np.nextafter(np.float32(full_scale), np.float32(0))
+    samples = np.empty(mixed.shape, dtype=PCM_DTYPES[sample_width])
+    for block_start in range(0, len(mixed), BLOCK_FRAMES):
+        block = mixed[block_start:block_start + BLOCK_FRAMES]
+        if limiter == 'soft_clip':
+            _soft_clip(block)
+        block *= np.float32(full_scale)
+        np.rint(block, out=block)
+        np.clip(block, -full_scale, highest, out=block)
+        samples[block_start:block_start + BLOCK_FRAMES] = block
+    return AudioBuffer(samples, frame_rate, sample_width)
+
+
+def _resampled_frames(audio, frame_rate):
+    return int(audio.frame_count() * frame_rate / audio.frame_rate)
+
+
+def _resampled_blocks(audio, frame_rate, length):
+    """Yield (position, samples) blocks of an AudioBuffer, loop expanded, at frame_rate"""
+    samples = audio.samples
+    frames = len(samples)
+    if audio.frame_rate == frame_rate:
+        # Same rate: plain slices of the samples, once per repeat of the loop
+        position = 0
+        for _ in range(audio.repeat):
+            for start in range(0, frames, BLOCK_FRAMES):
+                block = samples[start:start + BLOCK_FRAMES]
+                yield position, block
+                position += len(block)
+        return
+
+    # Output frame j lies at source frame j * step, between two frames it is interpolated from.
+    # Each block reads the source span it covers once, wrapping around the loop and holding
+    # the last frame at the very end.
+    step = audio.frame_rate / frame_rate
+    total = frames * audio.repeat
+    for position in range(0, length, BLOCK_FRAMES):
+        source = np.arange(position, min(position + BLOCK_FRAMES, length)) * step
+        before = source.astype(np.int64)
+        weight = (source - before).astype(np.float32)[:, None]
+        low, high = int(before[0]), int(before[-1]) + 2
+        if low // frames == (min(high, total) - 1) // frames:
+            span = samples[low % frames:(min(high, total) - 1) % frames + 1]
+        else:
+            span = np.take(samples, np.arange(low, min(high, total)), axis=0, mode='wrap')
+        span = span.astype(np.float32)
+        if high > total:
+            span = np.concatenate([span, span[-1:]])
+        before -= low
+        block = np.take(span, before, axis=0)
+        following = np.take(span, before + 1, axis=0)
+        following -= block
+        following *= weight
+        block += following
+        yield position, block
+
+
+def _soft_clip(block):
+    """Bend the part of every sample above the knee into the headroom left below full scale, in place"""
+    magnitude = np.abs(block)
+    over = magnitude > SOFT_CLIP_KNEE
+    if not over.any():
+        return
+    headroom = 1.0 - SOFT_CLIP_KNEE
+    bent = SOFT_CLIP_KNEE + headroom * np.tanh((magnitude[over] - SOFT_CLIP_KNEE) / headroom)
+    block[over] = np.copysign(bent, block[over])
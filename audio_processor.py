@@ -1,12 +1,30 @@
 from pydub import AudioSegment
 import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from werkzeug.utils import secure_filename
+from pydub.exceptions import CouldntDecodeError
+import audio_engine
+from admission import audio_pcm_bytes
+from audio_engine import AudioBuffer, AudioStream
+from audio_mixer import MixTrack, mix
+from metrics import in_context, span, timed
+
+
+# Layers decoded at once; decoding is mostly ffmpeg and file I/O, which run outside the GIL
+LAYER_DECODE_WORKERS = min(4, os.cpu_count() or 1)
 
 
 class AudioProcessor:
-    def __init__(self, audio_folder):
+    def __init__(self, audio_folder, stream_threshold=None, pcm_cache=None, waveform_store=None):
         self.audio_folder = audio_folder
+        self.stream_threshold = stream_threshold
+        self.pcm_cache = pcm_cache
+        self.waveform_store = waveform_store
+        self._executor = None
+        self._lock = threading.Lock()
         self.preview_folder = os.path.join(audio_folder, 'previews')
         self.layers_folder = os.path.join(audio_folder, 'layers')
         os.makedirs(self.audio_folder, exist_ok=True)
@@ -16,103 +34,219 @@ class AudioProcessor:
     def allowed_file(self, filename):
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'wav', 'mp3'}
 
+    @timed('audio.load')
     def load_audio(self, file_path):
+        if self.pcm_cache is not None:
+            source = self.decoded_source(file_path)
+            return AudioBuffer(source.samples, source.frame_rate, source.sample_width).to_segment()
+        return self._decode_segment(file_path)
+
+    def _decode_segment(self, file_path):
         if file_path.lower().endswith('.mp3'):
             return AudioSegment.from_mp3(file_path)
         return AudioSegment.from_wav(file_path)
 
-    def process_audio(self, input_file, effects=None, save_as_preview=True):
+    def decoded_source(self, file_path):
+        """The decoded PCM of a file from the PCM cache, decoding it into the cache on a miss"""
+        key = self.pcm_cache.content_key(file_path)
+        source = self.pcm_cache.get(key)
+        if source is not None:
+            return source
+
+        with span('audio.decode'):
+            try:
+                # Copied into the cache a block at a time; an MP3 goes through a temporary WAV file
+                with audio_engine.open_source(file_path, temp_folder=self.pcm_cache.cache_folder) as wav:
+                    return self.pcm_cache.put(key, wav.frame_rate, wav.channels, wav.sample_width, wav.iter_blocks())
+            except CouldntDecodeError as e:
+                print(f"Error reading {file_path} as PCM, decoding it with pydub: {e}")
+                segment = self._decode_segment(file_path)
+                return self.pcm_cache.put(key, segment.frame_rate, segment.channels, segment.sample_width,
+                                          [segment.raw_data])
+
+    def peaks_source(self, file_path):
+        """The PCM of a file for its waveform peaks, read straight from a WAV file or else from the PCM cache.
+
+        An MP3 is decoded once, into the cache, for its peaks and its
+        processing together; WAV files, such as this processor's own
+        previews, need no decode and are kept out of the cache.
+        """
+        if self.pcm_cache is None:
+            return audio_engine.open_source(file_path)
+        if not file_path.lower().endswith('.mp3'):
+            try:
+                return audio_engine.WavSource(file_path)
+            except CouldntDecodeError as e:
+                print(f"Error reading {file_path} as PCM, decoding it into the PCM cache: {e}")
+        return self.decoded_source(file_path)
+
+    def open_audio(self, file_path):
+        """The decoded audio as an AudioBuffer, or an AudioStream if it is over stream_threshold.
+
+        With a PCM cache both read the cached samples in place. Without one,
+        a long MP3 is decoded to a temporary WAV file first, so that it can
+        be read in any order.
+        """
+        if self.pcm_cache is not None:
+            source = self.decoded_source(file_path)
+            if self.stream_threshold is not None and source.nbytes > self.stream_threshold:
+                return AudioStream(source)
+            return AudioBuffer(source.samples, source.frame_rate, source.sample_width)
+
+        if self.stream_threshold is not None and audio_pcm_bytes(file_path) > self.stream_threshold:
+            try:
+                with span('audio.open_stream'):
+                    return AudioStream.open(file_path)
+            except CouldntDecodeError as e:
+                print(f"Error streaming {file_path}, loading it whole: {e}")
+        return AudioBuffer.from_segment(self.load_audio(file_path))
+
+    def process_audio(self, input_file, effects=None, save_as_preview=True, cancelled=None):
+        """Apply effects to a file and write the result as a preview; returns (filename, effects).
+
+        cancelled, if given, is checked between stages; once it returns
+        True processing stops, anything written so far is removed and
+        (None, None) is returned.
+        """
+        cancelled = cancelled or (lambda: False)
+        output_path = None
         try:
-            audio = self.load_audio(input_file)
-            modified_audio = self.apply_effects(audio, effects) if effects else audio
-
-            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            original_filename = os.path.basename(input_file)
-            filename_without_ext = os.path.splitext(original_filename)[0]
+            # The effects work on the decoded PCM as an array, without a copy per step
+            with self.open_audio(input_file) as audio:
+                if cancelled():
+                    return None, None
+                if effects:
+                    with span('audio.apply_effects'):
+                        audio = audio_engine.apply_effects(audio, effects)
+                if cancelled():
+                    return None, None
 
-            output_filename = f"{filename_without_ext}_preview_{timestamp}.wav"
-            output_path = os.path.join(self.preview_folder, secure_filename(output_filename))
-            modified_audio.export(output_path, format="wav")
+                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+                original_filename = os.path.basename(input_file)
+                filename_without_ext = os.path.splitext(original_filename)[0]
+
+                output_filename = f"{filename_without_ext}_preview_{timestamp}.wav"
+                output_path = os.path.join(self.preview_folder, secure_filename(output_filename))
+                with span('audio.export'):
+                    audio.export(output_path, format="wav")
+            if cancelled():
+                self._discard(output_path)
+                return None, None
+            self.generate_peaks(output_path)
 
             return output_filename, effects
 
         except Exception as e:
             print(f"Error processing audio: {e}")
+            if output_path is not None:
+                self._discard(output_path)
             return None, None
 
+    @timed('audio.apply_effects')
     def apply_effects(self, audio, effects):
+        """Apply effects to an AudioSegment; the output is identical to chaining the pydub operations"""
         if not effects:
             return audio
 
-        modified = audio
-
-        if 'trim_start' in effects and effects['trim_start'] > 0:
-            start_ms = effects['trim_start']
-            if start_ms < len(modified):
-                modified = modified[start_ms:]
-
-        if 'trim_end' in effects and effects['trim_end'] > 0:
-            end_ms = effects['trim_end']
-            if end_ms < len(modified):
-                modified = modified[:-end_ms]
+        return audio_engine.apply_effects(AudioBuffer.from_segment(audio), effects).to_segment()
 
-        if 'speed' in effects and effects['speed'] != 1.0:
-            modified = modified._spawn(modified.raw_data, overrides={
-                "frame_rate": int(modified.frame_rate * effects['speed'])
-            })
+    def layer_audio(self, file_ids, effects_list=None, limiter='soft_clip', cancelled=None):
+        """Mix the selected files into one, each with its own effects.
 
-        if 'fade_in' in effects and effects['fade_in'] > 0:
-            modified = modified.fade_in(effects['fade_in'])
-
-        if 'fade_out' in effects and effects['fade_out'] > 0:
-            modified = modified.fade_out(effects['fade_out'])
-
-        if 'volume' in effects and effects['volume'] != 0:
-            modified += effects['volume']
-
-        if 'reverse' in effects and effects['reverse']:
-            modified = modified.reverse()
-
-        if 'loop' in effects and effects['loop'] > 1:
-            modified = modified * effects['loop']
-
-        return modified
-
-    def layer_audio(self, file_ids, effects_list=None):
+        effects_list holds one dict per selected (non-empty) file id; besides
+        the usual effects it may give an offset in milliseconds. cancelled
+        works as for process_audio.
+        """
+        cancelled = cancelled or (lambda: False)
+        output_path = None
         try:
-            if not file_ids:
-                return None
-
-            final_audio = None
-            for i, file_id in enumerate(file_ids):
-                if not file_id:  # Skip empty selections
-                    continue
-
+            selected = [file_id for file_id in file_ids or [] if file_id]
+            effects_list = effects_list or []
+            paths, layer_effects = [], []
+            for i, file_id in enumerate(selected):
                 filepath = os.path.join(self.audio_folder, file_id)
                 if not os.path.exists(filepath):
                     continue
+                paths.append(filepath)
+                layer_effects.append(effects_list[i] if i < len(effects_list) else {})
 
-                audio = self.load_audio(filepath)
-
-                if effects_list and i < len(effects_list):
-                    audio = self.apply_effects(audio, effects_list[i])
+            if not paths:
+                return None
 
-                if final_audio is None:
-                    final_audio = audio
-                else:
-                    final_audio = final_audio.overlay(audio)
+            with span('audio.decode_layers'):
+                tracks = list(self._decode_executor().map(in_context(self._layer_track), paths, layer_effects))
+            if cancelled():
+                return None
+            with span('audio.mix'):
+                mixed = mix(tracks, limiter=limiter)
+            if cancelled():
+                return None
 
-            if final_audio:
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                output_filename = f"layered_{timestamp}.wav"
-                output_path = os.path.join(self.layers_folder, output_filename)
-                final_audio.export(output_path, format="wav")
-                return output_filename
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            output_filename = f"layered_{timestamp}.wav"
+            output_path = os.path.join(self.layers_folder, output_filename)
+            with span('audio.export'):
+                mixed.export(output_path, format="wav")
+            if cancelled():
+                self._discard(output_path)
+                return None
+            self.generate_peaks(output_path)
+            return output_filename
 
         except Exception as e:
             print(f"Error layering audio: {e}")
+            if output_path is not None:
+                self._discard(output_path)
             return None
 
+    def _layer_track(self, file_path, effects):
+        """Decode one layer and apply its effects; the mixer applies its volume and offset"""
+        effects = dict(effects or {})
+        gain_db = effects.pop('volume', 0)
+        offset_ms = effects.pop('offset', 0)
+        if self.pcm_cache is not None:
+            source = self.decoded_source(file_path)
+            audio = AudioBuffer(source.samples, source.frame_rate, source.sample_width)
+        else:
+            audio = AudioBuffer.from_segment(self._decode_segment(file_path))
+        return MixTrack(audio_engine.apply_effects(audio, effects), offset_ms=offset_ms, gain_db=gain_db)
+
+    def _decode_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=LAYER_DECODE_WORKERS,
+                                                    thread_name_prefix='audio-layers')
+            return self._executor
+
+    def save_modified(self, preview_path, output_path):
+        """Save a preview as a new audio file.
+
+        Previews are WAV files this processor exported, so decoding one and
+        exporting it again would write the same bytes; the file is copied
+        instead, without going through (or filling) the PCM cache.
+        """
+        with span('audio.copy'):
+            shutil.copyfile(preview_path, output_path)
+        self.generate_peaks(output_path)
+
+    @staticmethod
+    def _discard(path):
+        """Remove a partly written or unwanted output file"""
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def generate_peaks(self, path):
+        """Write the waveform peaks of a file this processor produced; failing here does not fail the file"""
+        if self.waveform_store is None:
+            return
+        try:
+            with span('audio.waveform'):
+                self.waveform_store.generate(os.path.relpath(path, self.audio_folder))
+        except Exception as e:
+            print(f"Error generating waveform peaks for {path}: {e}")
+
     def get_audio_files(self):
         audio_files = []
 
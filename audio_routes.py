@@ -0,0 +1,188 @@
+import os
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, redirect, render_template, request, send_file, url_for
+from werkzeug.security import safe_join
+from werkzeug.utils import secure_filename
+
+from admission import estimate_audio_bytes, estimate_mix_bytes
+from services import get_services
+from system_routes import submit_job
+
+
+bp = Blueprint('audio', __name__)
+
+# Layers start at most this far into a mix
+MAX_LAYER_OFFSET_MS = 5 * 60 * 1000
+# A file or layer repeats at most this many times; a loop is written out in full
+MAX_LOOP = 16
+
+
+@bp.route('/audio')
+def audio_page():
+    audio_files = get_services().audio_processor.get_audio_files()
+    return render_template('audio.html', audio_files=audio_files)
+
+@bp.route('/process_audio', methods=['POST'])
+def process_audio():
+    if 'file' not in request.files:
+        return redirect(request.url)
+
+    file = request.files['file']
+    if file.filename == '' or not file:
+        return redirect(request.url)
+
+    if get_services().audio_processor.allowed_file(file.filename):
+        filename = secure_filename(file.filename)
+        filepath = os.path.join(current_app.config['AUDIO_FOLDER'], filename)
+        file.save(filepath)
+
+        effects = {
+            'speed': float(request.form.get('speed', 1.0)),
+            'fade_in': max(int(request.form.get('fade_in', 0)), 0),
+            'fade_out': max(int(request.form.get('fade_out', 0)), 0),
+            'volume': float(request.form.get('volume', 0)),
+            'reverse': request.form.get('reverse') == 'on',
+            'loop': min(max(int(request.form.get('loop', 1)), 1), MAX_LOOP),
+            'trim_start': max(int(request.form.get('trim_start', 0)), 0),
+            'trim_end': max(int(request.form.get('trim_end', 0)), 0)
+        }
+
+        return submit_job('process_audio', {'filepath': filepath, 'effects': effects},
+                          next_url=url_for('audio.audio_page'), priority=5)
+
+    return redirect(url_for('audio.audio_page'))
+
+@bp.route('/layer_audio', methods=['POST'])
+def layer_audio():
+    file_ids = request.form.getlist('audio_files')
+    effects_list = []
+
+    for i in range(len(file_ids)):
+        if file_ids[i]:  # Only add effects for selected files
+            effects = {
+                'volume': float(request.form.get(f'volume_{i}', 0)),
+                'speed': float(request.form.get(f'speed_{i}', 1.0)),
+                'loop': min(max(int(request.form.get(f'loop_{i}', 1)), 1), MAX_LOOP),
+                'offset': min(max(int(request.form.get(f'offset_{i}', 0)), 0), MAX_LAYER_OFFSET_MS)
+            }
+            effects_list.append(effects)
+
+    return submit_job('layer_audio', {'file_ids': file_ids, 'effects_list': effects_list,
+                                      'limiter': request.form.get('limiter', 'soft_clip')},
+                      next_url=url_for('audio.audio_page'))
+
+@bp.route('/save_modified/<filename>')
+def save_modified(filename):
+    preview_path = os.path.join(current_app.config['AUDIO_FOLDER'], 'previews', filename)
+
+    if os.path.exists(preview_path):
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        new_filename = f"modified_{timestamp}.wav"
+        new_path = os.path.join(current_app.config['AUDIO_FOLDER'], new_filename)
+
+        get_services().audio_processor.save_modified(preview_path, new_path)
+
+    return redirect(url_for('audio.audio_page'))
+
+@bp.route('/delete_audio/<path:filename>')
+def delete_audio(filename):
+    try:
+        if filename.startswith('layers/'):
+            filepath = os.path.join(current_app.config['AUDIO_FOLDER'], 'layers', os.path.basename(filename))
+        else:
+            filepath = os.path.join(current_app.config['AUDIO_FOLDER'], filename)
+
+        if os.path.exists(filepath):
+            waveform_store = get_services().waveform_store
+            os.remove(filepath)
+            waveform_store.remove(os.path.relpath(filepath, current_app.config['AUDIO_FOLDER']))
+
+            # Delete associated previews
+            filename_without_ext = os.path.splitext(os.path.basename(filename))[0]
+            preview_folder = os.path.join(current_app.config['AUDIO_FOLDER'], 'previews')
+            for preview in os.listdir(preview_folder):
+                if preview.startswith(filename_without_ext + '_preview_'):
+                    os.remove(os.path.join(preview_folder, preview))
+                    waveform_store.remove(os.path.join('previews', preview))
+    except Exception as e:
+        print(f"Error deleting file: {e}")
+
+    return redirect(url_for('audio.audio_page'))
+
+
+@bp.route('/audio/waveform/<path:filename>')
+def audio_waveform(filename):
+    """Serve the waveform peaks of an audio file, building them first if they are missing or stale.
+
+    Without query parameters this is the whole peaks file, and clients can
+    fetch the parts they need with Range requests. With level (or width,
+    in peaks), start and end (in seconds) it is just the peaks of one level
+    over that range, described by X-Waveform-* headers.
+    """
+    source_path = safe_join(current_app.config['AUDIO_FOLDER'], filename)
+    if (source_path is None or filename.startswith('waveforms/') or not os.path.isfile(source_path)
+            or not get_services().audio_processor.allowed_file(filename)):
+        return "Audio file not found", 404
+
+    try:
+        peaks = get_services().waveform_store.ensure(filename)
+    except Exception as e:
+        print(f"Error generating waveform peaks for {filename}: {str(e)}")
+        return f"Error generating waveform: {str(e)}", 500
+
+    if not any(name in request.args for name in ('level', 'width', 'start', 'end')):
+        return send_file(peaks.path, mimetype='application/octet-stream', max_age=0, conditional=True)
+
+    try:
+        level, first, data = peaks.select(level=request.args.get('level', type=int),
+                                          width=request.args.get('width', type=int),
+                                          start=request.args.get('start', 0.0, type=float),
+                                          end=request.args.get('end', type=float))
+    except ValueError as e:
+        return str(e), 400
+
+    return Response(data, mimetype='application/octet-stream', headers={
+        'X-Waveform-Bits': str(peaks.bits),
+        'X-Waveform-Level': str(level),
+        'X-Waveform-Samples-Per-Peak': str(peaks.levels[level][0]),
+        'X-Waveform-Sample-Rate': str(peaks.frame_rate),
+        'X-Waveform-First-Peak': str(first),
+        'Cache-Control': 'no-cache'
+    })
+
+
+# Background jobs: pydub is imported by the first job that needs it, not at startup
+
+def run_process_audio_job(services, job):
+    # Jobs wait for memory rather than failing; the job queue is their queue
+    estimate = estimate_audio_bytes(job.params['filepath'], services.config['AUDIO_STREAM_THRESHOLD'])
+    with services.memory_budget.admit(estimate, timeout=None):
+        job.check_cancelled()
+        preview_filename, _ = services.audio_processor.process_audio(
+            job.params['filepath'],
+            effects=job.params['effects'],
+            save_as_preview=True,
+            cancelled=job.cancel_requested
+        )
+    if preview_filename is None:
+        # The processor removes its partial output when it stops for a cancellation
+        job.check_cancelled()
+        raise RuntimeError("Audio processing failed")
+    return {'filename': preview_filename, 'static_path': f'audio/previews/{preview_filename}'}
+
+def run_layer_audio_job(services, job):
+    # Effects are given per selected file, as layer_audio pairs them
+    paths = [os.path.join(services.config['AUDIO_FOLDER'], file_id) for file_id in job.params['file_ids'] if file_id]
+    effects_list = list(job.params['effects_list'] or []) + [{}] * len(paths)
+    estimate = estimate_mix_bytes([(path, effects) for path, effects in zip(paths, effects_list)
+                                   if os.path.exists(path)])
+    with services.memory_budget.admit(estimate, timeout=None):
+        job.check_cancelled()
+        output_filename = services.audio_processor.layer_audio(job.params['file_ids'], job.params['effects_list'],
+                                                               limiter=job.params.get('limiter', 'soft_clip'),
+                                                               cancelled=job.cancel_requested)
+    if output_filename is None:
+        job.check_cancelled()
+        raise RuntimeError("Audio layering failed")
+    return {'filename': output_filename, 'static_path': f'audio/layers/{output_filename}'}
@@ -0,0 +1,139 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+
+# Each worker keeps its own small decode cache and is recycled after a number
+# of images, so a long batch cannot grow a worker's memory without bound
+WORKER_CACHE_BYTES = 64 * 1024 * 1024
+MAX_TASKS_PER_CHILD = 100
+
+_worker_effects = None
+_worker_store = None
+
+
+def _init_worker(cache_bytes, store_config):
+    global _worker_effects, _worker_store
+    from image_effects import DecodedImageCache, ImageEffects
+    _worker_effects = ImageEffects(cache=DecodedImageCache(max_bytes=cache_bytes))
+    if store_config is not None:
+        from artwork_index import ArtworkIndex
+        from artwork_store import ArtworkStore
+        artwork_folder, blob_folder, index_path = store_config
+        _worker_store = ArtworkStore(artwork_folder, blob_folder, index=ArtworkIndex(index_path, artwork_folder))
+
+
+def _apply_effect(image_path, effect_name, output_folder, full_resolution):
+    start = time.perf_counter()
+    new_filename = _worker_effects.save_rendered_effect(
+        image_path, effect_name, output_folder, full_resolution=full_resolution, store=_worker_store)
+    return new_filename, time.perf_counter() - start
+
+
+class BatchProcessor:
+    """Apply one effect or pipeline to many images on a pool of worker processes"""
+
+    def __init__(self, max_workers=None, cache_bytes=WORKER_CACHE_BYTES, max_in_flight=None, store_config=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.cache_bytes = cache_bytes
+        # (artwork_folder, blob_folder, index_path): workers save through their own ArtworkStore
+        self.store_config = store_config
+        # Only a few images per worker are queued at once, so results stream
+        # back steadily and a huge batch never sits in the pool's queue
+        self.max_in_flight = max_in_flight or self.max_workers * 2
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn keeps workers free of the web server's state and is required for max_tasks_per_child
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_init_worker,
+                    initargs=(self.cache_bytes, self.store_config),
+                    max_tasks_per_child=MAX_TASKS_PER_CHILD
+                )
+            return self._executor
+
+    def run(self, image_paths, effect_name, output_folder, full_resolution=False, missing=()):
+        """Yield one result dict per image, in completion order, followed by a summary.
+
+        missing names images that were asked for but not found; each gets an
+        error result first and counts as a failure in the summary.
+        """
+        executor = self.get_executor()
+        start = time.perf_counter()
+        total = len(image_paths) + len(missing)
+        pending = {}
+        completed = succeeded = 0
+        broken = False
+        queue = iter(image_paths)
+
+        for image_name in missing:
+            completed += 1
+            yield {'image': image_name, 'completed': completed, 'total': total, 'status': 'error',
+                   'error': 'Image not found'}
+
+        def submit_next():
+            image_path = next(queue, None)
+            if image_path is None:
+                return False
+            try:
+                future = executor.submit(_apply_effect, image_path, effect_name, output_folder, full_resolution)
+            except BrokenProcessPool as e:
+                # Report the failure per image; the pool is replaced once this batch ends
+                future = Future()
+                future.set_exception(e)
+            pending[future] = image_path
+            return True
+
+        while len(pending) < self.max_in_flight and submit_next():
+            pass
+
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    image_path = pending.pop(future)
+                    completed += 1
+                    result = {
+                        'image': os.path.basename(image_path),
+                        'completed': completed,
+                        'total': total
+                    }
+                    try:
+                        new_filename, seconds = future.result()
+                        result.update(status='ok', filename=new_filename, seconds=round(seconds, 4))
+                        succeeded += 1
+                    except BrokenProcessPool as e:
+                        broken = True
+                        result.update(status='error', error=str(e))
+                    except Exception as e:
+                        result.update(status='error', error=str(e))
+                    yield result
+                    submit_next()
+        finally:
+            # The client may disconnect mid-stream; drop whatever has not started yet
+            for future in pending:
+                future.cancel()
+            if broken:
+                self.shutdown()
+
+        yield {
+            'done': True,
+            'total': total,
+            'succeeded': succeeded,
+            'failed': total - succeeded,
+            'seconds': round(time.perf_counter() - start, 4)
+        }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
@@ -0,0 +1,209 @@
+"""Audio effect benchmark: the pydub effect chain vs the NumPy engine in audio_engine.
+
+The pydub and engine strategies start from the same decoded AudioSegment,
+apply the effects and export a WAV file, as AudioProcessor.process_audio
+does; the stream strategy reads the same audio from a WAV file a block at
+a time, as process_audio does for long recordings. Every case checks that
+the files are byte-identical, and --verify
+additionally runs randomized settings (sample widths, channel counts, odd
+frame rates, fades longer than the clip) through both and compares the
+PCM, or the exception raised.
+
+    python benchmarks/bench_audio_effects.py [--repeat 3] [--verify 200] [--output results.json]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+warnings.filterwarnings('ignore', message="Couldn't find ffmpeg")
+
+from bench_engines import AUDIO_EFFECTS  # noqa: E402
+from synthetic import make_segment  # noqa: E402
+
+DURATIONS = [10, 60, 300]
+
+# The full settings form, each effect on its own, and the effects that touch every sample
+EFFECT_SETS = {'all': AUDIO_EFFECTS}
+EFFECT_SETS.update({name: {name: value} for name, value in AUDIO_EFFECTS.items()})
+EFFECT_SETS['fades+volume'] = {'fade_in': 2000, 'fade_out': 2000, 'volume': -4}
+
+
+def pydub_effects(modified, effects):
+    """AudioProcessor.apply_effects before the engine: one pydub operation per effect"""
+    if effects.get('trim_start', 0) > 0 and effects['trim_start'] < len(modified):
+        modified = modified[effects['trim_start']:]
+    if effects.get('trim_end', 0) > 0 and effects['trim_end'] < len(modified):
+        modified = modified[:-effects['trim_end']]
+    if effects.get('speed', 1.0) != 1.0:
+        modified = modified._spawn(modified.raw_data, overrides={
+            "frame_rate": int(modified.frame_rate * effects['speed'])
+        })
+    if effects.get('fade_in', 0) > 0:
+        modified = modified.fade_in(effects['fade_in'])
+    if effects.get('fade_out', 0) > 0:
+        modified = modified.fade_out(effects['fade_out'])
+    if effects.get('volume', 0) != 0:
+        modified += effects['volume']
+    if effects.get('reverse'):
+        modified = modified.reverse()
+    if effects.get('loop', 1) > 1:
+        modified = modified * effects['loop']
+    return modified
+
+
+def run_pydub(segment, effects):
+    modified = pydub_effects(segment, effects)
+    return modified.raw_data, modified.frame_rate
+
+
+def run_engine(segment, effects):
+    import audio_engine
+
+    audio = audio_engine.apply_effects(audio_engine.AudioBuffer.from_segment(segment), effects)
+    return audio.to_pcm(), audio.frame_rate
+
+
+def export_pydub(segment, source, effects, path):
+    pydub_effects(segment, effects).export(path, format='wav').close()
+
+
+def export_engine(segment, source, effects, path):
+    import audio_engine
+
+    audio_engine.apply_effects(audio_engine.AudioBuffer.from_segment(segment), effects).export(path, format='wav')
+
+
+def export_stream(segment, source, effects, path):
+    import audio_engine
+
+    with audio_engine.AudioStream.open(source) as audio:
+        audio_engine.apply_effects(audio, effects).export(path, format='wav')
+
+
+STRATEGIES = {'pydub': export_pydub, 'engine': export_engine, 'stream': export_stream}
+
+
+def measure(strategy, segment, source, effects, repeat, path):
+    run = STRATEGIES[strategy]
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(segment, source, effects, path)
+        times.append(time.perf_counter() - start)
+
+    # A separate run, since tracing allocations slows everything down
+    tracemalloc.start()
+    run(segment, source, effects, path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    with open(path, 'rb') as f:
+        return min(times), peak, f.read()
+
+
+def random_case(rng, case):
+    """A random segment and effect settings, including ones the audio page would never send"""
+    import numpy as np
+    from pydub import AudioSegment
+    from audio_engine import PCM_DTYPES
+
+    width = rng.choice([1, 2, 2, 4])
+    channels = rng.choice([1, 2])
+    frame_rate = rng.choice([8000, 11025, 22050, 44100, 48000, 44117])
+    frames = rng.choice([0, 1, 7, rng.randint(1, 3000), rng.randint(1000, 200000)])
+    info = np.iinfo(PCM_DTYPES[width])
+    data = np.random.default_rng(case).integers(info.min, info.max, size=frames * channels, endpoint=True,
+                                                dtype=PCM_DTYPES[width])
+    if rng.random() < 0.3:
+        # Full-scale audio, so gains clip
+        data[:] = rng.choice([info.min, info.max])
+    segment = AudioSegment(data=data.tobytes(), sample_width=width, frame_rate=frame_rate, channels=channels)
+    length = len(segment)
+    effects = {
+        'trim_start': rng.choice([0, 0, rng.randint(0, length + 10)]),
+        'trim_end': rng.choice([0, 0, rng.randint(0, length + 10)]),
+        'speed': rng.choice([1.0, 1.0, 0.5, 1.5, 0.73, 2.0]),
+        'fade_in': rng.choice([0, rng.randint(1, 100), rng.randint(101, 3000), rng.randint(0, 2 * length + 200)]),
+        'fade_out': rng.choice([0, rng.randint(1, 100), rng.randint(101, 3000), rng.randint(0, 2 * length + 200)]),
+        'volume': rng.choice([0, 0, -6.0, 3.5, 12.0, -30.0]),
+        'reverse': rng.random() < 0.4,
+        'loop': rng.choice([1, 1, 2, 3])
+    }
+    return segment, effects
+
+
+def outcome(run, segment, effects):
+    try:
+        return run(segment, effects)
+    except Exception as e:
+        return type(e).__name__
+
+
+def verify(cases, seed=0):
+    rng = random.Random(seed)
+    mismatches = []
+    for case in range(cases):
+        segment, effects = random_case(rng, case)
+        if outcome(run_pydub, segment, effects) != outcome(run_engine, segment, effects):
+            mismatches.append({'case': case, 'sample_width': segment.sample_width, 'channels': segment.channels,
+                               'frame_rate': segment.frame_rate, 'frames': int(segment.frame_count()),
+                               'effects': effects})
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--verify', type=int, default=200, metavar='CASES',
+                        help="Randomized equivalence cases to run (0 to skip)")
+    parser.add_argument('--durations', help="Comma-separated clip lengths in seconds")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    durations = [float(d) for d in args.durations.split(',')] if args.durations else DURATIONS
+    results = {'cases': [], 'mismatches': []}
+    workdir = tempfile.mkdtemp()
+    source = os.path.join(workdir, 'source.wav')
+    for seconds in durations:
+        segment = make_segment(seconds)
+        segment.export(source, format='wav').close()
+        for name, effects in EFFECT_SETS.items():
+            measured = {strategy: measure(strategy, segment, source, effects, args.repeat,
+                                          os.path.join(workdir, f'{strategy}.wav'))
+                        for strategy in STRATEGIES}
+            identical = all(output == measured['pydub'][2] for _, _, output in measured.values())
+            entry = {'duration_s': seconds, 'effects': name, 'identical': identical}
+            line = f"{seconds:>5g}s {name:<13}"
+            for strategy, (seconds_taken, peak, _) in measured.items():
+                entry[f'{strategy}_seconds'] = seconds_taken
+                entry[f'{strategy}_peak_bytes'] = peak
+                line += f" {strategy} {seconds_taken * 1000:8.1f} ms {peak / 2**20:7.1f} MB  "
+            results['cases'].append(entry)
+            print(f"{line}{'identical' if identical else 'DIFFERENT'}")
+
+    for name in list(STRATEGIES) + ['source']:
+        os.remove(os.path.join(workdir, f'{name}.wav'))
+    os.rmdir(workdir)
+
+    if args.verify:
+        results['mismatches'] = verify(args.verify)
+        print(f"randomized equivalence: {args.verify - len(results['mismatches'])}/{args.verify} identical")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if results['mismatches'] or not all(case['identical'] for case in results['cases']):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Decode benchmark: full-size vs reduced-resolution (draft mode) JPEG loading.
+
+Generates large synthetic JPEGs and loads each one the way ImageEffects
+prepares its base image, once per strategy. Every measurement runs in a
+fresh interpreter so peak RSS is not polluted by earlier runs.
+
+    python benchmarks/bench_decode.py [--repeat 3] [--output results.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import make_image  # noqa: E402
+
+SAMPLE_SIZES = [(4000, 3000), (6000, 4000), (8000, 6000)]
+MAX_DIMENSION = 1200
+
+
+def decode(strategy, path):
+    from PIL import Image
+
+    if strategy == 'full':
+        # Decode every pixel, then resample
+        pil_image = Image.open(path)
+        pil_image = pil_image.convert('RGB')
+        pil_image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.Resampling.LANCZOS, reducing_gap=None)
+    elif strategy == 'legacy':
+        # ImageEffects.process_image before reduced decoding
+        pil_image = Image.open(path)
+        if pil_image.mode != 'RGB':
+            pil_image = pil_image.convert('RGB')
+        if max(pil_image.size) > MAX_DIMENSION:
+            pil_image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.Resampling.LANCZOS)
+    elif strategy == 'reduced':
+        from image_effects import open_image_reduced
+        pil_image = open_image_reduced(path, MAX_DIMENSION).convert('RGB')
+    else:
+        raise ValueError(f"Unknown strategy: {strategy}")
+    return pil_image.size
+
+
+def run_worker(strategy, path):
+    # Import everything up front so the RSS delta only covers the decode
+    import numpy  # noqa: F401
+    from PIL import Image  # noqa: F401
+    import image_effects  # noqa: F401
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    size = decode(strategy, path)
+    seconds = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({
+        'seconds': seconds,
+        'peak_rss_kb': peak_kb,
+        'decode_rss_kb': peak_kb - baseline_kb,
+        'output_size': size
+    }))
+
+
+def measure(strategy, path):
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', strategy, path],
+        check=True, capture_output=True, text=True, cwd=ROOT
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--worker', nargs=2, metavar=('STRATEGY', 'PATH'), help=argparse.SUPPRESS)
+    parser.add_argument('--make-sample', nargs=3, metavar=('PATH', 'WIDTH', 'HEIGHT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+    if args.make_sample:
+        path, width, height = args.make_sample
+        make_image(path, int(width), int(height))
+        return
+
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for width, height in SAMPLE_SIZES:
+            path = os.path.join(workdir, f'sample_{width}x{height}.jpg')
+            # Linux keeps the RSS high-water mark across fork+exec, so the parent
+            # must never hold a large image itself
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--make-sample',
+                            path, str(width), str(height)], check=True, cwd=ROOT)
+            for strategy in ('full', 'legacy', 'reduced'):
+                runs = [measure(strategy, path) for _ in range(args.repeat)]
+                result = {
+                    'sample': f'{width}x{height}',
+                    'megapixels': round(width * height / 1e6, 1),
+                    'file_bytes': os.path.getsize(path),
+                    'strategy': strategy,
+                    'best_seconds': min(run['seconds'] for run in runs),
+                    'decode_rss_kb': max(run['decode_rss_kb'] for run in runs),
+                    'peak_rss_kb': max(run['peak_rss_kb'] for run in runs)
+                }
+                results.append(result)
+                print(f"{result['sample']:>10} {strategy:>8}: {result['best_seconds'] * 1000:8.1f} ms  "
+                      f"+{result['decode_rss_kb'] / 1024:7.1f} MB RSS")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
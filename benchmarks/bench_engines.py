@@ -0,0 +1,321 @@
+"""Microbenchmarks for the processing engines, on synthetic inputs generated locally.
+
+Suites:
+    image          ImageEffects decode and every effect, per image size and resolution
+    audio          AudioProcessor.apply_effects per effect and duration, layer_audio per track count
+    visualization  DataVisualization.get_all_plots
+    generative     turtle_art_image and pygame_art_image
+    gallery        folder listing vs the artwork index, with 10k and 100k files
+
+    python benchmarks/bench_engines.py [--suite image,audio] [--quick] [--output results.json]
+    python benchmarks/bench_engines.py --output new.json --compare old.json [--threshold 1.15]
+
+Results are written as JSON with the commit they were measured on, so runs
+of different commits can be compared with --compare, which exits non-zero
+when any case got slower than the threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import make_image, make_wav  # noqa: E402
+
+IMAGE_SIZES = [(640, 480), (1920, 1080), (4000, 3000)]
+AUDIO_DURATIONS = [5, 30, 120]
+LAYER_TRACK_COUNTS = [2, 4, 8]
+LAYER_DURATION = 30
+GALLERY_SIZES = [10_000, 100_000]
+GALLERY_PAGE_SIZE = 24
+
+# A realistic settings form from the audio page, and each of its effects on its own
+AUDIO_EFFECTS = {
+    'trim_start': 500,
+    'trim_end': 500,
+    'speed': 1.25,
+    'fade_in': 1000,
+    'fade_out': 1000,
+    'volume': 3,
+    'reverse': True,
+    'loop': 2
+}
+
+QUICK = {
+    'IMAGE_SIZES': IMAGE_SIZES[:2],
+    'AUDIO_DURATIONS': AUDIO_DURATIONS[:2],
+    'LAYER_TRACK_COUNTS': LAYER_TRACK_COUNTS[:2],
+    'GALLERY_SIZES': GALLERY_SIZES[:1]
+}
+
+
+def timed_runs(func, repeat, warmup=1, setup=None):
+    """Call func repeat times after warmup calls and return the wall times in seconds.
+
+    setup, if given, runs untimed before every call. Output printed by the
+    code under test is swallowed.
+    """
+    times = []
+    for i in range(warmup + repeat):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            func()
+            elapsed = time.perf_counter() - start
+        if i >= warmup:
+            times.append(elapsed)
+    return times
+
+
+def result(suite, case, params, times):
+    entry = {
+        'suite': suite,
+        'case': case,
+        'params': params,
+        'runs': len(times),
+        'min_seconds': min(times),
+        'median_seconds': statistics.median(times),
+        'max_seconds': max(times)
+    }
+    described = ' '.join(f"{key}={value}" for key, value in params.items())
+    print(f"{suite:>13} {case:<28} {described:<36} {entry['median_seconds'] * 1000:10.2f} ms")
+    return entry
+
+
+def bench_image(workdir, repeat):
+    from image_effects import DecodedImageCache, ImageEffects
+
+    results = []
+    for width, height in IMAGE_SIZES:
+        path = os.path.join(workdir, f'image_{width}x{height}.jpg')
+        make_image(path, width, height)
+        # A private cache, so decodes can be measured by clearing it
+        cache = DecodedImageCache()
+        effects = ImageEffects(cache=cache)
+
+        for resolution, full_resolution in (('preview', False), ('full', True)):
+            params = {'size': f'{width}x{height}', 'resolution': resolution}
+            times = timed_runs(lambda: effects.load_image(path, full_resolution=full_resolution),
+                               repeat, setup=cache.clear)
+            results.append(result('image', 'decode', params, times))
+
+            image = effects.load_image(path, full_resolution=full_resolution)
+            for effect_name in effects.effects:
+                times = timed_runs(lambda: effects.render_effect(image, effect_name, compress=not full_resolution),
+                                   repeat)
+                results.append(result('image', f'effect:{effect_name}', params, times))
+
+            names = list(effects.effects)
+            times = timed_runs(lambda: effects.render_effects(image, names, parallel=True), repeat)
+            results.append(result('image', 'all_effects_parallel', params, times))
+    return results
+
+
+def bench_audio(workdir, repeat):
+    from audio_processor import AudioProcessor
+
+    processor = AudioProcessor(os.path.join(workdir, 'audio'))
+    results = []
+    for seconds in AUDIO_DURATIONS:
+        path = os.path.join(processor.audio_folder, f'tone_{seconds}s.wav')
+        make_wav(path, seconds, seed=seconds)
+        params = {'duration_s': seconds}
+
+        times = timed_runs(lambda: processor.load_audio(path), repeat)
+        results.append(result('audio', 'load', params, times))
+
+        audio = processor.load_audio(path)
+        for name, value in AUDIO_EFFECTS.items():
+            times = timed_runs(lambda: processor.apply_effects(audio, {name: value}), repeat)
+            results.append(result('audio', f'apply_effects:{name}', params, times))
+        times = timed_runs(lambda: processor.apply_effects(audio, AUDIO_EFFECTS), repeat)
+        results.append(result('audio', 'apply_effects:all', params, times))
+
+    for tracks in LAYER_TRACK_COUNTS:
+        file_ids = []
+        for i in range(tracks):
+            file_id = f'layer_{LAYER_DURATION}s_{i}.wav'
+            make_wav(os.path.join(processor.audio_folder, file_id), LAYER_DURATION, seed=100 + i)
+            file_ids.append(file_id)
+        times = timed_runs(lambda: processor.layer_audio(file_ids), repeat)
+        results.append(result('audio', 'layer_audio', {'tracks': tracks, 'duration_s': LAYER_DURATION}, times))
+    return results
+
+
+def bench_visualization(workdir, repeat):
+    from visualization import DataVisualization
+
+    # DataVisualization reads 2019.csv relative to the working directory
+    os.chdir(ROOT)
+    times = timed_runs(lambda: DataVisualization().get_all_plots(), repeat)
+    return [result('visualization', 'get_all_plots', {}, times)]
+
+
+def bench_generative(workdir, repeat):
+    from generative import pygame_art_image, turtle_art_image
+
+    folder = os.path.join(workdir, 'generated')
+    results = []
+    for name, generator in (('turtle_art_image', turtle_art_image), ('pygame_art_image', pygame_art_image)):
+        random.seed(0)
+        times = timed_runs(lambda: generator(folder), repeat)
+        results.append(result('generative', name, {}, times))
+    return results
+
+
+def populate_gallery(folder, index, count):
+    """Create count tiny artwork files and index them without decoding, as sync() would have"""
+    os.makedirs(folder, exist_ok=True)
+    rows = []
+    for i in range(count):
+        filename = f'{i:07d}_art.png'
+        path = os.path.join(folder, filename)
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG')
+        stat = os.stat(path)
+        rows.append((filename, stat.st_mtime_ns, 800, 600, 'PNG', stat.st_size, f'{i:064x}', 'generated'))
+    with index.connection() as conn:
+        conn.executemany('INSERT OR REPLACE INTO artworks VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+
+def bench_gallery(workdir, repeat):
+    from artwork_index import ArtworkIndex
+
+    results = []
+    for count in GALLERY_SIZES:
+        folder = os.path.join(workdir, f'gallery_{count}')
+        index = ArtworkIndex(os.path.join(workdir, f'gallery_{count}.sqlite3'), folder)
+        populate_gallery(folder, index, count)
+        params = {'files': count}
+
+        def listdir_sorted():
+            # How the gallery was listed before the index: every file stat'ed on each request
+            names = [f for f in os.listdir(folder) if f.lower().endswith(('.png', '.jpg', '.jpeg', '.gif'))]
+            names.sort(key=lambda f: os.path.getmtime(os.path.join(folder, f)), reverse=True)
+            return names
+
+        results.append(result('gallery', 'listdir_sorted', params, timed_runs(listdir_sorted, repeat)))
+        results.append(result('gallery', 'index_list_filenames', params,
+                              timed_runs(index.list_filenames, repeat)))
+        results.append(result('gallery', 'index_first_page', params,
+                              timed_runs(lambda: index.page(GALLERY_PAGE_SIZE), repeat)))
+
+        middle = index.connection().execute('SELECT mtime_ns, filename FROM artworks ORDER BY mtime_ns DESC, '
+                                            'filename LIMIT 1 OFFSET ?', (count // 2,)).fetchone()
+        after = (middle['mtime_ns'], middle['filename'])
+        results.append(result('gallery', 'index_deep_page', params,
+                              timed_runs(lambda: index.page(GALLERY_PAGE_SIZE, after=after), repeat)))
+        results.append(result('gallery', 'index_sync_unchanged', params, timed_runs(index.sync, repeat)))
+    return results
+
+
+SUITES = {
+    'image': bench_image,
+    'audio': bench_audio,
+    'visualization': bench_visualization,
+    'generative': bench_generative,
+    'gallery': bench_gallery
+}
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        commit, dirty = None, None
+    return {
+        'commit': commit,
+        'dirty': dirty,
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'sqlite': sqlite3.sqlite_version
+    }
+
+
+def case_key(entry):
+    return entry['suite'], entry['case'], json.dumps(entry['params'], sort_keys=True)
+
+
+def compare(results, baseline_path, threshold):
+    """Print the median ratio of every case against a previous run and return the regressions"""
+    with open(baseline_path) as f:
+        baseline = {case_key(entry): entry for entry in json.load(f)['results']}
+
+    print(f"\nCompared with {baseline_path} (regression if slower than x{threshold}):")
+    regressions = []
+    for entry in results:
+        previous = baseline.get(case_key(entry))
+        if previous is None:
+            continue
+        ratio = entry['median_seconds'] / previous['median_seconds']
+        marker = ''
+        if ratio > threshold:
+            marker = '  REGRESSION'
+            regressions.append(entry)
+        elif ratio < 1 / threshold:
+            marker = '  faster'
+        described = ' '.join(f"{key}={value}" for key, value in entry['params'].items())
+        print(f"{entry['suite']:>13} {entry['case']:<28} {described:<36} x{ratio:6.2f}{marker}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--suite', default=','.join(SUITES),
+                        help=f"Comma-separated suites to run (default: all of {', '.join(SUITES)})")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help="Smaller inputs and fewer repeats, for a smoke run")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--compare', help="A previous --output file to compare against")
+    parser.add_argument('--threshold', type=float, default=1.15,
+                        help="Median slowdown ratio reported as a regression by --compare")
+    args = parser.parse_args()
+
+    suites = [name.strip() for name in args.suite.split(',') if name.strip()]
+    unknown = set(suites) - set(SUITES)
+    if unknown:
+        parser.error(f"Unknown suites: {', '.join(sorted(unknown))}")
+    repeat = args.repeat
+    if args.quick:
+        globals().update(QUICK)
+        repeat = min(repeat, 2)
+
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in suites:
+            try:
+                results.extend(SUITES[name](workdir, repeat))
+            finally:
+                os.chdir(cwd)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': environment(), 'repeat': repeat, 'quick': args.quick,
+                       'results': results}, f, indent=2)
+
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Layering benchmark: the pydub overlay chain vs audio_mixer.mix for growing numbers of tracks.
+
+Each case layers N WAV tracks of the same length, with per-track volume,
+speed and loop settings from the layer form. The overlay strategy is
+layer_audio before the mixer: decode, apply the effects and overlay onto
+the running mix, one track at a time. Its output stops at the end of the
+first track, so that track is slowed down and looped to be the longest,
+and both strategies write the same length of audio. The mixer strategies run
+AudioProcessor.layer_audio with an empty PCM cache (cold) and with the
+tracks already cached (warm). All files are written to a temporary
+directory.
+
+    python benchmarks/bench_layer_audio.py [--repeat 3] [--tracks 2,4,8,16] [--seconds 30] [--output results.json]
+"""
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+warnings.filterwarnings('ignore', message="Couldn't find ffmpeg")
+
+from bench_audio_effects import pydub_effects  # noqa: E402
+from synthetic import make_segment  # noqa: E402
+
+TRACK_COUNTS = [2, 4, 8, 16]
+SECONDS = 30
+
+
+def layer_effects(index):
+    if index == 0:
+        return {'volume': -3, 'speed': 0.8, 'loop': 2}
+    return {'volume': -3 - index % 4, 'speed': (1.0, 1.25, 0.9)[index % 3], 'loop': 1}
+
+
+def run_overlay(processor, file_ids, effects_list):
+    from pydub import AudioSegment
+
+    final_audio = None
+    for file_id, effects in zip(file_ids, effects_list):
+        audio = pydub_effects(AudioSegment.from_wav(os.path.join(processor.audio_folder, file_id)), effects)
+        final_audio = audio if final_audio is None else final_audio.overlay(audio)
+    output_path = os.path.join(processor.layers_folder, 'overlay.wav')
+    final_audio.export(output_path, format='wav').close()
+    return output_path
+
+
+def run_mixer_cold(processor, file_ids, effects_list):
+    shutil.rmtree(processor.pcm_cache.cache_folder, ignore_errors=True)
+    processor.pcm_cache._keys.clear()
+    return run_mixer_warm(processor, file_ids, effects_list)
+
+
+def run_mixer_warm(processor, file_ids, effects_list):
+    for path in glob.glob(os.path.join(processor.layers_folder, 'layered_*.wav')):
+        os.remove(path)
+    return os.path.join(processor.layers_folder, processor.layer_audio(file_ids, effects_list))
+
+
+STRATEGIES = {'overlay': run_overlay, 'mixer_cold': run_mixer_cold, 'mixer_warm': run_mixer_warm}
+
+
+def measure(run, processor, file_ids, effects_list, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        path = run(processor, file_ids, effects_list)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    path = run(processor, file_ids, effects_list)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--tracks', help="Comma-separated track counts")
+    parser.add_argument('--seconds', type=float, default=SECONDS, help="Length of each track")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    from audio_processor import AudioProcessor
+    from pcm_cache import PCMCache
+
+    track_counts = [int(n) for n in args.tracks.split(',')] if args.tracks else TRACK_COUNTS
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        processor = AudioProcessor(os.path.join(workdir, 'audio'), pcm_cache=PCMCache(os.path.join(workdir, 'pcm')))
+        file_ids = []
+        for index in range(max(track_counts)):
+            file_id = f'track{index}.wav'
+            make_segment(args.seconds, seed=index).export(
+                os.path.join(processor.audio_folder, file_id), format='wav').close()
+            file_ids.append(file_id)
+
+        for count in track_counts:
+            effects_list = [layer_effects(index) for index in range(count)]
+            entry = {'tracks': count}
+            line = f"{count:>3} tracks"
+            for strategy, run in STRATEGIES.items():
+                seconds_taken, peak, size = measure(run, processor, file_ids[:count], effects_list, args.repeat)
+                entry[strategy] = {'seconds': seconds_taken, 'peak_bytes': peak, 'output_bytes': size}
+                line += f"  {strategy} {seconds_taken * 1000:8.1f} ms {peak / 2**20:6.1f} MB {size / 2**20:5.1f} MB out"
+            results.append(entry)
+            print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
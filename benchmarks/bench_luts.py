@@ -0,0 +1,105 @@
+"""3D LUT benchmark: nearest-lattice lookup vs trilinear interpolation in luts.apply_lut3d.
+
+The nearest strategy is apply_lut3d before it interpolated: one gather per
+pixel from the compiled 128^3 lattice, which maps neighbouring input levels
+to the same output. The trilinear strategy is apply_lut3d. Both grade
+synthetic photos with the shipped warm.cube, and every run also checks
+that an identity .cube round-trips all 2^24 colours exactly, exiting
+non-zero if it does not.
+
+    python benchmarks/bench_luts.py [--repeat 3] [--output results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from synthetic import make_image  # noqa: E402
+
+IMAGE_SIZES = [(1200, 900), (4000, 3000)]
+CUBE_PATH = os.path.join(ROOT, 'static', 'luts', 'warm.cube')
+
+
+def apply_nearest(image, compiled, bits=None):
+    import numpy as np
+    import luts
+
+    bits = bits or luts.LUT3D_BITS
+    shift = 8 - bits
+    index = (image[..., 0] >> shift).astype(np.uint32) << (2 * bits)
+    index |= (image[..., 1] >> shift).astype(np.uint32) << bits
+    index |= image[..., 2] >> shift
+    packed = compiled[index].view(np.uint8).reshape(image.shape[0], image.shape[1], 4)
+    return np.ascontiguousarray(packed[..., :3])
+
+
+def identity_cube(size=33):
+    import numpy as np
+
+    levels = np.linspace(0.0, 1.0, size)
+    b, g, r = np.meshgrid(levels, levels, levels, indexing='ij')
+    rows = np.stack([r, g, b], axis=-1).reshape(-1, 3)
+    return f"LUT_3D_SIZE {size}\n" + "\n".join(f"{r:.6f} {g:.6f} {b:.6f}" for r, g, b in rows)
+
+
+def check_identity(apply):
+    """Largest difference between every 8-bit colour and itself through an identity LUT"""
+    import numpy as np
+    import luts
+
+    compiled = luts.compile_lut3d(luts.parse_cube(identity_cube()))
+    levels = np.arange(256, dtype=np.uint8)
+    colours = np.stack(np.meshgrid(levels, levels, levels, indexing='ij'), axis=-1).reshape(4096, 4096, 3)
+    return int(np.abs(apply(colours, compiled).astype(np.int16) - colours).max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    import luts
+    from image_effects import ImageEffects
+
+    strategies = {'nearest': apply_nearest, 'trilinear': luts.apply_lut3d}
+    compiled = luts.load_cube(CUBE_PATH)
+    results = {'identity_max_error': {}, 'cases': []}
+    with tempfile.TemporaryDirectory() as workdir:
+        for width, height in IMAGE_SIZES:
+            path = os.path.join(workdir, f'image_{width}x{height}.jpg')
+            make_image(path, width, height)
+            image = ImageEffects().load_image(path, full_resolution=True)
+            entry = {'size': f'{width}x{height}'}
+            line = f"{width:>5}x{height:<5}"
+            for strategy, apply in strategies.items():
+                times = []
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    apply(image, compiled)
+                    times.append(time.perf_counter() - start)
+                entry[strategy] = {'seconds': min(times)}
+                line += f"  {strategy} {min(times) * 1000:8.1f} ms"
+            results['cases'].append(entry)
+            print(line)
+
+    for strategy, apply in strategies.items():
+        error = check_identity(apply)
+        results['identity_max_error'][strategy] = error
+        print(f"identity LUT, {strategy}: largest error over all 2^24 colours {error} levels")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if results['identity_max_error']['trilinear']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
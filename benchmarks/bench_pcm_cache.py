@@ -0,0 +1,113 @@
+"""PCM cache benchmark: decoding an audio source on every use vs mapping its cached decode.
+
+For WAV and MP3 sources of several lengths, times three ways of getting
+the decoded samples as AudioProcessor does: pydub decoding the file (what
+every job did before the cache), a cache miss (decoding into the cache a
+block at a time) and a cache hit (mapping the entry). MP3 cases need
+ffmpeg; cases whose decoder is missing are reported as skipped. All files
+are written to a temporary directory.
+
+    python benchmarks/bench_pcm_cache.py [--repeat 3] [--durations 10,60,300] [--output results.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+warnings.filterwarnings('ignore', message="Couldn't find ffmpeg")
+
+from synthetic import make_segment  # noqa: E402
+
+DURATIONS = [10, 60, 300]
+FORMATS = ('wav', 'mp3')
+
+
+def load_pydub(processor, path):
+    return len(processor._decode_segment(path).raw_data)
+
+
+def load_miss(processor, path):
+    # A fresh cache folder per run, so every lookup misses
+    shutil.rmtree(processor.pcm_cache.cache_folder, ignore_errors=True)
+    processor.pcm_cache._keys.clear()
+    return processor.decoded_source(path).nbytes
+
+
+def load_hit(processor, path):
+    # Touch every page, as an effect render would
+    source = processor.decoded_source(path)
+    source.samples[::1024].sum()
+    return source.nbytes
+
+
+STRATEGIES = {'pydub': load_pydub, 'miss': load_miss, 'hit': load_hit}
+
+
+def measure(run, processor, path, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run(processor, path)
+        times.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run(processor, path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return min(times), peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--durations', help="Comma-separated clip lengths in seconds")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    from audio_processor import AudioProcessor
+    from pcm_cache import PCMCache
+
+    durations = [float(d) for d in args.durations.split(',')] if args.durations else DURATIONS
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        processor = AudioProcessor(os.path.join(workdir, 'audio'),
+                                   pcm_cache=PCMCache(os.path.join(workdir, 'pcm')))
+        for seconds in durations:
+            segment = make_segment(seconds)
+            for fmt in FORMATS:
+                path = os.path.join(workdir, f'source.{fmt}')
+                try:
+                    segment.export(path, format=fmt).close()
+                except Exception as e:
+                    print(f"{seconds:>5g}s {fmt}: skipped, cannot encode ({type(e).__name__})")
+                    continue
+
+                entry = {'duration_s': seconds, 'format': fmt}
+                line = f"{seconds:>5g}s {fmt:<4}"
+                for strategy, run in STRATEGIES.items():
+                    try:
+                        seconds_taken, peak = measure(run, processor, path, args.repeat)
+                    except Exception as e:
+                        entry[strategy] = None
+                        line += f"  {strategy} skipped ({type(e).__name__})"
+                        continue
+                    entry[strategy] = {'seconds': seconds_taken, 'peak_bytes': peak}
+                    line += f"  {strategy} {seconds_taken * 1000:8.1f} ms {peak / 2**20:6.1f} MB"
+                results.append(entry)
+                print(line)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
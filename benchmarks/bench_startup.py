@@ -0,0 +1,142 @@
+"""Startup benchmark: app factory time, memory and first request per subsystem.
+
+Builds the app in a fresh interpreter with lazily initialized subsystems
+(the default) and with LAZY_SUBSYSTEMS=0, then times the first request to
+each subsystem's page. Lazy startup moves the cost of importing cv2,
+pydub and the plotting stack from create_app() to the first request that
+needs it. All files are written to a temporary directory.
+
+    python benchmarks/bench_startup.py [--repeat 3] [--output results.json]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ('lazy', 'eager')
+
+# One page per subsystem, in the order a visitor might reach them
+FIRST_REQUESTS = [
+    ('gallery', '/gallery'),
+    ('effects', '/effects'),
+    ('audio', '/audio'),
+    ('visualization', '/visualization'),
+]
+
+HEAVY_MODULES = ('cv2', 'numpy', 'pydub', 'pandas', 'plotly', 'matplotlib', 'pygame', 'torch')
+
+
+def rss_kb():
+    """Current resident set size; falls back to the high-water mark off Linux"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def run_worker(mode, workdir):
+    start = time.perf_counter()
+    from app import create_app
+    import_seconds = time.perf_counter() - start
+
+    config = {
+        'LAZY_SUBSYSTEMS': mode == 'lazy',
+        'ARTWORK_FOLDER': os.path.join(workdir, 'artworks'),
+        'VISUALIZATION_FOLDER': os.path.join(workdir, 'visualizations'),
+        'AUDIO_FOLDER': os.path.join(workdir, 'audio'),
+        'THUMBNAIL_FOLDER': os.path.join(workdir, 'thumbnails'),
+        'BLOB_FOLDER': os.path.join(workdir, 'blobs'),
+        'RENDER_CACHE_FOLDER': os.path.join(workdir, 'renders'),
+        'PCM_CACHE_FOLDER': os.path.join(workdir, 'pcm'),
+        'ARTWORK_INDEX': os.path.join(workdir, 'artworks.sqlite3'),
+        'JOB_DATABASE': os.path.join(workdir, 'jobs.sqlite3'),
+    }
+    start = time.perf_counter()
+    app = create_app(config)
+    create_seconds = time.perf_counter() - start
+    startup_rss_kb = rss_kb()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    client = app.test_client()
+    first_requests = {}
+    for subsystem, path in FIRST_REQUESTS:
+        start = time.perf_counter()
+        status = client.get(path).status_code
+        first_requests[subsystem] = {'seconds': time.perf_counter() - start, 'status': status}
+
+    print(json.dumps({
+        'import_seconds': import_seconds,
+        'create_seconds': create_seconds,
+        'startup_rss_kb': startup_rss_kb,
+        'final_rss_kb': rss_kb(),
+        'heavy_modules_at_startup': loaded,
+        'first_requests': first_requests
+    }))
+
+
+def measure(mode):
+    with tempfile.TemporaryDirectory() as workdir:
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--worker', mode, workdir],
+            check=True, capture_output=True, text=True, cwd=ROOT,
+            env=dict(os.environ, PYGAME_HIDE_SUPPORT_PROMPT='1')
+        ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    parser.add_argument('--worker', nargs=2, metavar=('MODE', 'WORKDIR'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(*args.worker)
+        return
+
+    results = []
+    for mode in MODES:
+        runs = [measure(mode) for _ in range(args.repeat)]
+        result = {
+            'mode': mode,
+            'best_import_seconds': min(run['import_seconds'] for run in runs),
+            'best_create_seconds': min(run['create_seconds'] for run in runs),
+            'startup_rss_kb': min(run['startup_rss_kb'] for run in runs),
+            'final_rss_kb': min(run['final_rss_kb'] for run in runs),
+            'heavy_modules_at_startup': runs[0]['heavy_modules_at_startup'],
+            'first_requests': {
+                subsystem: {
+                    'best_seconds': min(run['first_requests'][subsystem]['seconds'] for run in runs),
+                    'status': runs[0]['first_requests'][subsystem]['status']
+                }
+                for subsystem, _ in FIRST_REQUESTS
+            }
+        }
+        results.append(result)
+
+        startup = result['best_import_seconds'] + result['best_create_seconds']
+        print(f"{mode:>6}: startup {startup * 1000:7.1f} ms  {result['startup_rss_kb'] / 1024:6.1f} MB RSS  "
+              f"(heavy modules: {', '.join(result['heavy_modules_at_startup']) or 'none'})")
+        for subsystem, first in result['first_requests'].items():
+            print(f"        first {subsystem:<14} {first['best_seconds'] * 1000:7.1f} ms  [{first['status']}]")
+        print(f"        after first requests    {result['final_rss_kb'] / 1024:6.1f} MB RSS")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
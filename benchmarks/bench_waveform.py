@@ -0,0 +1,111 @@
+"""Waveform benchmark: raw-sample JSON vs the binary peak pyramids of waveform.py.
+
+The JSON strategy writes what static/audio/waveforms used to hold: every
+sample of the (mono mixed) clip as a float in a JSON array. The peaks
+strategy runs WaveformStore.generate, one pass that writes every zoom
+level. For each, the benchmark reports the time to write the file, its
+size, the bytes a client downloads to draw a 1000-pixel-wide view and
+the time to parse them. All files are written to a temporary directory.
+
+    python benchmarks/bench_waveform.py [--repeat 3] [--durations 10,60,300] [--output results.json]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+warnings.filterwarnings('ignore', message="Couldn't find ffmpeg")
+
+from synthetic import make_segment  # noqa: E402
+
+DURATIONS = [10, 60, 300]
+VIEW_WIDTH = 1000
+
+
+def write_json(audio_folder, filename):
+    import numpy as np
+    from audio_engine import WavSource
+
+    with WavSource(os.path.join(audio_folder, filename)) as source:
+        samples = source.read(0, source.frames).mean(axis=1) / 32768.0
+    path = os.path.join(audio_folder, 'waveforms', f'{filename}.json')
+    with open(path, 'w') as f:
+        json.dump(np.asarray(samples, dtype=np.float64).tolist(), f)
+    return path
+
+
+def view_json(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    start = time.perf_counter()
+    json.loads(data)
+    return len(data), time.perf_counter() - start
+
+
+def view_peaks(path):
+    import numpy as np
+    from waveform import WaveformPeaks
+
+    _, _, data = WaveformPeaks(path).select(width=VIEW_WIDTH)
+    start = time.perf_counter()
+    np.frombuffer(data, dtype='<i2').reshape(-1, 2)
+    return len(data), time.perf_counter() - start
+
+
+def best_time(run, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = run()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--durations', help="Comma-separated clip lengths in seconds")
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    from waveform import WaveformStore
+
+    durations = [float(d) for d in args.durations.split(',')] if args.durations else DURATIONS
+    results = []
+    with tempfile.TemporaryDirectory() as audio_folder:
+        store = WaveformStore(audio_folder)
+        for seconds in durations:
+            filename = f'clip_{seconds:g}s.wav'
+            make_segment(seconds).export(os.path.join(audio_folder, filename), format='wav').close()
+
+            json_seconds, json_path = best_time(lambda: write_json(audio_folder, filename), args.repeat)
+            peaks_seconds, peaks_path = best_time(lambda: store.generate(filename), args.repeat)
+            json_view_bytes, json_parse = view_json(json_path)
+            peaks_view_bytes, peaks_parse = view_peaks(peaks_path)
+            entry = {
+                'duration_s': seconds,
+                'json': {'write_seconds': json_seconds, 'file_bytes': os.path.getsize(json_path),
+                         'view_bytes': json_view_bytes, 'parse_seconds': json_parse},
+                'peaks': {'write_seconds': peaks_seconds, 'file_bytes': os.path.getsize(peaks_path),
+                          'view_bytes': peaks_view_bytes, 'parse_seconds': peaks_parse}
+            }
+            results.append(entry)
+            for name in ('json', 'peaks'):
+                stats = entry[name]
+                print(f"{seconds:>5g}s {name:<5} write {stats['write_seconds'] * 1000:8.1f} ms  "
+                      f"file {stats['file_bytes'] / 1024:9.1f} KB  {VIEW_WIDTH}px view "
+                      f"{stats['view_bytes'] / 1024:9.1f} KB, parsed in {stats['parse_seconds'] * 1000:7.2f} ms")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
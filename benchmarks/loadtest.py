@@ -0,0 +1,350 @@
+"""End-to-end load test: drive a weighted mix of routes at several concurrency levels.
+
+Runs in-process against app.test_client() by default, or against a running
+server with --url. Every concurrency level runs closed-loop workers for a
+fixed duration, each picking the next request from the mix at random.
+
+    python benchmarks/loadtest.py [--concurrency 1,4,16] [--duration 20] [--output load.json]
+    python benchmarks/loadtest.py --url http://localhost:5000 --mix gallery=5,effects_get=3
+
+Reports throughput and p50/p95/p99 latency per route and level, and marks
+levels where throughput stopped growing while latency kept rising. Routes
+that queue a background job are measured end to end: the worker polls the
+job until it finishes, and a failed job counts as an error. Test images and
+audio are uploaded at the start and deleted at the end, once their jobs are
+done. In-process runs share the GIL with the app, so use --url to size a
+real deployment.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench_engines import environment  # noqa: E402
+from jobs import FINISHED_STATES, SUCCEEDED  # noqa: E402
+from synthetic import make_image, make_wav  # noqa: E402
+
+# Route weights of a browsing-heavy session
+DEFAULT_MIX = {
+    'gallery': 30,
+    'effects_get': 25,
+    'effects_post': 15,
+    'save_effect': 8,
+    'process_audio': 7,
+    'visualization': 15
+}
+SEED_IMAGE_SIZES = [(1920, 1080), (4000, 3000)]
+AUDIO_SECONDS = 10
+PREVIEW_EFFECTS = ['grayscale', 'sepia', 'pixelate', 'blur', 'gamma', 'curves', 'posterize', 'duotone']
+# Between levels, a p95 rise above this with a throughput gain below SATURATION_GAIN marks a cliff
+CLIFF_LATENCY_RATIO = 1.5
+SATURATION_GAIN = 1.1
+JOB_POLL_SECONDS = 0.05
+JOB_TIMEOUT_SECONDS = 300
+
+
+class InProcessClient:
+    """Flask test client with the (status, body) interface of HttpClient"""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, data=None, files=None, headers=None):
+        if files:
+            data = dict(data or {})
+            for name, (filename, content, mimetype) in files.items():
+                data[name] = (io.BytesIO(content), filename, mimetype)
+        response = self.client.open(path, method=method, data=data, headers=headers or {})
+        body = response.get_data()
+        response.close()
+        return response.status_code, body
+
+
+class HttpClient:
+    """Keep-alive HTTP client for one worker thread"""
+
+    def __init__(self, base_url):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, data=None, files=None, headers=None):
+        response = self.session.request(method, self.base_url + path, data=data, files=files,
+                                        headers=headers, allow_redirects=False, timeout=120)
+        return response.status_code, response.content
+
+
+class Scenario:
+    """The requests of the mix, against a set of seeded images and a test tone"""
+
+    def __init__(self, images, audio_bytes):
+        self.images = images
+        self.audio_bytes = audio_bytes
+        self.saved = set()
+        self.uploaded_audio = set()
+        self.pending_jobs = set()  # Status URLs of jobs not seen finishing yet
+        self._lock = threading.Lock()
+        self._counter = 0
+
+    def gallery(self, client, rng):
+        return client.request('GET', '/gallery')
+
+    def effects_get(self, client, rng):
+        return client.request('GET', f'/effects/{rng.choice(self.images)}')
+
+    def effects_post(self, client, rng):
+        effects = rng.sample(PREVIEW_EFFECTS, rng.randint(1, 3))
+        return client.request('POST', f'/effects/{rng.choice(self.images)}', data={'effects': effects})
+
+    def save_effect(self, client, rng):
+        status, body = client.request('POST', f'/save_effect/{rng.choice(self.images)}',
+                                      data={'effect_name': rng.choice(PREVIEW_EFFECTS)},
+                                      headers={'Accept': 'application/json'})
+        if status == 200:
+            with self._lock:
+                self.saved.add(json.loads(body)['filename'])
+        return status, body
+
+    def process_audio(self, client, rng):
+        with self._lock:
+            self._counter += 1
+            filename = f'loadtest_{os.getpid()}_{self._counter}.wav'
+            self.uploaded_audio.add(filename)
+        status, body = client.request('POST', '/process_audio',
+                                      data={'speed': '1.25', 'fade_in': '500', 'fade_out': '500', 'volume': '2'},
+                                      files={'file': (filename, self.audio_bytes, 'audio/wav')},
+                                      headers={'Accept': 'application/json'})
+        if status != 202:
+            return status, body
+        return self.finish_job(client, json.loads(body)['status_url'])
+
+    def finish_job(self, client, status_url):
+        """Wait for a queued job: 200 once it succeeds, 500 if it failed or was cancelled, 504 on timeout"""
+        with self._lock:
+            self.pending_jobs.add(status_url)
+        job = wait_for_job(client, status_url)
+        if job is None:
+            return 504, b''
+        with self._lock:
+            self.pending_jobs.discard(status_url)
+        return (200 if job['status'] == SUCCEEDED else 500), json.dumps(job).encode()
+
+    def visualization(self, client, rng):
+        return client.request('GET', '/visualization')
+
+
+def wait_for_job(client, status_url, timeout=JOB_TIMEOUT_SECONDS):
+    """Poll a job's status URL until it finishes and return the job, or None after timeout seconds"""
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        status, body = client.request('GET', status_url, headers={'Accept': 'application/json'})
+        if status == 200:
+            job = json.loads(body)
+            if job['status'] in FINISHED_STATES:
+                return job
+        time.sleep(JOB_POLL_SECONDS)
+    return None
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(route, samples, elapsed):
+    latencies = sorted(latency for latency, _ in samples)
+    statuses = [status for _, status in samples]
+    return {
+        'route': route,
+        'requests': len(samples),
+        'errors': sum(1 for status in statuses if status >= 400 and status != 503),
+        'shed': statuses.count(503),
+        'throughput_rps': len(samples) / elapsed if elapsed else 0.0,
+        'p50_ms': percentile(latencies, 0.50) * 1000 if latencies else None,
+        'p95_ms': percentile(latencies, 0.95) * 1000 if latencies else None,
+        'p99_ms': percentile(latencies, 0.99) * 1000 if latencies else None,
+        'max_ms': latencies[-1] * 1000 if latencies else None
+    }
+
+
+def run_level(make_client, scenario, mix, concurrency, duration, seed):
+    """Run `concurrency` closed-loop workers for `duration` seconds and return per-route summaries"""
+    routes = list(mix)
+    weights = [mix[route] for route in routes]
+    samples = {route: [] for route in routes}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+    failures = []
+
+    def worker(index):
+        rng = random.Random(seed * 1000 + index)
+        client = make_client()
+        while time.perf_counter() < deadline:
+            route = rng.choices(routes, weights)[0]
+            start = time.perf_counter()
+            try:
+                status, _ = getattr(scenario, route)(client, rng)
+            except Exception as e:
+                failures.append(f"{route}: {e}")
+                status = 599
+            latency = time.perf_counter() - start
+            with lock:
+                samples[route].append((latency, status))
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    for failure in failures[:5]:
+        print(f"  request failed: {failure}")
+    summaries = [summarize(route, route_samples, elapsed) for route, route_samples in samples.items()]
+    summaries.append(summarize('all', [s for route_samples in samples.values() for s in route_samples], elapsed))
+    return summaries
+
+
+def print_level(concurrency, summaries):
+    print(f"\nconcurrency {concurrency}")
+    print(f"  {'route':<15} {'reqs':>6} {'err':>4} {'503':>4} {'req/s':>8} "
+          f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for s in summaries:
+        if not s['requests']:
+            continue
+        print(f"  {s['route']:<15} {s['requests']:>6} {s['errors']:>4} {s['shed']:>4} {s['throughput_rps']:>8.1f} "
+              f"{s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}")
+
+
+def find_cliffs(levels):
+    """Levels where total throughput stopped growing but p95 latency still rose sharply"""
+    cliffs = []
+    for previous, current in zip(levels, levels[1:]):
+        before = next(s for s in previous['routes'] if s['route'] == 'all')
+        after = next(s for s in current['routes'] if s['route'] == 'all')
+        if not before['requests'] or not after['requests']:
+            continue
+        gain = after['throughput_rps'] / before['throughput_rps'] if before['throughput_rps'] else 0.0
+        latency_ratio = after['p95_ms'] / before['p95_ms'] if before['p95_ms'] else 0.0
+        if gain < SATURATION_GAIN and latency_ratio > CLIFF_LATENCY_RATIO:
+            cliffs.append({'from': previous['concurrency'], 'to': current['concurrency'],
+                           'throughput_gain': gain, 'p95_ratio': latency_ratio})
+    return cliffs
+
+
+def parse_mix(text):
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(','):
+        route, _, weight = part.partition('=')
+        route = route.strip()
+        if route not in DEFAULT_MIX:
+            raise ValueError(f"Unknown route in mix: {route} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[route] = float(weight) if weight else 1.0
+    return mix
+
+
+def seed_content(client, workdir):
+    """Upload the test images and return their gallery names, plus the WAV bytes for audio requests"""
+    images = []
+    for width, height in SEED_IMAGE_SIZES:
+        path = os.path.join(workdir, f'loadtest_{width}x{height}.jpg')
+        make_image(path, width, height, seed=int(time.time()))
+        with open(path, 'rb') as f:
+            status, body = client.request('POST', '/upload-artwork?origin=upload',
+                                          files={'file': (os.path.basename(path), f.read(), 'image/jpeg')})
+        if status != 201:
+            raise RuntimeError(f"Seeding {path} failed with {status}: {body[:200]!r}")
+        images.append(json.loads(body)['filename'])
+
+    audio_path = os.path.join(workdir, 'loadtest_tone.wav')
+    make_wav(audio_path, AUDIO_SECONDS)
+    with open(audio_path, 'rb') as f:
+        audio_bytes = f.read()
+    return images, audio_bytes
+
+
+def clean_up(client, scenario):
+    # Deleting an upload while its job is queued would fail the job and leave its preview behind
+    for status_url in list(scenario.pending_jobs):
+        if wait_for_job(client, status_url) is None:
+            print(f"  job {status_url} did not finish within {JOB_TIMEOUT_SECONDS}s")
+    for filename in set(scenario.images) | scenario.saved:
+        client.request('POST', f'/delete_artwork/{filename}')
+    for filename in scenario.uploaded_audio:
+        client.request('GET', f'/delete_audio/{filename}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help="Base URL of a running server (default: in-process test client)")
+    parser.add_argument('--concurrency', default='1,4,16', help="Comma-separated worker counts, one level each")
+    parser.add_argument('--duration', type=float, default=20.0, help="Seconds per concurrency level")
+    parser.add_argument('--mix', help=f"Route weights as route=weight,... (routes: {', '.join(DEFAULT_MIX)})")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Write the results as JSON to this file")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+        levels = [int(level) for level in args.concurrency.split(',')]
+    except ValueError as e:
+        parser.error(str(e))
+    output = os.path.abspath(args.output) if args.output else None
+
+    if args.url:
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+        os.chdir(ROOT)
+        from app import create_app
+
+        flask_app = create_app()
+
+        def make_client():
+            return InProcessClient(flask_app)
+
+    setup_client = make_client()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        images, audio_bytes = seed_content(setup_client, workdir)
+        scenario = Scenario(images, audio_bytes)
+        try:
+            for concurrency in levels:
+                summaries = run_level(make_client, scenario, mix, concurrency, args.duration, args.seed)
+                print_level(concurrency, summaries)
+                results.append({'concurrency': concurrency, 'duration_s': args.duration, 'routes': summaries})
+        finally:
+            clean_up(setup_client, scenario)
+
+    cliffs = find_cliffs(results)
+    for cliff in cliffs:
+        print(f"\nLatency cliff between concurrency {cliff['from']} and {cliff['to']}: "
+              f"throughput x{cliff['throughput_gain']:.2f}, p95 x{cliff['p95_ratio']:.2f}")
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump({'environment': environment(), 'date': datetime.now().isoformat(timespec='seconds'),
+                       'target': args.url or 'in-process', 'mix': mix, 'levels': results, 'cliffs': cliffs},
+                      f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
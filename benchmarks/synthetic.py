@@ -0,0 +1,49 @@
+"""Synthetic inputs shared by the benchmark scripts, generated locally and deterministic per seed."""
+import wave
+
+FRAME_RATE = 44100
+
+
+def make_image(path, width, height, seed=0):
+    """Write a synthetic photo-like JPEG (gradients plus noise) of the given size"""
+    import numpy as np
+    from PIL import Image
+
+    rng = np.random.default_rng(seed + width * height)
+    x = np.linspace(0, 255, width, dtype=np.float32)
+    y = np.linspace(0, 255, height, dtype=np.float32)[:, None]
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[..., 0] = (x + y) / 2
+    image[..., 1] = x[::-1] * 0.6 + y * 0.4
+    image[..., 2] = np.abs(x - y)
+    image += rng.integers(0, 24, size=(height, width, 1), dtype=np.uint8)
+    Image.fromarray(image).save(path, 'JPEG', quality=92)
+
+
+def make_pcm(seconds, seed=0, frame_rate=FRAME_RATE, channels=2):
+    """16-bit (frames, channels) samples of a few detuned sines plus noise"""
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * frame_rate)) / frame_rate
+    signal = sum(np.sin(2 * np.pi * freq * t) for freq in rng.uniform(110, 880, size=3)) / 4
+    samples = np.stack([signal] * channels, axis=1) + rng.normal(0, 0.02, size=(len(t), channels))
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2')
+
+
+def make_wav(path, seconds, seed=0, frame_rate=FRAME_RATE, channels=2):
+    """Write make_pcm's samples as a WAV file"""
+    pcm = make_pcm(seconds, seed, frame_rate, channels)
+    with wave.open(path, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(frame_rate)
+        f.writeframes(pcm.tobytes())
+
+
+def make_segment(seconds, seed=0, frame_rate=FRAME_RATE, channels=2):
+    """make_pcm's samples as a pydub AudioSegment"""
+    from pydub import AudioSegment
+
+    pcm = make_pcm(seconds, seed, frame_rate, channels)
+    return AudioSegment(data=pcm.tobytes(), sample_width=2, frame_rate=frame_rate, channels=channels)
@@ -0,0 +1,98 @@
+import base64
+from datetime import datetime
+
+from flask import Blueprint, redirect, render_template, request, url_for
+from werkzeug.exceptions import HTTPException
+
+from gallery_routes import is_raw_image_upload, stream_upload
+from services import get_services
+from system_routes import submit_job
+
+
+bp = Blueprint('draw', __name__)
+
+
+@bp.route('/draw')
+def draw():
+    # pygame is only imported once someone opens the desktop drawing tool
+    from drawing_tool import DrawingTool
+
+    services = get_services()
+    drawing_tool = DrawingTool()
+    image_data = drawing_tool.run_tool()
+
+    if image_data is None:
+        return render_template('index.html')
+
+    if ',' in image_data:
+        image_data = image_data.split(',')[1]
+
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    filename = services.artwork_store.save_bytes(base64.b64decode(image_data), f'drawing_{timestamp}.png')
+    services.on_artwork_written(filename, 'drawing')
+
+    return redirect(url_for('gallery.gallery'))
+
+@bp.route('/free-draw')
+def free_draw():
+    return render_template('free_draw.html')
+
+@bp.route('/save-drawing', methods=['POST'])
+def save_drawing():
+    services = get_services()
+    try:
+        if is_raw_image_upload():
+            # Canvas blobs are streamed to disk instead of arriving as a base64 form field
+            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+            return stream_upload(request.stream, f'drawing_{timestamp}.png', 'drawing')
+
+        image_data = request.form.get('image')
+        if not image_data:
+            return "No image data received", 400
+
+        if ',' in image_data:
+            image_data = image_data.split(',')[1]
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        filename = services.artwork_store.save_bytes(base64.b64decode(image_data), f'drawing_{timestamp}.png')
+        services.on_artwork_written(filename, 'drawing')
+
+        return redirect(url_for('gallery.gallery'))
+    except HTTPException:
+        # e.g. 413 for a body over MAX_CONTENT_LENGTH, raised while it is read
+        raise
+    except Exception as e:
+        return f"Error saving drawing: {str(e)}", 500
+
+@bp.route('/generate_turtle_art')
+def generate_turtle_art():
+    try:
+        print("Queueing turtle art generation...")
+        return submit_job('generate', {'style': 'turtle'}, next_url=url_for('gallery.gallery'), priority=10)
+    except Exception as e:
+        print(f"Error in /generate_turtle_art: {e}")
+        return f"Error: {e}", 500
+
+@bp.route('/generate_pygame_art')
+def generate_pygame_art():
+    try:
+        print("Queueing pygame art generation...")
+        return submit_job('generate', {'style': 'pygame'}, next_url=url_for('gallery.gallery'), priority=10)
+    except Exception as e:
+        print(f"Error in /generate_pygame_art: {e}")
+        return f"Error: {e}", 500
+
+
+def run_generate_job(services, job):
+    from generative import pygame_art_image, turtle_art_image
+
+    generators = {'turtle': turtle_art_image, 'pygame': pygame_art_image}
+    job.check_cancelled()
+    filename = generators[job.params['style']](services.config['ARTWORK_FOLDER'], store=services.artwork_store,
+                                               cancelled=job.cancel_requested)
+    if filename is None:
+        # Stopped before saving anything
+        job.check_cancelled()
+        raise RuntimeError(f"{job.params['style']} art generation failed")
+    services.on_artwork_written(filename, 'generated')
+    return {'filename': filename, 'static_path': f'gallery/artworks/{filename}'}
@@ -0,0 +1,369 @@
+import json
+import os
+import traceback
+from datetime import datetime
+from io import BytesIO
+
+from flask import (Blueprint, Response, current_app, jsonify, redirect, render_template, request, send_file,
+                   stream_with_context, url_for)
+from werkzeug.utils import secure_filename
+
+from admission import AdmissionRejected
+from gallery_routes import allowed_file, allowed_image_extension
+from services import get_services
+from system_routes import overloaded_response
+
+
+bp = Blueprint('effects', __name__)
+
+
+def new_effects_processor():
+    # cv2 and numpy are imported with the first effects request rather than at startup
+    from image_effects import ImageEffects
+
+    return ImageEffects()
+
+@bp.route('/effects', methods=['GET', 'POST'])
+def effects_page():
+    """Show the effects page with available images and handle uploads"""
+    services = get_services()
+    message = None
+
+    if request.method == 'POST':
+        # Check if a file was uploaded
+        if 'file' not in request.files:
+            message = "No file selected"
+            return redirect(request.url)
+
+        file = request.files['file']
+
+        if file.filename == '':
+            message = "No file selected"
+            return redirect(request.url)
+
+        if file and allowed_file(file.filename):
+            # Secure the filename
+            filename = secure_filename(file.filename)
+            # Add timestamp to filename to make it unique
+            filename = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{filename}"
+
+            try:
+                # Validate on the first chunk while streaming the image into the store
+                filename = services.artwork_store.save_stream(file.stream, filename, validate=allowed_image_extension)
+                services.on_artwork_written(filename, 'upload')
+                # Redirect to effects selection page for this image
+                return redirect(url_for('effects.image_effects', image_name=filename))
+            except ValueError as e:
+                message = str(e)
+                return redirect(request.url)
+            except Exception as e:
+                message = f"Error saving file: {str(e)}"
+                return redirect(request.url)
+        else:
+            message = "Invalid file type. Allowed types: PNG, JPG, JPEG, GIF, WEBP"
+            return redirect(request.url)
+
+    # Get list of available images
+    artwork_files = services.artwork_index.list_filenames()
+
+    # Get available effects list
+    effects_processor = new_effects_processor()
+    effects_list = {
+        name: {
+            'title': name.capitalize(),
+            'description': effect_data['description']
+        }
+        for name, effect_data in effects_processor.effects.items()
+    }
+
+    return render_template('effects_select.html',
+                           images=artwork_files,
+                           effects=effects_list,
+                           message=message)
+
+@bp.route('/effects/<image_name>', methods=['GET', 'POST'])
+def image_effects(image_name):
+    """Apply effects to a specific image"""
+    services = get_services()
+    try:
+        image_path = os.path.join(current_app.config['ARTWORK_FOLDER'], image_name)
+        print(f"Processing image: {image_path}")
+
+        if not os.path.exists(image_path):
+            print(f"Image not found: {image_path}")
+            return "Image not found", 404
+
+        effects_processor = new_effects_processor()
+
+        if request.method == 'POST':
+            # Get selected effects from form
+            selected_effects = request.form.getlist('effects')
+            # An optional chain such as "blur+sepia+pixelate" is rendered as one pipeline
+            pipeline_spec = request.form.get('pipeline', '').replace(' ', '')
+            if pipeline_spec:
+                selected_effects.append(pipeline_spec)
+            if not selected_effects:
+                selected_effects = ['original']
+        else:
+            # On GET request, just show original image and effects selection
+            selected_effects = ['original']
+
+        # Render into the cache up front so the browser's image requests are cache hits
+        effect_names = [name for name in dict.fromkeys(selected_effects)
+                        if effects_processor.has_effect(name)]
+        all_effects = {}
+        for effect_name, entry in effects_processor.render_cached(image_path, effect_names, services.render_cache,
+                                                                  admission=services.memory_budget):
+            if isinstance(entry, Exception):
+                print(f"Error processing {effect_name} effect: {str(entry)}")
+                continue
+            all_effects[effect_name] = {
+                'url': url_for('effects.effect_render', image_name=image_name, effect_name=effect_name,
+                               extension=entry['extension']),
+                **effects_processor.effect_info(effect_name)
+            }
+
+        if not all_effects:
+            return "Error processing image effects", 500
+
+        # Get list of available effects for the form
+        available_effects = {
+            name: {
+                'title': name.capitalize(),
+                'description': effect_data['description']
+            }
+            for name, effect_data in effects_processor.effects.items()
+        }
+
+        return render_template('effects.html',
+                               effects=all_effects,
+                               available_effects=available_effects,
+                               original_image=image_name)
+
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+    except Exception as e:
+        print(f"Error in image_effects: {str(e)}")
+        traceback.print_exc()
+        return f"Error processing image: {str(e)}", 500
+
+@bp.route('/effects/<image_name>/<effect_name>.<extension>')
+def effect_render(image_name, effect_name, extension):
+    """Serve a rendered effect preview from the render cache with conditional GET support"""
+    services = get_services()
+    image_path = os.path.join(current_app.config['ARTWORK_FOLDER'], image_name)
+    if not os.path.exists(image_path):
+        return "Image not found", 404
+
+    effects_processor = new_effects_processor()
+    if not effects_processor.has_effect(effect_name):
+        return "Unknown effect", 404
+    # Each render has one URL, with the extension it is encoded as
+    if extension != effects_processor.output_format(image_path)[0]:
+        return "Unknown render format", 404
+
+    try:
+        [(_, entry)] = effects_processor.render_cached(image_path, [effect_name], services.render_cache,
+                                                       admission=services.memory_budget)
+        if isinstance(entry, Exception):
+            raise entry
+
+        # The cache key covers the source and the render settings, so it is a strong validator
+        response = send_file(entry['path'],
+                             mimetype=entry['mimetype'],
+                             etag=entry['key'],
+                             last_modified=os.path.getmtime(image_path),
+                             max_age=0,
+                             conditional=True)
+
+        # Expose per-stage timings of freshly rendered pipelines to the browser dev tools
+        pipeline = effects_processor.get_pipeline(effect_name) if effect_name not in effects_processor.effects else None
+        if pipeline is not None and pipeline.timings:
+            response.headers['Server-Timing'] = ', '.join(
+                f"stage{i};desc=\"{label}\";dur={seconds * 1000:.2f}"
+                for i, (label, seconds) in enumerate(pipeline.timings))
+        return response
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+    except Exception as e:
+        print(f"Error rendering {effect_name} for {image_name}: {str(e)}")
+        return f"Error rendering effect: {str(e)}", 500
+
+@bp.route('/effects/cache_stats')
+def effects_cache_stats():
+    """Report hit/miss counters of the decoded image cache"""
+    from image_effects import decoded_image_cache
+
+    return jsonify({
+        'decoded_images': decoded_image_cache.stats(),
+        'renders': get_services().render_cache.stats()
+    })
+
+def save_rendered_effect(image_name, effect_name, full_resolution=False):
+    """Render an effect from the original artwork and write it straight to the gallery"""
+    services = get_services()
+    image_path = os.path.join(current_app.config['ARTWORK_FOLDER'], image_name)
+    if not os.path.exists(image_path):
+        return jsonify({
+            'success': False,
+            'message': 'Image not found'
+        }), 404
+
+    effects_processor = new_effects_processor()
+    if not effects_processor.has_effect(effect_name):
+        return jsonify({
+            'success': False,
+            'message': f"Unknown effect: {effect_name}"
+        }), 400
+
+    new_filename = effects_processor.save_rendered_effect(
+        image_path,
+        effect_name,
+        current_app.config['ARTWORK_FOLDER'],
+        render_cache=services.render_cache,
+        full_resolution=full_resolution,
+        store=services.artwork_store,
+        admission=services.memory_budget
+    )
+    services.on_artwork_written(new_filename, 'effect')
+    print(f"Successfully saved image to: {os.path.join(current_app.config['ARTWORK_FOLDER'], new_filename)}")
+    return jsonify({
+        'success': True,
+        'message': 'Image saved successfully',
+        'filename': new_filename
+    })
+
+@bp.route('/save_effect/<image_name>', methods=['POST'])
+def save_effect(image_name):
+    """Save a processed effect as a new image in the gallery"""
+    services = get_services()
+    try:
+        # Get the base64 image and effect name from the form
+        base64_image = request.form.get('image_data')
+        effect_name = request.form.get('effect_name')
+
+        if not effect_name:
+            print("Missing data - Effect name not provided")
+            return jsonify({
+                'success': False,
+                'message': "Missing image data or effect name"
+            }), 400
+
+        # Ensure ARTWORK_FOLDER exists
+        if not os.path.exists(current_app.config['ARTWORK_FOLDER']):
+            os.makedirs(current_app.config['ARTWORK_FOLDER'])
+            print(f"Created artwork folder: {current_app.config['ARTWORK_FOLDER']}")
+
+        if not base64_image:
+            # Server-side save: re-render from the original instead of trusting a browser copy
+            return save_rendered_effect(image_name, effect_name,
+                                        full_resolution=request.form.get('full_resolution') in ('1', 'true', 'on'))
+
+        # Extract the base64 data after the comma
+        try:
+            base64_data = base64_image.split(',')[1]
+        except IndexError:
+            base64_data = base64_image
+
+        effects_processor = new_effects_processor()
+        new_filename, image = effects_processor.save_processed_image(
+            base64_data,
+            image_name,
+            effect_name
+        )
+
+        if not new_filename or not image:
+            print("Failed to process image - new_filename or image is None")
+            return jsonify({
+                'success': False,
+                'message': 'Failed to process image'
+            }), 500
+
+        try:
+            buffer = BytesIO()
+            image.save(buffer, 'JPEG', quality=85, optimize=True)
+            new_filename = services.artwork_store.save_bytes(buffer.getvalue(), new_filename, overwrite=True)
+            save_path = os.path.join(current_app.config['ARTWORK_FOLDER'], new_filename)
+            services.on_artwork_written(new_filename, 'effect')
+            print(f"Successfully saved image to: {save_path}")
+
+            # Verify file exists after saving
+            if os.path.exists(save_path):
+                print(f"Verified file exists at: {save_path}")
+                return jsonify({
+                    'success': True,
+                    'message': 'Image saved successfully',
+                    'filename': new_filename
+                })
+            else:
+                print(f"File not found after saving: {save_path}")
+                return jsonify({
+                    'success': False,
+                    'message': 'File not found after saving'
+                }), 500
+
+        except Exception as save_error:
+            print(f"Error saving file to disk: {str(save_error)}")
+            return jsonify({
+                'success': False,
+                'message': f"Error saving file: {str(save_error)}"
+            }), 500
+
+    except AdmissionRejected as e:
+        return overloaded_response(e)
+    except Exception as e:
+        print(f"Error in save_effect route: {str(e)}")
+        return jsonify({
+            'success': False,
+            'message': f"Error saving image: {str(e)}"
+        }), 500
+
+@bp.route('/effects/batch', methods=['POST'])
+def batch_effects():
+    """Apply one effect or pipeline to many gallery images, streaming progress as NDJSON or SSE"""
+    services = get_services()
+    params = request.get_json(silent=True) or request.form
+    effect_name = params.get('effect', '')
+    full_resolution = str(params.get('full_resolution', '')).lower() in ('1', 'true', 'on')
+
+    if not new_effects_processor().has_effect(effect_name):
+        return jsonify({'error': f"Unknown effect: {effect_name}"}), 400
+
+    if str(params.get('all', '')).lower() in ('1', 'true', 'on'):
+        image_names = services.artwork_index.list_filenames()
+    elif isinstance(params.get('images'), list):
+        image_names = params['images']
+    else:
+        image_names = request.form.getlist('images')
+
+    image_paths = []
+    missing = []
+    for image_name in dict.fromkeys(image_names):
+        image_path = os.path.join(current_app.config['ARTWORK_FOLDER'], secure_filename(image_name))
+        if os.path.isfile(image_path):
+            image_paths.append(image_path)
+        else:
+            missing.append(image_name)
+
+    if not image_paths and not missing:
+        return jsonify({'error': 'No images selected'}), 400
+
+    use_sse = request.accept_mimetypes.best == 'text/event-stream'
+
+    def format_record(record):
+        if use_sse:
+            return f"data: {json.dumps(record)}\n\n"
+        return json.dumps(record) + "\n"
+
+    artwork_folder = current_app.config['ARTWORK_FOLDER']
+
+    def generate():
+        for record in services.batch_processor.run(image_paths, effect_name, artwork_folder,
+                                                   full_resolution=full_resolution, missing=missing):
+            if record.get('status') == 'ok':
+                services.on_artwork_written(record['filename'], 'effect')
+            yield format_record(record)
+
+    return Response(stream_with_context(generate()),
+                    mimetype='text/event-stream' if use_sse else 'application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,203 @@
+import imghdr
+import os
+from datetime import datetime
+
+from flask import Blueprint, current_app, jsonify, redirect, render_template, request, send_file, url_for
+from werkzeug.utils import secure_filename
+
+from artwork_index import ORIGINS, decode_cursor, encode_cursor
+from services import get_services
+
+
+bp = Blueprint('gallery', __name__)
+
+GALLERY_PAGE_SIZE = 24
+MAX_GALLERY_PAGE_SIZE = 100
+
+# Format filters accept file extensions as well as Pillow format names
+FORMAT_ALIASES = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'gif': 'GIF', 'webp': 'WEBP'}
+
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+
+
+def image_extension(header):
+    """Detect the image type from the first bytes of a file and return its extension"""
+    format = imghdr.what(None, header)
+    if not format:
+        return None
+    return '.' + format if format != 'jpeg' else '.jpg'
+
+def allowed_file(filename):
+    return '.' in filename and \
+        filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+
+def allowed_image_extension(header):
+    """Extension for an upload's first chunk, or None unless it is an allowed image type"""
+    extension = image_extension(header)
+    if extension and extension[1:] in ALLOWED_EXTENSIONS:
+        return extension
+    return None
+
+def is_raw_image_upload():
+    """True when the request body is the image itself rather than a form"""
+    return request.mimetype.startswith('image/') or request.mimetype == 'application/octet-stream'
+
+def stream_upload(stream, filename, origin):
+    """Stream an uploaded image into the gallery and answer with its name as JSON"""
+    services = get_services()
+    try:
+        filename = services.artwork_store.save_stream(stream, filename, validate=allowed_image_extension)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    services.on_artwork_written(filename, origin)
+    return jsonify({
+        'success': True,
+        'filename': filename,
+        'url': url_for('static', filename='gallery/artworks/' + filename)
+    }), 201
+
+def gallery_filters(args):
+    """Read the origin and format filters shared by the gallery page and the artworks API"""
+    origin = args.get('origin') or None
+    if origin is not None and origin not in ORIGINS:
+        raise ValueError(f"Unknown origin: {origin}")
+
+    formats = []
+    for name in filter(None, args.get('format', '').lower().split(',')):
+        if name not in FORMAT_ALIASES:
+            raise ValueError(f"Unknown format: {name}")
+        formats.append(FORMAT_ALIASES[name])
+    return origin, tuple(dict.fromkeys(formats))
+
+def artwork_record(row):
+    """Small JSON-friendly description of one artwork, including its thumbnail srcsets"""
+    filename = row['filename']
+    sizes = get_services().thumbnail_store.sizes
+    return {
+        'filename': filename,
+        'width': row['width'],
+        'height': row['height'],
+        'format': row['format'],
+        'origin': row['origin'],
+        'mtime': row['mtime_ns'] // 1_000_000_000,
+        'url': url_for('static', filename='gallery/artworks/' + filename),
+        'src': url_for('gallery.thumbnail', size=sizes[len(sizes) // 2], artwork=filename, extension='jpg'),
+        'srcset': {
+            extension: ', '.join(
+                f"{url_for('gallery.thumbnail', size=size, artwork=filename, extension=extension)} {size}w"
+                for size in sizes)
+            for extension in ('webp', 'jpg')
+        },
+        'effects_url': url_for('effects.image_effects', image_name=filename),
+        'delete_url': url_for('gallery.delete_artwork', artwork=filename)
+    }
+
+@bp.route('/')
+def welcome():
+    return render_template('welcome.html')
+
+@bp.route('/home')
+def home():
+    return render_template('index.html')
+
+@bp.route('/gallery')
+def gallery():
+    try:
+        origin, formats = gallery_filters(request.args)
+        # Only the first page is rendered; the rest is fetched from /api/artworks while scrolling
+        rows, next_key = get_services().artwork_index.page(GALLERY_PAGE_SIZE, formats=formats, origin=origin)
+
+        api_args = {key: request.args[key] for key in ('origin', 'format') if request.args.get(key)}
+        return render_template('gallery.html',
+                               artworks=[artwork_record(row) for row in rows],
+                               next_cursor=encode_cursor(next_key) if next_key else None,
+                               api_url=url_for('gallery.api_artworks', limit=GALLERY_PAGE_SIZE, **api_args))
+    except ValueError as e:
+        return str(e), 400
+    except Exception as e:
+        print(f"Error in gallery route: {str(e)}")
+        return f"Error loading gallery: {str(e)}", 500
+
+@bp.route('/api/artworks')
+def api_artworks():
+    """One page of artworks, newest first, with an opaque cursor for the next page"""
+    try:
+        origin, formats = gallery_filters(request.args)
+        limit = min(max(request.args.get('limit', GALLERY_PAGE_SIZE, type=int), 1), MAX_GALLERY_PAGE_SIZE)
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    rows, next_key = get_services().artwork_index.page(limit, after=after, formats=formats, origin=origin)
+    return jsonify({
+        'artworks': [artwork_record(row) for row in rows],
+        'next_cursor': encode_cursor(next_key) if next_key else None
+    })
+
+@bp.route('/thumbs/<int:size>/<artwork>.<extension>')
+def thumbnail(size, artwork, extension):
+    """Serve one thumbnail of an artwork, building it first if it is missing or stale"""
+    thumbnail_store = get_services().thumbnail_store
+    artwork = secure_filename(artwork)
+    image_path = os.path.join(current_app.config['ARTWORK_FOLDER'], artwork)
+    if not os.path.exists(image_path):
+        return "Image not found", 404
+
+    try:
+        thumbnail_path = thumbnail_store.ensure(artwork, size, extension)
+    except ValueError as e:
+        return str(e), 404
+    except Exception as e:
+        print(f"Error generating thumbnail for {artwork}: {str(e)}")
+        return f"Error generating thumbnail: {str(e)}", 500
+
+    return send_file(thumbnail_path,
+                     mimetype=thumbnail_store.mimetype(extension),
+                     max_age=0,
+                     conditional=True)
+
+@bp.route('/delete_artwork/<artwork>', methods=['POST'])
+def delete_artwork(artwork):
+    """Delete an artwork file from the gallery"""
+    services = get_services()
+    try:
+        if artwork.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.webp')):
+            filepath = os.path.join(current_app.config['ARTWORK_FOLDER'], artwork)
+            if os.path.exists(filepath):
+                services.artwork_store.delete(artwork)
+                services.artwork_index.remove(artwork)
+                services.thumbnail_store.remove(artwork)
+                print(f"Successfully deleted {filepath}")
+                return redirect(url_for('gallery.gallery'))
+            else:
+                # Drop a stale index entry for a file that was removed behind our back
+                services.artwork_index.remove(artwork)
+                print(f"File not found: {filepath}")
+                return "File not found", 404
+        else:
+            return "Invalid file type", 400
+    except Exception as e:
+        print(f"Error deleting artwork: {str(e)}")
+        return f"Error deleting file: {str(e)}", 500
+
+@bp.route('/upload-artwork', methods=['POST'])
+def upload_artwork():
+    """Stream a raw image body or a multipart file into the gallery without buffering it in memory"""
+    origin = request.args.get('origin', 'upload')
+    if origin not in ORIGINS:
+        return jsonify({'success': False, 'message': f"Unknown origin: {origin}"}), 400
+
+    if request.mimetype == 'multipart/form-data':
+        # Werkzeug spools multipart files to disk past a small in-memory threshold
+        file = request.files.get('file')
+        if file is None or file.filename == '':
+            return jsonify({'success': False, 'message': 'No file selected'}), 400
+        stream, name = file.stream, file.filename
+    elif is_raw_image_upload():
+        stream, name = request.stream, request.args.get('filename', '')
+    else:
+        return jsonify({'success': False, 'message': 'Send an image body or a multipart file'}), 415
+
+    name = secure_filename(name) or 'upload'
+    return stream_upload(stream, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{name}", origin)
@@ -1,11 +1,25 @@
 from PIL import Image, ImageDraw
 import random
 import os
+from io import BytesIO
 from datetime import datetime
 
 
-def turtle_art_image(artwork_folder):
-    """Generate a turtle-style generative art image and save it."""
+def save_art(img, artwork_folder, filename, store=None):
+    """Write a generated image, through the artwork store when one is given, and return its name"""
+    if store is None:
+        img.save(os.path.join(artwork_folder, filename))
+        return filename
+    buffer = BytesIO()
+    img.save(buffer, format='PNG')
+    return store.save_bytes(buffer.getvalue(), filename)
+
+
+def turtle_art_image(artwork_folder, store=None, cancelled=None):
+    """Generate a turtle-style generative art image, save it and return its filename.
+
+    If cancelled() returns True once the image is drawn, nothing is saved and None is returned.
+    """
     try:
         print("Generating Turtle Art...")
         width, height = 800, 600
@@ -28,6 +42,9 @@ def turtle_art_image(artwork_folder):
             elif shape == 'triangle':
                 draw.polygon([(x, y - size), (x - size, y + size), (x + size, y + size)], fill=color)
 
+        if cancelled is not None and cancelled():
+            return None
+
         # Ensure the artwork folder exists
         os.makedirs(artwork_folder, exist_ok=True)
 
@@ -37,14 +54,19 @@ def turtle_art_image(artwork_folder):
         file_path = os.path.join(artwork_folder, filename)
 
         print(f"Saving Turtle Art to: {file_path}")
-        img.save(file_path)
+        filename = save_art(img, artwork_folder, filename, store)
         print("Turtle Art Generation Complete!")
+        return filename
 
     except Exception as e:
         print(f"Error in turtle_art_image: {e}")
 
 
-def pygame_art_image(artwork_folder):
+def pygame_art_image(artwork_folder, store=None, cancelled=None):
+    """Generate a pygame-style generative art image, save it and return its filename.
+
+    If cancelled() returns True once the image is drawn, nothing is saved and None is returned.
+    """
     try:
         print("Generating Pygame Art...")
         width, height = 800, 600
@@ -66,6 +88,9 @@ def pygame_art_image(artwork_folder):
                 draw.rectangle([x - size, y - size, x + size, y + size], fill=color)
 
 
+        if cancelled is not None and cancelled():
+            return None
+
         os.makedirs(artwork_folder, exist_ok=True)
 
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -73,8 +98,9 @@ def pygame_art_image(artwork_folder):
         file_path = os.path.join(artwork_folder, filename)
 
         print(f"Saving Pygame Art to: {file_path}")
-        img.save(file_path)
+        filename = save_art(img, artwork_folder, filename, store)
         print("Pygame Art Generation Complete!")
+        return filename
 
     except Exception as e:
         print(f"Error in pygame_art_image: {e}")
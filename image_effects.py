@@ -3,35 +3,337 @@ import numpy as np
 from PIL import Image
 import io
 import base64
+import contextlib
 import os
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+import animation
+import luts
+from admission import estimate_image_bytes
+from metrics import in_context, span
+
+
+class DecodedImageCache:
+    """Process-wide LRU cache of decoded, resized BGR images, bounded by total bytes"""
+
+    def __init__(self, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(image_path, max_dimension):
+        """Build a cache key that changes whenever the file on disk changes"""
+        stat = os.stat(image_path)
+        return (os.path.abspath(image_path), stat.st_mtime_ns, stat.st_size, max_dimension)
+
+    def get(self, key):
+        with self._lock:
+            image = self._entries.get(key)
+            if image is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return image
+
+    def put(self, key, image):
+        # Cached arrays are shared between requests, so they must never be modified in place
+        image.setflags(write=False)
+        if image.nbytes > self.max_bytes:
+            return image
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.current_bytes -= previous.nbytes
+            self._entries[key] = image
+            self.current_bytes += image.nbytes
+
+            while self.current_bytes > self.max_bytes and self._entries:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+        return image
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        """Return hit/miss counters and current memory usage"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': self.hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes
+            }
+
+
+# Shared by every ImageEffects instance in this process
+decoded_image_cache = DecodedImageCache()
+
+RENDER_WORKERS = min(4, os.cpu_count() or 1)
+_render_executor = None
+_render_executor_lock = threading.Lock()
+
+
+def get_render_executor():
+    """Return the bounded thread pool used to render effects concurrently"""
+    global _render_executor
+    with _render_executor_lock:
+        if _render_executor is None:
+            _render_executor = ThreadPoolExecutor(max_workers=RENDER_WORKERS,
+                                                  thread_name_prefix='image-effects')
+        return _render_executor
+
+
+def open_image_reduced(source, max_dimension=None):
+    """Open an image and shrink it to fit max_dimension, decoding as little as possible.
+
+    JPEGs are put in draft mode first so libjpeg decodes directly at 1/2,
+    1/4 or 1/8 scale (never below the target) instead of materialising the
+    full-size bitmap; the final LANCZOS pass then only covers the remaining
+    factor. Other formats fall back to Pillow's reduce-then-resample.
+    """
+    pil_image = Image.open(source)
+    if not max_dimension or max(pil_image.size) <= max_dimension:
+        return pil_image
+
+    reducing_gap = 2.0
+    if pil_image.format == 'JPEG':
+        scale = max_dimension / max(pil_image.size)
+        pil_image.draft('RGB', (max(1, int(pil_image.width * scale)), max(1, int(pil_image.height * scale))))
+        # A second draft inside thumbnail() would undo the smaller scale
+        reducing_gap = None
+    elif pil_image.mode in ('1', 'P'):
+        # Palette images can only be resized with NEAREST, so expand them first
+        pil_image = pil_image.convert('RGBA' if 'transparency' in pil_image.info else 'RGB')
+
+    pil_image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS, reducing_gap=reducing_gap)
+    return pil_image
+
+
+# Colour matrices operate on BGR pixels, as used by cv2.transform
+GRAYSCALE_MATRIX = np.array([[0.114, 0.587, 0.299],
+                             [0.114, 0.587, 0.299],
+                             [0.114, 0.587, 0.299]])
+SEPIA_MATRIX = np.array([[0.272, 0.534, 0.131],
+                         [0.349, 0.686, 0.168],
+                         [0.393, 0.769, 0.189]])
+
+# Parameters of the lookup-table effects; compiled tables are cached per parameter set
+GAMMA = 0.7
+CONTRAST_CURVE = ((0, 0), (64, 48), (128, 128), (192, 208), (255, 255))
+POSTERIZE_LEVELS = 4
+DUOTONE_COLOURS = ((80, 30, 20), (120, 220, 250))  # BGR shadows, highlights
+
+DEFAULT_LUT_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static', 'luts')
+
+PIPELINE_SEPARATOR = '+'
+MAX_PIPELINE_STAGES = 8
+
+
+class EffectPipeline:
+    """An ordered chain of effects applied in one pass, without re-encoding between steps.
+
+    Runs of adjacent colour-matrix stages are folded into a single
+    cv2.transform, runs of tonal lookup tables into a single cv2.LUT and
+    runs of adjacent resize stages into a single down/up-scale. Folding
+    drops the clipping between the folded stages, which only matters for
+    matrices that push values past 255. The duration of every executed
+    stage is kept in `timings` after each run.
+    """
+
+    def __init__(self, effects, effect_names):
+        self.effect_names = list(effect_names)
+        self.name = PIPELINE_SEPARATOR.join(self.effect_names)
+        self.stages = self._fuse(effects, self.effect_names)
+        self.timings = []
+
+    @staticmethod
+    def _fuse(effects, effect_names):
+        stages = []
+        for effect_name in effect_names:
+            effect = effects[effect_name]
+            kind = effect.get('stage', 'func')
+            if kind == 'identity':
+                continue
+
+            previous = stages[-1] if stages else None
+            if previous is not None and kind in ('matrix', 'resize', 'lut') and previous['kind'] == kind:
+                previous['names'].append(effect_name)
+                if kind == 'matrix':
+                    # Applying A then B to a pixel is B @ A
+                    previous['matrix'] = effect['matrix'] @ previous['matrix']
+                elif kind == 'lut':
+                    previous['lut'] = luts.compose_luts(previous['lut'], effect['lut'])
+                else:
+                    previous['scale'] = min(previous['scale'], effect['scale'])
+                continue
+
+            stages.append({
+                'kind': kind,
+                'pixelwise': kind in ('matrix', 'lut') or effect.get('pixelwise', False),
+                'names': [effect_name],
+                'func': effect['func'],
+                'matrix': effect.get('matrix'),
+                'lut': effect.get('lut'),
+                'scale': effect.get('scale')
+            })
+        return stages
+
+    def _apply(self, stage, image):
+        if len(stage['names']) == 1:
+            # Nothing was folded, so use the effect itself for identical results
+            return stage['func'](image)
+
+        if stage['kind'] == 'matrix':
+            return cv2.transform(image, stage['matrix'])
+
+        if stage['kind'] == 'lut':
+            return luts.apply_lut(image, stage['lut'])
+
+        h, w = image.shape[:2]
+        small_size = (max(1, int(w * stage['scale'])), max(1, int(h * stage['scale'])))
+        small = cv2.resize(image, small_size, interpolation=cv2.INTER_LINEAR)
+        return cv2.resize(small, (w, h), interpolation=cv2.INTER_NEAREST)
+
+    def __call__(self, image, stacked=False):
+        """Run the pipeline on one image, or on an (N, H, W, 3) frame stack with stacked=True"""
+        timings = []
+        for stage in self.stages:
+            start = time.perf_counter()
+            if stacked:
+                image = animation.apply_stacked(partial(self._apply, stage), image, stage['pixelwise'])
+            else:
+                image = self._apply(stage, image)
+            timings.append((PIPELINE_SEPARATOR.join(stage['names']), time.perf_counter() - start))
+        self.timings = timings
+        return image
 
 
 class ImageEffects:
-    def __init__(self):
+    def __init__(self, cache=None, lut_folder=DEFAULT_LUT_FOLDER):
         self.effects = {
             'original': {
                 'func': self.compress_image,  # Add compression to original
-                'description': 'Original image without any effects'
+                'description': 'Original image without any effects',
+                'stage': 'identity'
             },
             'grayscale': {
                 'func': self.grayscale,
-                'description': 'Convert image to black and white'
+                'description': 'Convert image to black and white',
+                'stage': 'matrix',
+                'matrix': GRAYSCALE_MATRIX
             },
             'sepia': {
                 'func': self.sepia,
-                'description': 'Apply a vintage sepia tone'
+                'description': 'Apply a vintage sepia tone',
+                'stage': 'matrix',
+                'matrix': SEPIA_MATRIX
             },
             'pixelate': {
                 'func': self.pixelate,
-                'description': 'Create a pixelated mosaic effect'
+                'description': 'Create a pixelated mosaic effect',
+                'stage': 'resize',
+                'scale': 1 / 10
             },
             'blur': {
                 'func': self.blur,
                 'description': 'Apply Gaussian blur effect'
             }
         }
+        # Effects flagged 'pixelwise' (plus every matrix and lut stage) only look at one
+        # pixel at a time, which lets animations run them on all frames in a single call
+        self.register_lut_effects(lut_folder)
         self.max_dimension = 1200  # Maximum dimension for any image
         self.jpeg_quality = 85     # JPEG quality for compression
+        self.cache = cache if cache is not None else decoded_image_cache
+        self._pipelines = {}
+
+    def register_lut_effects(self, lut_folder):
+        """Add the lookup-table effects, including one per .cube file in lut_folder"""
+        tonal = {
+            'gamma': (luts.gamma_lut(GAMMA), 'Brighten midtones with a gamma curve'),
+            'curves': (luts.curves_lut(CONTRAST_CURVE), 'Boost contrast with an S-shaped tone curve'),
+            'posterize': (luts.posterize_lut(POSTERIZE_LEVELS), 'Reduce every channel to a few flat tones')
+        }
+        for name, (table, description) in tonal.items():
+            self.effects[name] = {
+                'func': partial(luts.apply_lut, table=table),
+                'description': description,
+                'stage': 'lut',
+                'lut': table
+            }
+
+        self.effects['duotone'] = {
+            'func': partial(luts.apply_duotone, table=luts.duotone_lut(*DUOTONE_COLOURS)),
+            'description': 'Map shadows and highlights to two colours',
+            'pixelwise': True
+        }
+
+        for filename in luts.list_cube_files(lut_folder):
+            name = 'lut_' + os.path.splitext(filename)[0].lower().replace(' ', '_').replace(PIPELINE_SEPARATOR, '_')
+            self.effects[name] = {
+                'func': partial(self.color_grade, cube_path=os.path.join(lut_folder, filename)),
+                'description': f"Colour grade with the {os.path.splitext(filename)[0]} 3D LUT",
+                'pixelwise': True
+            }
+
+    def get_pipeline(self, spec):
+        """Return the EffectPipeline for a spec such as 'blur+sepia+pixelate', or None if invalid"""
+        if spec in self._pipelines:
+            return self._pipelines[spec]
+
+        effect_names = [name.strip() for name in spec.split(PIPELINE_SEPARATOR)]
+        if (len(effect_names) < 2 or len(effect_names) > MAX_PIPELINE_STAGES
+                or any(name not in self.effects for name in effect_names)):
+            return None
+
+        pipeline = EffectPipeline(self.effects, effect_names)
+        self._pipelines[spec] = pipeline
+        return pipeline
+
+    def has_effect(self, effect_name):
+        """Check whether a name is a registered effect or a valid pipeline spec"""
+        return effect_name in self.effects or (
+            PIPELINE_SEPARATOR in effect_name and self.get_pipeline(effect_name) is not None)
+
+    def effect_func(self, effect_name):
+        if effect_name in self.effects:
+            return self.effects[effect_name]['func']
+        return self.get_pipeline(effect_name)
+
+    def effect_info(self, effect_name):
+        """Return the title and description shown for an effect or pipeline"""
+        if effect_name in self.effects:
+            return {
+                'title': effect_name.capitalize(),
+                'description': self.effects[effect_name]['description']
+            }
+
+        pipeline = self.get_pipeline(effect_name)
+        return {
+            'title': ' → '.join(name.capitalize() for name in pipeline.effect_names),
+            'description': 'Pipeline: ' + ', then '.join(
+                self.effects[name]['description'].lower() for name in pipeline.effect_names)
+        }
 
     def compress_image(self, image):
         """Compress image to reduce file size"""
@@ -53,58 +355,209 @@ class ImageEffects:
             print(f"Error in compress_image: {e}")
             return image
 
-    def process_image(self, image_path, selected_effects=None):
-        """Process image with selected effects and return base64 encoded results"""
-        print(f"Processing image: {image_path}")
+    def load_image(self, image_path, full_resolution=False):
+        """Return the resized BGR base image, decoding it only on a cache miss.
 
+        The returned array is shared and read-only; copy it before modifying.
+        With full_resolution=True the image is returned at its original size
+        and bypasses the cache: full-size saves are one-off, and a single one
+        could evict every preview-sized entry.
+        """
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Image file not found: {image_path}")
 
+        max_dimension = None if full_resolution else self.max_dimension
+        if not full_resolution:
+            key = self.cache.make_key(image_path, max_dimension)
+            image = self.cache.get(key)
+            if image is not None:
+                return image
+
         try:
-            # Read and compress image initially
-            pil_image = Image.open(image_path)
-            if pil_image.mode != 'RGB':
-                pil_image = pil_image.convert('RGB')
-
-            # Resize if necessary
-            if max(pil_image.size) > self.max_dimension:
-                pil_image.thumbnail((self.max_dimension, self.max_dimension), Image.Resampling.LANCZOS)
-
-            # Convert to numpy array for OpenCV
-            image = np.array(pil_image)
-            image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+            with span('image.decode'):
+                # Read and compress image initially
+                pil_image = open_image_reduced(image_path, max_dimension)
+                if pil_image.mode != 'RGB':
+                    pil_image = pil_image.convert('RGB')
+
+                # Convert to numpy array for OpenCV
+                image = np.array(pil_image)
+                image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
         except Exception as e:
             raise ValueError(f"Error loading image: {str(e)}")
 
+        if full_resolution:
+            image.setflags(write=False)
+            return image
+        return self.cache.put(key, image)
+
+    def load_frames(self, image_path, full_resolution=False):
+        """Return every frame of an animated image as a read-only FrameStack, cached unless full_resolution"""
+        max_dimension = None if full_resolution else self.max_dimension
+        if not full_resolution:
+            key = self.cache.make_key(image_path, ('frames', max_dimension))
+            stack = self.cache.get(key)
+            if stack is not None:
+                return stack
+
+        try:
+            with span('image.decode'):
+                stack = animation.load_frames(image_path, max_dimension)
+        except Exception as e:
+            raise ValueError(f"Error loading animation: {str(e)}")
+
+        if full_resolution:
+            stack.setflags(write=False)
+            return stack
+        return self.cache.put(key, stack)
+
+    def load_source(self, image_path, full_resolution=False):
+        """Load a still image as an array, or an animated GIF/APNG/WebP as a FrameStack"""
+        if animation.animated_format(image_path):
+            return self.load_frames(image_path, full_resolution=full_resolution)
+        return self.load_image(image_path, full_resolution=full_resolution)
+
+    def output_format(self, image_path):
+        """Return the (extension, mimetype) that renders of an image are encoded as"""
+        animated = animation.animated_format(image_path)
+        if animated:
+            return animation.ANIMATED_FORMATS[animated]
+        return 'jpg', 'image/jpeg'
+
+    def apply_to_frames(self, effect_name, frames):
+        """Apply an effect or pipeline to a whole frame stack, one vectorized call per stage"""
+        if effect_name not in self.effects:
+            return self.get_pipeline(effect_name)(frames, stacked=True)
+
+        effect = self.effects[effect_name]
+        if effect.get('stage') == 'identity':
+            return frames
+        pixelwise = effect.get('stage') in ('matrix', 'lut') or effect.get('pixelwise', False)
+        return animation.apply_stacked(effect['func'], frames, pixelwise)
+
+    def render_effect(self, image, effect_name, compress=True):
+        """Apply one effect to the base image and return the encoded JPEG bytes.
+
+        Animated sources (FrameStack) are processed as a whole and re-encoded
+        in their own format instead.
+        """
+        if isinstance(image, animation.FrameStack):
+            with span('image.effect'):
+                frames = self.apply_to_frames(effect_name, image.frames)
+            with span('image.encode'):
+                return animation.encode_frames(frames, image, quality=self.jpeg_quality)
+
+        # Apply effect
+        with span('image.effect'):
+            processed = self.effect_func(effect_name)(image.copy())
+        if compress:
+            with span('image.compress'):
+                processed = self.compress_image(processed)
+        elif len(processed.shape) == 2:
+            processed = cv2.cvtColor(processed, cv2.COLOR_GRAY2BGR)
+
+        with span('image.encode'):
+            # Convert back to RGB
+            processed_rgb = cv2.cvtColor(processed, cv2.COLOR_BGR2RGB)
+            # Convert to PIL Image
+            pil_processed = Image.fromarray(processed_rgb)
+
+            buffer = io.BytesIO()
+            pil_processed.save(buffer, format='JPEG', quality=self.jpeg_quality, optimize=True)
+            return buffer.getvalue()
+
+    def render_effects(self, image, effect_names, parallel=True):
+        """Render several effects, returning (effect_name, jpeg_bytes or exception) pairs in input order.
+
+        With parallel=True the effects run on the shared render pool; cv2 and
+        Pillow's JPEG encoder release the GIL, so the wall time approaches that
+        of the slowest effect. A failing effect never affects the others.
+        """
+        if not parallel or len(effect_names) < 2:
+            rendered = []
+            for effect_name in effect_names:
+                try:
+                    rendered.append((effect_name, self.render_effect(image, effect_name)))
+                except Exception as e:
+                    rendered.append((effect_name, e))
+            return rendered
+
+        executor = get_render_executor()
+        # Stages timed on the pool count towards the request that asked for the renders
+        render_effect = in_context(self.render_effect)
+        futures = [(effect_name, executor.submit(render_effect, image, effect_name))
+                   for effect_name in effect_names]
+
+        rendered = []
+        for effect_name, future in futures:
+            try:
+                rendered.append((effect_name, future.result()))
+            except Exception as e:
+                rendered.append((effect_name, e))
+        return rendered
+
+    def render_cached(self, image_path, effect_names, render_cache, parallel=True, admission=None):
+        """Render effects into the on-disk render cache.
+
+        Returns (effect_name, entry or exception) pairs in input order, where
+        entry holds the cache key (usable as an ETag) and the file path. The
+        source image is only decoded if at least one effect is missing, and
+        only that decode is charged to the admission MemoryBudget, if given.
+        """
+        extension, mimetype = self.output_format(image_path)
+        entries = {}
+        missing = []
+        for effect_name in effect_names:
+            key = render_cache.make_key(image_path, effect_name, self.max_dimension, self.jpeg_quality)
+            path = render_cache.get(key, extension)
+            if path:
+                entries[effect_name] = {'key': key, 'path': path, 'extension': extension, 'mimetype': mimetype}
+            else:
+                missing.append((effect_name, key))
+
+        if missing:
+            with self.admit(admission, image_path, renders=len(missing)):
+                image = self.load_source(image_path)
+                rendered = self.render_effects(image, [name for name, _ in missing], parallel=parallel)
+                del image
+            for (effect_name, key), (_, result) in zip(missing, rendered):
+                if isinstance(result, Exception):
+                    entries[effect_name] = result
+                else:
+                    entries[effect_name] = {'key': key, 'path': render_cache.put(key, result, extension),
+                                            'extension': extension, 'mimetype': mimetype}
+
+        return [(effect_name, entries[effect_name]) for effect_name in effect_names]
+
+    def admit(self, admission, image_path, renders=1, full_resolution=False):
+        """Reserve the estimated memory of a decode and its renders, or do nothing without a budget"""
+        if admission is None:
+            return contextlib.nullcontext()
+        max_dimension = None if full_resolution else self.max_dimension
+        return admission.admit(estimate_image_bytes(image_path, max_dimension, renders))
+
+    def process_image(self, image_path, selected_effects=None, parallel=True):
+        """Process image with selected effects and return base64 encoded results"""
+        print(f"Processing image: {image_path}")
+
+        image = self.load_source(image_path)
+
         results = {}
         if not selected_effects:
             selected_effects = ['original']
 
-        for effect_name in selected_effects:
-            if effect_name in self.effects:
-                try:
-                    # Apply effect
-                    processed = self.effects[effect_name]['func'](image.copy())
-                    # Always compress after effect
-                    processed = self.compress_image(processed)
-                    # Convert back to RGB
-                    processed_rgb = cv2.cvtColor(processed, cv2.COLOR_BGR2RGB)
-                    # Convert to PIL Image
-                    pil_processed = Image.fromarray(processed_rgb)
-
-                    # Save to base64 with compression
-                    buffer = io.BytesIO()
-                    pil_processed.save(buffer, format='JPEG', quality=self.jpeg_quality, optimize=True)
-                    img_str = base64.b64encode(buffer.getvalue()).decode()
-
-                    results[effect_name] = {
-                        'image': img_str,
-                        'title': effect_name.capitalize(),
-                        'description': self.effects[effect_name]['description']
-                    }
-                except Exception as e:
-                    print(f"Error processing {effect_name} effect: {str(e)}")
-                    continue
+        # Unknown and repeated effect names are dropped, first occurrence wins
+        effect_names = [name for name in dict.fromkeys(selected_effects) if self.has_effect(name)]
+
+        for effect_name, rendered in self.render_effects(image, effect_names, parallel=parallel):
+            if isinstance(rendered, Exception):
+                print(f"Error processing {effect_name} effect: {str(rendered)}")
+                continue
+
+            results[effect_name] = {
+                'image': base64.b64encode(rendered).decode(),
+                **self.effect_info(effect_name)
+            }
 
         return results
 
@@ -118,10 +571,7 @@ class ImageEffects:
 
     def sepia(self, image):
         try:
-            sepia_filter = np.array([[0.272, 0.534, 0.131],
-                                     [0.349, 0.686, 0.168],
-                                     [0.393, 0.769, 0.189]])
-            sepia_img = cv2.transform(image, sepia_filter)
+            sepia_img = cv2.transform(image, SEPIA_MATRIX)
             sepia_img[np.where(sepia_img > 255)] = 255
             return sepia_img.astype(np.uint8)
         except Exception as e:
@@ -144,22 +594,66 @@ class ImageEffects:
             print(f"Error in blur effect: {e}")
             return image
 
+    def color_grade(self, image, cube_path):
+        try:
+            return luts.apply_lut3d(image, luts.load_cube(cube_path))
+        except Exception as e:
+            print(f"Error in color grade effect: {e}")
+            return image
+
+    def effect_filename(self, original_filename, effect_name, extension='jpg'):
+        """Name under which an effect applied to an artwork is saved in the gallery"""
+        filename_without_ext = os.path.splitext(original_filename)[0]
+        effect_suffix = effect_name.replace(PIPELINE_SEPARATOR, '-')
+        return f"{filename_without_ext}_{effect_suffix}.{extension}"
+
+    def save_rendered_effect(self, image_path, effect_name, output_folder,
+                             render_cache=None, full_resolution=False, store=None, admission=None):
+        """Render an effect from the original image on the server and write it to output_folder.
+
+        Previews already in the render cache are copied byte for byte, so the
+        saved file is the exact JPEG the user saw without a second lossy encode.
+        With an ArtworkStore the bytes go through it, so re-saving an identical
+        render returns the existing name. Returns the new filename.
+        """
+        if not self.has_effect(effect_name):
+            raise ValueError(f"Unknown effect: {effect_name}")
+
+        extension, _ = self.output_format(image_path)
+        new_filename = self.effect_filename(os.path.basename(image_path), effect_name, extension)
+        save_path = os.path.join(output_folder, new_filename)
+
+        if render_cache is not None and not full_resolution:
+            [(_, entry)] = self.render_cached(image_path, [effect_name], render_cache, admission=admission)
+            if isinstance(entry, Exception):
+                raise entry
+            if store is not None:
+                with open(entry['path'], 'rb') as f:
+                    return store.save_bytes(f.read(), new_filename, overwrite=True)
+            shutil.copyfile(entry['path'], save_path)
+        else:
+            with self.admit(admission, image_path, full_resolution=full_resolution):
+                image = self.load_source(image_path, full_resolution=full_resolution)
+                data = self.render_effect(image, effect_name, compress=not full_resolution)
+                del image
+            if store is not None:
+                return store.save_bytes(data, new_filename, overwrite=True)
+            with open(save_path, 'wb') as f:
+                f.write(data)
+
+        return new_filename
+
     def save_processed_image(self, base64_image, original_filename, effect_name):
         """Save a processed image from base64 string to the gallery"""
         try:
             # Decode base64 string
             image_data = base64.b64decode(base64_image)
 
-            # Create image from binary data
-            image = Image.open(io.BytesIO(image_data))
-
-            # Compress if necessary
-            if max(image.size) > self.max_dimension:
-                image.thumbnail((self.max_dimension, self.max_dimension), Image.Resampling.LANCZOS)
+            # Create image from binary data, compressing if necessary
+            image = open_image_reduced(io.BytesIO(image_data), self.max_dimension)
 
             # Generate new filename with effect name
-            filename_without_ext = os.path.splitext(original_filename)[0]
-            new_filename = f"{filename_without_ext}_{effect_name}.jpg"  # Changed to jpg
+            new_filename = self.effect_filename(original_filename, effect_name)
 
             return new_filename, image
         except Exception as e:
@@ -0,0 +1,263 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATES = (SUCCEEDED, FAILED, CANCELLED)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    type TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    next_url TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    started REAL,
+    finished REAL,
+    owner TEXT,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_priority ON jobs (status, priority DESC, created);
+"""
+
+# Columns added since the first version of the schema, for existing databases
+LEASE_COLUMNS = (('owner', 'TEXT'), ('heartbeat', 'REAL'))
+
+# Finished jobs are kept this long for status polling, then pruned at startup
+JOB_RETENTION_SECONDS = 24 * 60 * 60
+# A running job belongs to the process that claimed it for as long as that process
+# renews its lease; one it has not renewed for LEASE_SECONDS is queued again
+LEASE_SECONDS = 60
+HEARTBEAT_SECONDS = 15
+
+
+class JobCancelled(Exception):
+    """Raised by Job.check_cancelled() inside a handler whose job was cancelled"""
+
+
+class Job:
+    """Handle passed to a job handler while it runs"""
+
+    def __init__(self, queue, job_id, job_type, params):
+        self.queue = queue
+        self.id = job_id
+        self.type = job_type
+        self.params = params
+
+    def cancel_requested(self):
+        row = self.queue.connection().execute('SELECT cancel_requested FROM jobs WHERE id = ?',
+                                              (self.id,)).fetchone()
+        return bool(row and row['cancel_requested'])
+
+    def check_cancelled(self):
+        """Long handlers call this between steps to stop early once the job is cancelled"""
+        if self.cancel_requested():
+            raise JobCancelled()
+
+
+class JobQueue:
+    """Persistent priority queue of background jobs, run by a pool of worker threads.
+
+    Jobs are rows in a local SQLite database, so queued work survives a
+    restart. A claimed job is leased to this queue's owner id, and a
+    heartbeat thread renews the leases of every job it runs; jobs whose
+    owner died stop being renewed and are queued again once their lease
+    expires, while jobs of live processes are never taken from them.
+    Each job type has a handler and a concurrency cap (per process); workers
+    always take the highest-priority queued job whose type is below its cap.
+    """
+
+    def __init__(self, db_path, workers=4):
+        self.db_path = db_path
+        self.workers = workers
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.handlers = {}
+        self.limits = {}
+        self._running = {}
+        self._local = threading.local()
+        self._condition = threading.Condition()
+        self._threads = []
+        self._last_requeue = 0.0
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+
+        with self.connection() as conn:
+            conn.executescript(SCHEMA)
+            columns = {row['name'] for row in conn.execute('PRAGMA table_info(jobs)')}
+            for name, column_type in LEASE_COLUMNS:
+                if name not in columns:
+                    conn.execute(f'ALTER TABLE jobs ADD COLUMN {name} {column_type}')
+            conn.execute('DELETE FROM jobs WHERE status IN (?, ?, ?) AND finished < ?',
+                         FINISHED_STATES + (time.time() - JOB_RETENTION_SECONDS,))
+        self._requeue_expired()
+
+    def connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    def register(self, job_type, handler, max_concurrency=1):
+        """Register handler(job) for a job type; its return value is stored as the job result"""
+        self.handlers[job_type] = handler
+        self.limits[job_type] = max_concurrency
+        self._running.setdefault(job_type, 0)
+
+    def start(self):
+        with self._condition:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name='job-heartbeat', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, job_type, params, priority=0, next_url=None):
+        """Queue a job and return its id; higher priorities run first"""
+        if job_type not in self.handlers:
+            raise ValueError(f"Unknown job type: {job_type}")
+        job_id = uuid.uuid4().hex
+        with self.connection() as conn:
+            conn.execute('INSERT INTO jobs (id, type, priority, status, params, next_url, created) '
+                         'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                         (job_id, job_type, priority, QUEUED, json.dumps(params), next_url, time.time()))
+        self.start()
+        with self._condition:
+            self._condition.notify()
+        return job_id
+
+    def get(self, job_id):
+        row = self.connection().execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] is not None else None
+        job['cancel_requested'] = bool(job['cancel_requested'])
+        return job
+
+    def cancel(self, job_id):
+        """Cancel a queued job at once, or ask a running one to stop; returns the new status.
+
+        A running job stops at its handler's next check_cancelled(), after
+        cleaning up its partial output, or succeeds if it finishes first.
+        """
+        with self.connection() as conn:
+            conn.execute('UPDATE jobs SET status = ?, finished = ? WHERE id = ? AND status = ?',
+                         (CANCELLED, time.time(), job_id, QUEUED))
+            conn.execute('UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status = ?',
+                         (job_id, RUNNING))
+        job = self.get(job_id)
+        return job['status'] if job else None
+
+    def stats(self):
+        counts = {status: 0 for status in (QUEUED, RUNNING) + FINISHED_STATES}
+        for row in self.connection().execute('SELECT status, COUNT(*) AS n FROM jobs GROUP BY status'):
+            counts[row['status']] = row['n']
+        with self._condition:
+            counts['running_by_type'] = dict(self._running)
+        return counts
+
+    def _requeue_expired(self):
+        """Queue again the running jobs whose owner stopped renewing their lease"""
+        self._last_requeue = time.monotonic()
+        with self.connection() as conn:
+            requeued = conn.execute(
+                'UPDATE jobs SET status = ?, started = NULL, owner = NULL, heartbeat = NULL '
+                'WHERE status = ? AND (heartbeat IS NULL OR heartbeat < ?)',
+                (QUEUED, RUNNING, time.time() - LEASE_SECONDS)).rowcount
+        if requeued:
+            print(f"Requeued {requeued} job(s) whose lease expired")
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(HEARTBEAT_SECONDS)
+            try:
+                with self.connection() as conn:
+                    conn.execute('UPDATE jobs SET heartbeat = ? WHERE owner = ? AND status = ?',
+                                 (time.time(), self.owner, RUNNING))
+            except sqlite3.Error as e:
+                print(f"Error renewing job leases: {e}")
+
+    def _claim(self):
+        # Called with the condition held, so claims never race within this process
+        available = [job_type for job_type, running in self._running.items()
+                     if running < self.limits[job_type]]
+        if not available:
+            return None
+
+        if time.monotonic() - self._last_requeue >= HEARTBEAT_SECONDS:
+            self._requeue_expired()
+        conn = self.connection()
+        while True:
+            row = conn.execute(
+                f"SELECT id, type, params FROM jobs WHERE status = ? AND type IN ({', '.join('?' * len(available))}) "
+                f"ORDER BY priority DESC, created LIMIT 1", (QUEUED, *available)).fetchone()
+            if row is None:
+                return None
+            with conn:
+                # Another process sharing the database may have claimed the same row first
+                now = time.time()
+                claimed = conn.execute('UPDATE jobs SET status = ?, started = ?, owner = ?, heartbeat = ? '
+                                       'WHERE id = ? AND status = ?',
+                                       (RUNNING, now, self.owner, now, row['id'], QUEUED)).rowcount
+            if claimed:
+                break
+        self._running[row['type']] += 1
+        return Job(self, row['id'], row['type'], json.loads(row['params']))
+
+    def _work(self):
+        while True:
+            with self._condition:
+                job = self._claim()
+                while job is None:
+                    # Also wake up periodically for jobs queued by other processes
+                    self._condition.wait(timeout=5)
+                    job = self._claim()
+
+            status, result, error = SUCCEEDED, None, None
+            try:
+                # A handler that returns has written its output, so the job succeeded even if a
+                # cancellation arrived after its last check
+                result = self.handlers[job.type](job)
+            except JobCancelled:
+                status = CANCELLED
+            except Exception as e:
+                print(f"Error in {job.type} job {job.id}: {e}")
+                traceback.print_exc()
+                status, error = FAILED, str(e)
+
+            with self.connection() as conn:
+                # Only while the lease is still ours: a job requeued after it expired belongs to another run
+                finished = conn.execute('UPDATE jobs SET status = ?, result = ?, error = ?, finished = ? '
+                                        'WHERE id = ? AND owner = ? AND status = ?',
+                                        (status, json.dumps(result), error, time.time(), job.id, self.owner,
+                                         RUNNING)).rowcount
+            if not finished:
+                print(f"Lost the lease of {job.type} job {job.id}; its result was discarded")
+
+            with self._condition:
+                self._running[job.type] -= 1
+                # A slot of this type is free again
+                self._condition.notify_all()
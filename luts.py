@@ -0,0 +1,199 @@
+import os
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+
+# Compiled 3D LUTs are sampled on a (2 ** bits) ** 3 lattice: 7 bits keeps the
+# table at 8 MB, and apply_lut3d interpolates between lattice points
+LUT3D_BITS = 7
+# Pixels interpolated per step of apply_lut3d, bounding its float32 temporaries
+LUT3D_CHUNK_PIXELS = 1 << 15
+
+
+def _freeze(table):
+    # Compiled tables are shared through the caches below, so make them immutable
+    table.setflags(write=False)
+    return table
+
+
+@lru_cache(maxsize=64)
+def gamma_lut(gamma):
+    """Compile a 256-entry table applying out = 255 * (in / 255) ** gamma"""
+    x = np.arange(256, dtype=np.float64) / 255.0
+    return _freeze(np.clip(np.rint(255.0 * x ** gamma), 0, 255).astype(np.uint8))
+
+
+@lru_cache(maxsize=64)
+def curves_lut(points):
+    """Compile a tone curve through ((input, output), ...) control points, linearly interpolated"""
+    xs, ys = zip(*sorted(points))
+    curve = np.interp(np.arange(256), xs, ys)
+    return _freeze(np.clip(np.rint(curve), 0, 255).astype(np.uint8))
+
+
+@lru_cache(maxsize=64)
+def posterize_lut(levels):
+    """Compile a table that quantizes every channel to the given number of levels"""
+    step = 255.0 / (levels - 1)
+    x = np.arange(256, dtype=np.float64)
+    return _freeze(np.clip(np.rint(np.rint(x / step) * step), 0, 255).astype(np.uint8))
+
+
+@lru_cache(maxsize=64)
+def duotone_lut(shadow_bgr, highlight_bgr):
+    """Compile a 1x256x3 table mapping luminance to a blend of two BGR colours"""
+    t = np.arange(256, dtype=np.float64)[:, None] / 255.0
+    colours = (1.0 - t) * np.array(shadow_bgr, dtype=np.float64) + t * np.array(highlight_bgr, dtype=np.float64)
+    return _freeze(np.clip(np.rint(colours), 0, 255).astype(np.uint8).reshape(1, 256, 3))
+
+
+def compose_luts(first, second):
+    """Fold two 256-entry tables into one that applies first, then second"""
+    return _freeze(second[first])
+
+
+def apply_lut(image, table):
+    return cv2.LUT(image, table)
+
+
+def apply_duotone(image, table):
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    return cv2.LUT(cv2.merge([gray, gray, gray]), table)
+
+
+def parse_cube(text):
+    """Parse an Adobe/Resolve .cube 3D LUT into a float32 (N, N, N, 3) table.
+
+    The returned table is indexed [b][g][r] and holds output BGR values
+    scaled to 0..255, matching the BGR uint8 arrays used by ImageEffects.
+    """
+    size = None
+    domain_min = np.zeros(3)
+    domain_max = np.ones(3)
+    values = []
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        keyword = line.split()[0].upper()
+        if keyword == 'LUT_3D_SIZE':
+            size = int(line.split()[1])
+        elif keyword == 'DOMAIN_MIN':
+            domain_min = np.array([float(v) for v in line.split()[1:4]])
+        elif keyword == 'DOMAIN_MAX':
+            domain_max = np.array([float(v) for v in line.split()[1:4]])
+        elif keyword == 'LUT_1D_SIZE':
+            raise ValueError("1D .cube files are not supported")
+        elif keyword in ('TITLE', 'LUT_1D_INPUT_RANGE', 'LUT_3D_INPUT_RANGE'):
+            continue
+        else:
+            values.append([float(v) for v in line.split()[:3]])
+
+    if size is None:
+        raise ValueError("Missing LUT_3D_SIZE")
+    if len(values) != size ** 3:
+        raise ValueError(f"Expected {size ** 3} LUT entries, found {len(values)}")
+
+    # Red changes fastest in the file, so a C-order reshape gives [b][g][r]
+    rgb = (np.array(values, dtype=np.float64) - domain_min) / (domain_max - domain_min)
+    table = np.clip(rgb[:, ::-1] * 255.0, 0, 255).astype(np.float32)
+    return table.reshape(size, size, size, 3)
+
+
+def _upsample_axis(values, axis, size):
+    """Linearly resample one axis of a LUT lattice to `size` evenly spaced points"""
+    n = values.shape[axis]
+    pos = np.linspace(0, n - 1, size, dtype=np.float32)
+    low = np.minimum(pos.astype(np.intp), n - 2)
+    frac = pos - low
+    shape = [1] * values.ndim
+    shape[axis] = size
+    frac = frac.reshape(shape)
+    return np.take(values, low, axis=axis) * (1 - frac) + np.take(values, low + 1, axis=axis) * frac
+
+
+def compile_lut3d(table, bits=LUT3D_BITS):
+    """Trilinearly expand a parsed .cube table into a dense lookup table.
+
+    The result holds one packed uint32 (b, g, r, 0) per lattice point, so
+    reading a lattice point is a single gather.
+    """
+    size = 1 << bits
+    dense = table
+    for axis in range(3):
+        dense = _upsample_axis(dense, axis, size)
+
+    packed = np.zeros((size ** 3, 4), dtype=np.uint8)
+    packed[:, :3] = np.clip(np.rint(dense), 0, 255).reshape(-1, 3)
+    return packed.view(np.uint32).ravel()
+
+
+@lru_cache(maxsize=8)
+def _load_cube(path, mtime_ns):
+    with open(path, 'r', encoding='utf-8') as f:
+        return _freeze(compile_lut3d(parse_cube(f.read())))
+
+
+def load_cube(path):
+    """Load and compile a .cube file, reusing the compiled table until the file changes"""
+    return _load_cube(os.path.abspath(path), os.stat(path).st_mtime_ns)
+
+
+@lru_cache(maxsize=8)
+def _list_cube_files(lut_folder, mtime_ns):
+    return tuple(sorted(f for f in os.listdir(lut_folder) if f.lower().endswith('.cube')))
+
+
+def list_cube_files(lut_folder):
+    """List the .cube files in a folder, re-reading it only when the folder changes"""
+    if not os.path.isdir(lut_folder):
+        return ()
+    return _list_cube_files(os.path.abspath(lut_folder), os.stat(lut_folder).st_mtime_ns)
+
+
+@lru_cache(maxsize=4)
+def _lattice_position(bits):
+    """For every 8-bit level, the lattice point below it and the fraction of the way to the next"""
+    size = 1 << bits
+    position = np.arange(256, dtype=np.float64) * (size - 1) / 255.0
+    low = np.minimum(position.astype(np.intp), size - 2)
+    return _freeze(low.astype(np.uint32)), _freeze((position - low).astype(np.float32)[:, None])
+
+
+def _lerp(a, b, fraction):
+    # In place, into a; b is clobbered
+    b -= a
+    b *= fraction
+    a += b
+    return a
+
+
+def apply_lut3d(image, compiled, bits=LUT3D_BITS):
+    """Apply a compiled 3D LUT to a BGR uint8 image, trilinearly between lattice points.
+
+    The lattice has fewer points per axis than there are levels, so looking
+    up the nearest point alone would map neighbouring levels to the same
+    output and band smooth gradients; interpolating keeps an identity LUT
+    exact.
+    """
+    low, fraction = _lattice_position(bits)
+    b_step, g_step = 1 << (2 * bits), 1 << bits
+    pixels = image.reshape(-1, 3)
+    output = np.empty(pixels.shape, dtype=np.uint8)
+
+    def corner(index):
+        return compiled[index].view(np.uint8).reshape(-1, 4).astype(np.float32)
+
+    for start in range(0, len(pixels), LUT3D_CHUNK_PIXELS):
+        chunk = pixels[start:start + LUT3D_CHUNK_PIXELS]
+        b, g, r = chunk[:, 0], chunk[:, 1], chunk[:, 2]
+        base = (low[b] << (2 * bits)) | (low[g] << bits) | low[r]
+        # Along red, then green, then blue
+        edges = [_lerp(corner(base + offset), corner(base + offset + 1), fraction[r])
+                 for offset in (0, g_step, b_step, b_step + g_step)]
+        blended = _lerp(_lerp(edges[0], edges[1], fraction[g]), _lerp(edges[2], edges[3], fraction[g]), fraction[b])
+        output[start:start + LUT3D_CHUNK_PIXELS] = np.rint(blended[:, :3])
+    return output.reshape(image.shape)
@@ -0,0 +1,101 @@
+import os
+import uuid
+from io import BytesIO
+
+from flask import Blueprint, current_app, jsonify, render_template, request
+from werkzeug.utils import secure_filename
+
+from services import get_services
+from system_routes import submit_job
+
+
+bp = Blueprint('ml', __name__)
+
+
+@bp.route('/generate_descriptions')
+def generate_descriptions_page():
+    """Display description generation page"""
+    artwork_files = get_services().artwork_index.list_filenames(formats=('PNG', 'JPEG'))
+
+    return render_template('generate_descriptions.html', images=artwork_files)
+
+@bp.route('/generate_description/<image_name>', methods=['POST'])
+def generate_description(image_name):
+    """Generate a description for an artwork"""
+    try:
+        image_path = os.path.join(current_app.config['ARTWORK_FOLDER'], image_name)
+        if not os.path.exists(image_path):
+            return jsonify({'error': 'Image not found'}), 404
+
+        ml_processor = get_services().ml_processor
+        if ml_processor is None:
+            return jsonify({
+                "error": "Description generation is disabled in this version (PyTorch not installed)."
+            }), 501
+
+        description = ml_processor.generate_artwork_description(image_path)
+        return jsonify({'description': description})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@bp.route('/style_transfer')
+def style_transfer_page():
+    """Display style transfer page"""
+    try:
+        artwork_files = get_services().artwork_index.list_filenames(formats=('PNG', 'JPEG'), order_by='filename')
+
+        return render_template('style_transfer.html',
+                               images=artwork_files,
+                               max_file_size=current_app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/style_transfer', methods=['POST'])
+def apply_style_transfer():
+    """Apply style transfer to images"""
+    try:
+        # Validate request
+        if 'content_image' not in request.form or 'style_image' not in request.form:
+            return jsonify({'error': 'Missing required images'}), 400
+
+        content_image = secure_filename(request.form['content_image'])
+        style_image = secure_filename(request.form['style_image'])
+
+        content_path = os.path.join(current_app.config['ARTWORK_FOLDER'], content_image)
+        style_path = os.path.join(current_app.config['ARTWORK_FOLDER'], style_image)
+
+        # Validate files exist
+        if not os.path.exists(content_path):
+            return jsonify({'error': 'Content image not found'}), 404
+        if not os.path.exists(style_path):
+            return jsonify({'error': 'Style image not found'}), 404
+
+        if get_services().style_transfer_model is None:
+            return jsonify({
+                "error": "Style transfer is disabled in this version (PyTorch not installed)."
+            }), 501
+
+        # Minutes of optimisation per image, so it runs behind every interactive job
+        return submit_job('style_transfer', {'content_path': content_path, 'style_path': style_path},
+                          priority=-10, json_response=True)
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+def run_style_transfer_job(services, job):
+    result_img = services.style_transfer_model.style_transfer(job.params['content_path'], job.params['style_path'])
+    job.check_cancelled()
+
+    # Save result
+    output_filename = f"style_transfer_{uuid.uuid4().hex[:8]}.png"
+    buffer = BytesIO()
+    result_img.save(buffer, 'PNG')
+    output_filename = services.artwork_store.save_bytes(buffer.getvalue(), output_filename)
+    services.on_artwork_written(output_filename, 'generated')
+    return {
+        'filename': output_filename,
+        'static_path': f'gallery/artworks/{output_filename}',
+        'message': 'Style transfer complete!'
+    }
@@ -0,0 +1,179 @@
+import hashlib
+import os
+import struct
+import tempfile
+import threading
+
+import numpy as np
+
+from audio_engine import PCM_DTYPES
+
+
+# Entry header: magic, frame rate, channels, sample width, frame count, padded so samples are aligned
+HEADER = struct.Struct('<4sIHHQ')
+HEADER_SIZE = 64
+MAGIC = b'PCM1'
+
+
+class PCMSource:
+    """A cached decode: the PCM of one source file, memory-mapped read-only as a (frames, channels) array.
+
+    Has the attributes and read() of audio_engine.WavSource, so it can feed
+    an AudioStream as well as back an AudioBuffer without a copy.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, self.frame_rate, self.channels, self.sample_width, self.frames = HEADER.unpack(
+                f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a PCM cache entry")
+        dtype = PCM_DTYPES[self.sample_width]
+        if self.frames:
+            self.samples = np.memmap(path, dtype=dtype, mode='r', offset=HEADER_SIZE,
+                                     shape=(self.frames, self.channels))
+        else:
+            # mmap cannot map zero bytes
+            self.samples = np.zeros((0, self.channels), dtype=dtype)
+
+    @property
+    def nbytes(self):
+        return self.frames * self.channels * self.sample_width
+
+    def read(self, start, count):
+        return self.samples[start:start + count]
+
+    def close(self):
+        # The mapping is released once no array refers to it
+        self.samples = None
+
+
+class PCMCache:
+    """Decoded audio on disk, keyed by the hash of the encoded file's contents.
+
+    Decoding an MP3 means running ffmpeg and holding its whole output; an
+    entry is written once, a block at a time, and every later use maps it
+    instead. Uploading the same file again, under any name, finds the same
+    entry. Entries are evicted least recently used first once the cache
+    is over max_bytes.
+    """
+
+    def __init__(self, cache_folder, max_bytes=2 * 1024 * 1024 * 1024):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = None  # Computed lazily by the first prune
+        self._keys = {}  # File identity -> content hash, so unchanged files are hashed once
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_folder, exist_ok=True)
+
+    def content_key(self, path):
+        """SHA-256 of the file's contents"""
+        stat = os.stat(path)
+        identity = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            key = self._keys.get(identity)
+        if key is not None:
+            return key
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(chunk)
+        key = digest.hexdigest()
+        with self._lock:
+            if len(self._keys) >= 4096:
+                self._keys.clear()
+            self._keys[identity] = key
+        return key
+
+    def path_for(self, key):
+        return os.path.join(self.cache_folder, key[:2], f"{key}.pcm")
+
+    def get(self, key):
+        """Return the cached PCMSource for a key, or None on a miss"""
+        path = self.path_for(key)
+        try:
+            # Refresh the mtime so pruning evicts the least recently used entries first
+            os.utime(path)
+            source = PCMSource(path)
+        except (OSError, ValueError):
+            source = None
+        with self._lock:
+            if source is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return source
+
+    def put(self, key, frame_rate, channels, sample_width, blocks):
+        """Atomically store PCM given as interleaved blocks (bytes or arrays) and return its PCMSource"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never map a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(bytes(HEADER_SIZE))
+                for block in blocks:
+                    f.write(block)
+                size = f.tell()
+                frames = (size - HEADER_SIZE) // (channels * sample_width)
+                f.seek(0)
+                f.write(HEADER.pack(MAGIC, frame_rate, channels, sample_width, frames))
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        # Mapped before pruning, which may evict an entry larger than the whole cache
+        source = PCMSource(path)
+        with self._lock:
+            needs_prune = self._total_bytes is None
+            if not needs_prune:
+                self._total_bytes += size
+                needs_prune = self._total_bytes > self.max_bytes
+        if needs_prune:
+            self.prune()
+        return source
+
+    def prune(self):
+        """Delete the least recently used entries until the cache fits in max_bytes.
+
+        An entry that is still mapped stays readable until it is closed.
+        """
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_folder):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+        with self._lock:
+            self._total_bytes = total
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'bytes': self._total_bytes or 0}
@@ -0,0 +1,108 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+
+class RenderCache:
+    """Content-addressed on-disk cache of rendered effect previews.
+
+    Every rendered preview is stored under the hash of everything that went
+    into it (source file identity, effect and render settings), so the hash
+    doubles as a strong ETag and a stale entry can never be served for a
+    changed source.
+    """
+
+    def __init__(self, cache_folder, max_bytes=512 * 1024 * 1024):
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = None  # Computed lazily by the first prune
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_folder, exist_ok=True)
+
+    def make_key(self, image_path, effect_name, *params):
+        """Hash the source file identity together with the effect and render parameters"""
+        stat = os.stat(image_path)
+        parts = [os.path.abspath(image_path), str(stat.st_mtime_ns), str(stat.st_size), effect_name]
+        parts.extend(str(param) for param in params)
+        return hashlib.sha256('\0'.join(parts).encode('utf-8')).hexdigest()
+
+    def path_for(self, key, extension='jpg'):
+        return os.path.join(self.cache_folder, key[:2], f"{key}.{extension}")
+
+    def get(self, key, extension='jpg'):
+        """Return the path of a cached render, or None on a miss"""
+        path = self.path_for(key, extension)
+        try:
+            # Refresh the mtime so pruning evicts the least recently used renders first
+            os.utime(path)
+            found = True
+        except OSError:
+            found = False
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return path if found else None
+
+    def put(self, key, data, extension='jpg'):
+        """Atomically store rendered bytes and return their path"""
+        path = self.path_for(key, extension)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial image
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        with self._lock:
+            needs_prune = self._total_bytes is None
+            if not needs_prune:
+                self._total_bytes += len(data)
+                needs_prune = self._total_bytes > self.max_bytes
+        if needs_prune:
+            self.prune()
+        return path
+
+    def prune(self):
+        """Delete the oldest renders until the cache fits in max_bytes"""
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.cache_folder):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total > self.max_bytes:
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except OSError:
+                    pass
+
+        with self._lock:
+            self._total_bytes = total
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,153 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter as SampleCounter
+from datetime import datetime
+
+from flask import g, request
+
+import metrics
+
+
+class SlowRequestProfiler:
+    """Sample the stacks of in-flight requests and keep the profiles of slow ones.
+
+    One daemon thread wakes every `interval` seconds while requests are
+    running and records the current stack of each request thread from
+    sys._current_frames(). When a request takes at least `threshold`
+    seconds, its samples are written to output_folder in collapsed-stack
+    format ('frame;frame;frame count' per line, readable by flamegraph.pl
+    and speedscope); the samples of faster requests are dropped. Only the
+    newest `keep` profiles are kept.
+    """
+
+    def __init__(self, threshold, output_folder, interval=0.01, keep=50, max_depth=64):
+        self.threshold = threshold
+        self.output_folder = output_folder
+        self.interval = interval
+        self.keep = keep
+        self.max_depth = max_depth
+        self.profiled = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        os.makedirs(self.output_folder, exist_ok=True)
+
+    def begin(self):
+        """Start sampling the calling thread"""
+        samples = SampleCounter()
+        with self._lock:
+            self._active[threading.get_ident()] = samples
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._sample, name='slow-request-profiler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def end(self, label, duration, spans=()):
+        """Stop sampling the calling thread and write its profile if the request was slow"""
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        if samples is None or duration < self.threshold:
+            return None
+
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')[:80]
+        path = os.path.join(self.output_folder, f"{timestamp}_{slug}_{int(duration * 1000)}ms.folded")
+        try:
+            with open(path, 'w') as f:
+                f.write(f"# {label} took {duration:.3f}s, {sum(samples.values())} samples "
+                        f"every {self.interval * 1000:g}ms\n")
+                for stage, elapsed in spans:
+                    f.write(f"# span {stage} {elapsed:.4f}s\n")
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+            self.profiled += 1
+            self._prune()
+        except OSError as e:
+            print(f"Error writing slow request profile: {e}")
+            return None
+        return path
+
+    def _prune(self):
+        profiles = sorted(name for name in os.listdir(self.output_folder) if name.endswith('.folded'))
+        for name in profiles[:-self.keep]:
+            try:
+                os.remove(os.path.join(self.output_folder, name))
+            except OSError:
+                pass
+
+    def _stack(self, frame):
+        frames = []
+        while frame is not None and len(frames) < self.max_depth:
+            code = frame.f_code
+            frames.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+            frame = frame.f_back
+        return ';'.join(reversed(frames))
+
+    def _sample(self):
+        while True:
+            with self._lock:
+                active = list(self._active.items())
+            if not active:
+                self._wake.clear()
+                self._wake.wait()
+                continue
+
+            frames = sys._current_frames()
+            for thread_id, samples in active:
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[self._stack(frame)] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+def instrument_app(app, registry=metrics.REGISTRY, profiler=None):
+    """Time every request into a per-route histogram, optionally profiling slow requests.
+
+    Requests are labelled by their URL rule rather than their path, so
+    /effects/<image_name> is one series however many images there are.
+    For streamed responses the time is measured until the response starts.
+    """
+    request_seconds = registry.histogram('artgallery_http_request_duration_seconds',
+                                         'Time from request start until the response is returned',
+                                         ('method', 'route', 'status'))
+    in_flight = registry.gauge('artgallery_http_requests_in_flight', 'Requests currently being handled')
+    slow_requests = registry.counter('artgallery_slow_requests_total',
+                                     'Requests slower than the profiler threshold', ('route',))
+
+    def route_label():
+        return request.url_rule.rule if request.url_rule is not None else '<unmatched>'
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_start = time.perf_counter()
+        in_flight.inc()
+        if profiler is not None:
+            metrics.start_span_collection()
+            profiler.begin()
+
+    @app.after_request
+    def record_request_time(response):
+        if 'metrics_start' in g:
+            request_seconds.observe(time.perf_counter() - g.metrics_start, method=request.method,
+                                    route=route_label(), status=response.status_code)
+            g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def finish_request_timer(error):
+        if 'metrics_start' not in g:
+            return
+        duration = time.perf_counter() - g.metrics_start
+        if 'metrics_status' not in g:
+            # The request failed before a response was made
+            request_seconds.observe(duration, method=request.method, route=route_label(), status=500)
+        in_flight.dec()
+        if profiler is not None:
+            spans = metrics.stop_span_collection()
+            if profiler.end(f"{request.method} {route_label()}", duration, spans):
+                slow_requests.inc(route=route_label())
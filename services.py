@@ -0,0 +1,152 @@
+import importlib
+import threading
+
+from flask import current_app
+
+
+class lazy:
+    """Like functools.cached_property, but builds the value at most once across threads"""
+
+    def __init__(self, func):
+        self.func = func
+        self.name = func.__name__
+        self.__doc__ = func.__doc__
+
+    def __get__(self, services, owner=None):
+        if services is None:
+            return self
+        if self.name in services.__dict__:
+            return services.__dict__[self.name]
+        with services._lock:
+            if self.name not in services.__dict__:
+                services.__dict__[self.name] = self.func(services)
+            return services.__dict__[self.name]
+
+
+class Services:
+    """The shared subsystems of one app, each built on first use.
+
+    Constructing a subsystem is where its heavy imports happen (cv2 for
+    effects and thumbnails, pydub for audio), so an app that never serves
+    audio never pays for pydub. The app factory builds only the job queue
+    eagerly, so jobs queued before a restart resume straight away; warm()
+    builds everything up front for servers that fork workers after startup.
+    """
+
+    SUBSYSTEMS = ('artwork_index', 'artwork_store', 'thumbnail_store', 'render_cache', 'batch_processor',
+                  'memory_budget', 'pcm_cache', 'waveform_store', 'audio_processor')
+    # Imported by routes on first use rather than held by a subsystem
+    MODULES = ('image_effects', 'visualization')
+
+    def __init__(self, app):
+        self.app = app
+        self.config = app.config
+        self._lock = threading.RLock()
+
+    def loaded(self, name):
+        """Return a subsystem if it has been built already, without building it"""
+        return self.__dict__.get(name)
+
+    def warm(self):
+        for name in self.SUBSYSTEMS:
+            getattr(self, name)
+        for module in self.MODULES:
+            importlib.import_module(module)
+
+    @lazy
+    def artwork_index(self):
+        from artwork_index import ArtworkIndex
+
+        index = ArtworkIndex(self.config['ARTWORK_INDEX'], self.config['ARTWORK_FOLDER'])
+        print(f"Artwork index synced: {index.sync()}")
+        return index
+
+    @lazy
+    def artwork_store(self):
+        from artwork_store import ArtworkStore
+
+        return ArtworkStore(self.config['ARTWORK_FOLDER'], self.config['BLOB_FOLDER'], index=self.artwork_index)
+
+    @lazy
+    def thumbnail_store(self):
+        from thumbnails import ThumbnailStore
+
+        return ThumbnailStore(self.config['ARTWORK_FOLDER'], self.config['THUMBNAIL_FOLDER'])
+
+    @lazy
+    def render_cache(self):
+        from render_cache import RenderCache
+
+        return RenderCache(self.config['RENDER_CACHE_FOLDER'])
+
+    @lazy
+    def batch_processor(self):
+        from batch_effects import BatchProcessor
+
+        return BatchProcessor(store_config=(self.config['ARTWORK_FOLDER'],
+                                            self.config['BLOB_FOLDER'],
+                                            self.config['ARTWORK_INDEX']))
+
+    @lazy
+    def memory_budget(self):
+        from admission import MemoryBudget
+
+        return MemoryBudget(self.config['MEMORY_BUDGET_BYTES'],
+                            max_queue=self.config['ADMISSION_QUEUE_SIZE'],
+                            timeout=self.config['ADMISSION_TIMEOUT'])
+
+    @lazy
+    def audio_processor(self):
+        from audio_processor import AudioProcessor
+
+        return AudioProcessor(self.config['AUDIO_FOLDER'], stream_threshold=self.config['AUDIO_STREAM_THRESHOLD'],
+                              pcm_cache=self.pcm_cache, waveform_store=self.waveform_store)
+
+    @lazy
+    def pcm_cache(self):
+        from pcm_cache import PCMCache
+
+        return PCMCache(self.config['PCM_CACHE_FOLDER'], max_bytes=self.config['PCM_CACHE_MAX_BYTES'])
+
+    @lazy
+    def waveform_store(self):
+        from waveform import WaveformStore
+
+        # An MP3 is decoded once, into the PCM cache, for both its processing and its peaks
+        return WaveformStore(self.config['AUDIO_FOLDER'],
+                             open_source=lambda path: self.audio_processor.peaks_source(path))
+
+    @lazy
+    def ml_processor(self):
+        """Artwork description model, or None unless ENABLE_DESCRIPTIONS is set (it needs PyTorch)"""
+        if not self.config['ENABLE_DESCRIPTIONS']:
+            return None
+        from generate_descriptions import MLProcessor
+
+        return MLProcessor(self.app)
+
+    @lazy
+    def style_transfer_model(self):
+        """Style transfer model, or None unless ENABLE_STYLE_TRANSFER is set (it needs PyTorch)"""
+        if not self.config['ENABLE_STYLE_TRANSFER']:
+            return None
+        from style_transfer import StyleTransfer
+
+        return StyleTransfer()
+
+    @lazy
+    def job_queue(self):
+        from jobs import JobQueue
+
+        return JobQueue(self.config['JOB_DATABASE'])
+
+    def on_artwork_written(self, filename, origin):
+        """Called by every code path that adds or overwrites a file in the artwork folder"""
+        if filename:
+            self.artwork_index.record(filename, origin)
+            self.thumbnail_store.schedule(filename)
+
+
+def get_services():
+    """The Services of the app handling the current request"""
+    return current_app.extensions['services']
@@ -0,0 +1,102 @@
+from flask import Blueprint, Response, current_app, jsonify, redirect, render_template, request, url_for
+
+import metrics
+from jobs import SUCCEEDED
+from services import get_services
+
+
+bp = Blueprint('system', __name__)
+
+
+def overloaded_response(e):
+    """503 with Retry-After for an AdmissionRejected; clients should retry after the given delay"""
+    if request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json':
+        response = jsonify({'success': False, 'error': str(e), 'retry_after': e.retry_after})
+    else:
+        response = current_app.response_class(f"Server is busy, please retry in {e.retry_after} seconds",
+                                              mimetype='text/plain')
+    response.status_code = 503
+    response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+def wants_json():
+    return request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json'
+
+def job_json(job):
+    return {
+        'id': job['id'],
+        'type': job['type'],
+        'status': job['status'],
+        'priority': job['priority'],
+        'created': job['created'],
+        'started': job['started'],
+        'finished': job['finished'],
+        'error': job['error'],
+        'cancel_requested': job['cancel_requested'],
+        'next_url': job['next_url'],
+        'status_url': url_for('system.job_status', job_id=job['id']),
+        'result_url': url_for('system.job_result', job_id=job['id']),
+        'cancel_url': url_for('system.cancel_job', job_id=job['id'])
+    }
+
+def submit_job(job_type, params, next_url=None, priority=0, json_response=False):
+    """Queue a job and answer at once: 202 with the job for API clients, a status page for browsers"""
+    job_queue = get_services().job_queue
+    # Clients may reorder their own work within a bounded range
+    priority = max(-100, min(100, request.values.get('priority', priority, type=int)))
+    job_id = job_queue.submit(job_type, params, priority=priority, next_url=next_url)
+    if json_response or wants_json():
+        response = jsonify(job_json(job_queue.get(job_id)))
+        response.status_code = 202
+        response.headers['Location'] = url_for('system.job_status', job_id=job_id)
+        return response
+    return redirect(url_for('system.job_status', job_id=job_id))
+
+@bp.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Job status as JSON, or a page that polls it and moves on when the job is done"""
+    job = get_services().job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if request.accept_mimetypes.best_match(['application/json', 'text/html']) == 'text/html':
+        return render_template('job_status.html', job=job_json(job))
+    return jsonify(job_json(job))
+
+@bp.route('/jobs/<job_id>/result')
+def job_result(job_id):
+    """The result of a finished job, with a URL for the file it produced"""
+    job = get_services().job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] != SUCCEEDED:
+        return jsonify({'error': f"Job is {job['status']}", **job_json(job)}), 409
+
+    result = dict(job['result'] or {})
+    if 'static_path' in result:
+        result['url'] = url_for('static', filename=result.pop('static_path'))
+    return jsonify(result)
+
+@bp.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued job, or ask a running one to stop"""
+    job_queue = get_services().job_queue
+    status = job_queue.cancel(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if wants_json():
+        return jsonify(job_json(job_queue.get(job_id)))
+    return redirect(url_for('system.job_status', job_id=job_id))
+
+@bp.route('/jobs/stats')
+def job_stats():
+    return jsonify(get_services().job_queue.stats())
+
+@bp.route('/metrics')
+def prometheus_metrics():
+    """Request and stage timing histograms plus app gauges, in Prometheus text format"""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
+@bp.route('/admission/stats')
+def admission_stats():
+    """Memory budget usage, queue depth and rejection counters"""
+    return jsonify(get_services().memory_budget.stats())
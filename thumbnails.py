@@ -0,0 +1,118 @@
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+
+# Longest-edge sizes of the pyramid, smallest first
+THUMBNAIL_SIZES = (256, 512, 1024)
+
+# Every size is written as WebP plus a JPEG fallback for older browsers
+THUMBNAIL_FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+    'jpg': ('JPEG', 'image/jpeg')
+}
+
+THUMBNAIL_QUALITY = 80
+
+
+class ThumbnailStore:
+    """Multi-resolution thumbnails of gallery artworks, kept next to the originals.
+
+    Thumbnails live under thumbnail_folder/<size>/<artwork filename>.<ext>
+    and are considered stale as soon as the original is newer, so a missing
+    or outdated thumbnail is simply rebuilt on the next request.
+    """
+
+    def __init__(self, artwork_folder, thumbnail_folder, sizes=THUMBNAIL_SIZES):
+        self.artwork_folder = artwork_folder
+        self.thumbnail_folder = thumbnail_folder
+        self.sizes = tuple(sorted(sizes))
+        self._executor = None
+        self._lock = threading.Lock()
+        os.makedirs(self.thumbnail_folder, exist_ok=True)
+
+    def path_for(self, filename, size, extension):
+        return os.path.join(self.thumbnail_folder, str(size), f"{filename}.{extension}")
+
+    def is_fresh(self, filename, size, extension):
+        try:
+            source_mtime = os.stat(os.path.join(self.artwork_folder, filename)).st_mtime_ns
+            return os.stat(self.path_for(filename, size, extension)).st_mtime_ns >= source_mtime
+        except OSError:
+            return False
+
+    def generate(self, filename):
+        """Build every size and format of one artwork from a single reduced decode"""
+        # image_effects pulls in cv2, which the gallery does not need until a thumbnail is built
+        from image_effects import open_image_reduced
+
+        source_path = os.path.join(self.artwork_folder, filename)
+
+        # Animated images are represented by their first frame
+        pil_image = open_image_reduced(source_path, self.sizes[-1])
+        if pil_image.mode not in ('RGB', 'RGBA'):
+            pil_image = pil_image.convert('RGBA' if 'transparency' in pil_image.info else 'RGB')
+
+        # Shrink from the largest size down, so each step resamples the previous one
+        for size in reversed(self.sizes):
+            pil_image = pil_image.copy()
+            pil_image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            for extension, (format, _) in THUMBNAIL_FORMATS.items():
+                self._write(pil_image, self.path_for(filename, size, extension), format)
+
+    def _write(self, pil_image, path, format):
+        if format == 'JPEG' and pil_image.mode == 'RGBA':
+            background = Image.new('RGB', pil_image.size, (255, 255, 255))
+            background.paste(pil_image, mask=pil_image.getchannel('A'))
+            pil_image = background
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so the gallery never serves a partial thumbnail
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pil_image.save(f, format=format, quality=THUMBNAIL_QUALITY)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def ensure(self, filename, size, extension):
+        """Return the path of a thumbnail, rebuilding the artwork's pyramid if it is missing or stale"""
+        if size not in self.sizes or extension not in THUMBNAIL_FORMATS:
+            raise ValueError(f"Unknown thumbnail: {size}px {extension}")
+        if not self.is_fresh(filename, size, extension):
+            self.generate(filename)
+        return self.path_for(filename, size, extension)
+
+    def schedule(self, filename):
+        """Build an artwork's thumbnails in the background right after it is written"""
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+            executor = self._executor
+
+        def build():
+            try:
+                self.generate(filename)
+            except Exception as e:
+                print(f"Error generating thumbnails for {filename}: {e}")
+
+        return executor.submit(build)
+
+    def remove(self, filename):
+        """Delete every thumbnail of an artwork"""
+        for size in self.sizes:
+            for extension in THUMBNAIL_FORMATS:
+                try:
+                    os.remove(self.path_for(filename, size, extension))
+                except OSError:
+                    pass
+
+    @staticmethod
+    def mimetype(extension):
+        return THUMBNAIL_FORMATS[extension][1]
@@ -1,5 +1,6 @@
 import pandas as pd
 import plotly.express as px
+from metrics import timed
 
 class DataVisualization:
     def __init__(self):
@@ -9,6 +10,7 @@ class DataVisualization:
             print(f"Error loading data: {e}")
             self.df = None
 
+    @timed('visualization.choropleth')
     def create_choropleth(self):
         """Create world happiness score map"""
         if self.df is None:
@@ -25,6 +27,7 @@ class DataVisualization:
         )
         return fig.to_html(full_html=False)
 
+    @timed('visualization.bar_chart')
     def create_bar_chart(self):
         """Create bar chart of top 10 happiest countries"""
         if self.df is None:
@@ -43,6 +46,7 @@ class DataVisualization:
         fig.update_layout(xaxis_tickangle=-45)
         return fig.to_html(full_html=False)
 
+    @timed('visualization.scatter_plot')
     def create_scatter_plot(self):
         """Create GDP vs Happiness scatter plot"""
         if self.df is None:
@@ -61,6 +65,7 @@ class DataVisualization:
         )
         return fig.to_html(full_html=False)
 
+    @timed('visualization.animated_scatter_plot')
     def create_animated_scatter_plot(self):
         """Create animated scatter plot for happiness evolution over years"""
         if self.df is None:
@@ -0,0 +1,15 @@
+from flask import Blueprint, render_template
+
+
+bp = Blueprint('visualization', __name__)
+
+
+@bp.route('/visualization')
+def visualization():
+    """Display happiness data visualizations"""
+    # pandas and plotly take most of a second to import, so they wait for the first visit
+    from visualization import DataVisualization
+
+    dv = DataVisualization()
+    plots = dv.get_all_plots()
+    return render_template('visualization.html', plots=plots)
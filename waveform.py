@@ -0,0 +1,206 @@
+import os
+import struct
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from audio_engine import BLOCK_FRAMES, open_source
+
+
+# Frames summarized by one min/max pair at each zoom level, finest first; each divides the next
+SAMPLES_PER_PEAK = (128, 512, 2048, 8192, 32768)
+
+MAGIC = b'PEAK'
+VERSION = 1
+# Magic, version, bits per value, channels, frame rate, frames, level count
+HEADER = struct.Struct('<4sBBHIQI')
+# Frames per peak, peak count, offset of the level's data in the file
+LEVEL = struct.Struct('<IQQ')
+
+
+def compute_peaks(source, levels=SAMPLES_PER_PEAK):
+    """Min/max pairs of every level from one pass over a WavSource (or anything with read()).
+
+    The finest level is taken over all channels of each group of frames,
+    a block at a time; every coarser level is reduced from the one before
+    it. 8-bit audio gives int8 peaks, anything wider int16, keeping the
+    top 16 bits. Returns the bits per value and one (peaks, 2) array per
+    level.
+    """
+    finest = levels[0]
+    bits = 8 if source.sample_width == 1 else 16
+    dtype = np.int8 if bits == 8 else np.dtype('<i2')
+    shift = 8 * source.sample_width - bits
+
+    lows, highs = [], []
+    for start in range(0, source.frames, BLOCK_FRAMES):
+        flat = source.read(start, min(BLOCK_FRAMES, source.frames - start)).reshape(-1)
+        groups = np.arange(0, flat.size, finest * source.channels)
+        lows.append(np.minimum.reduceat(flat, groups))
+        highs.append(np.maximum.reduceat(flat, groups))
+    low = np.concatenate(lows) if lows else np.zeros(0, dtype=dtype)
+    high = np.concatenate(highs) if highs else np.zeros(0, dtype=dtype)
+
+    peaks = []
+    for index, samples_per_peak in enumerate(levels):
+        if index:
+            groups = np.arange(0, len(low), samples_per_peak // levels[index - 1])
+            if len(low):
+                low, high = np.minimum.reduceat(low, groups), np.maximum.reduceat(high, groups)
+        peaks.append(np.stack([low >> shift, high >> shift], axis=1).astype(dtype))
+    return bits, peaks
+
+
+class WaveformPeaks:
+    """One peaks file: a header, a table of levels and each level's min/max pairs.
+
+    Levels are read a range at a time, so serving a zoomed-in view never
+    loads the rest of the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, self.bits, self.channels, self.frame_rate, self.frames, count = HEADER.unpack(
+                f.read(HEADER.size))
+            if magic != MAGIC or version != VERSION:
+                raise ValueError(f"{path} is not a version {VERSION} peaks file")
+            # (frames per peak, peak count, data offset) per level
+            self.levels = [LEVEL.unpack(f.read(LEVEL.size)) for _ in range(count)]
+        self.value_size = self.bits // 8
+
+    @property
+    def duration(self):
+        return self.frames / self.frame_rate if self.frame_rate else 0.0
+
+    def level_for_width(self, width, start_frame, end_frame):
+        """The coarsest level that still has at least width peaks between two frames"""
+        for level in reversed(range(len(self.levels))):
+            if (end_frame - start_frame) / self.levels[level][0] >= width:
+                return level
+        return 0
+
+    def select(self, level=None, width=None, start=0.0, end=None):
+        """The peaks of one level between two times in seconds.
+
+        Without a level, the coarsest one with at least width peaks over the
+        range is chosen. Returns the level, the index of its first peak in
+        the range and the peaks as interleaved little-endian min, max bytes.
+        """
+        end = self.duration if end is None else end
+        start_frame = max(int(start * self.frame_rate), 0)
+        end_frame = min(int(end * self.frame_rate), self.frames)
+        if level is None:
+            level = self.level_for_width(max(width or 1, 1), start_frame, end_frame)
+        if not 0 <= level < len(self.levels):
+            raise ValueError(f"Unknown waveform level: {level}")
+
+        samples_per_peak, peak_count, offset = self.levels[level]
+        first = min(start_frame // samples_per_peak, peak_count)
+        last = min(-(-end_frame // samples_per_peak), peak_count)
+        pair_size = 2 * self.value_size
+        with open(self.path, 'rb') as f:
+            f.seek(offset + first * pair_size)
+            data = f.read(max(last - first, 0) * pair_size)
+        return level, first, data
+
+
+class WaveformStore:
+    """Min/max peak pyramids of the audio files under audio_folder, for drawing their waveforms.
+
+    Peaks live under audio_folder/waveforms/<audio path>.peaks and are
+    considered stale as soon as the audio is newer, so missing or outdated
+    peaks are simply rebuilt on the next request; concurrent requests for
+    one file build them once. open_source(path) returns the decoded audio
+    (a WavSource or pcm_cache.PCMSource); by default the file is read, or
+    an MP3 decoded, directly.
+    """
+
+    def __init__(self, audio_folder, levels=SAMPLES_PER_PEAK, open_source=None):
+        self.audio_folder = audio_folder
+        self.waveform_folder = os.path.join(audio_folder, 'waveforms')
+        self.levels = tuple(levels)
+        self.open_source = open_source or self._open_file
+        self._lock = threading.Lock()
+        self._building = {}  # Filename -> [lock, number of threads using it]
+        os.makedirs(self.waveform_folder, exist_ok=True)
+
+    def _open_file(self, path):
+        return open_source(path, temp_folder=self.waveform_folder)
+
+    def path_for(self, filename):
+        return os.path.join(self.waveform_folder, f"{filename}.peaks")
+
+    def is_fresh(self, filename):
+        try:
+            source_mtime = os.stat(os.path.join(self.audio_folder, filename)).st_mtime_ns
+            return os.stat(self.path_for(filename)).st_mtime_ns >= source_mtime
+        except OSError:
+            return False
+
+    @contextmanager
+    def _building_peaks(self, filename):
+        """Hold the lock of one file's peaks"""
+        with self._lock:
+            entry = self._building.setdefault(filename, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._building[filename]
+
+    def generate(self, filename):
+        """Compute and write the peaks of one audio file, given relative to audio_folder"""
+        with self._building_peaks(filename):
+            return self._generate(filename)
+
+    def _generate(self, filename):
+        source = self.open_source(os.path.join(self.audio_folder, filename))
+        try:
+            bits, peaks = compute_peaks(source, self.levels)
+            header = HEADER.pack(MAGIC, VERSION, bits, source.channels, source.frame_rate, source.frames,
+                                 len(peaks))
+        finally:
+            source.close()
+
+        offset = HEADER.size + LEVEL.size * len(peaks)
+        table = []
+        for samples_per_peak, level in zip(self.levels, peaks):
+            table.append(LEVEL.pack(samples_per_peak, len(level), offset))
+            offset += level.nbytes
+
+        path = self.path_for(filename)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so a partial file is never served
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(header)
+                f.write(b''.join(table))
+                for level in peaks:
+                    f.write(level.tobytes())
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return path
+
+    def ensure(self, filename):
+        """Return the peaks of an audio file, building them first if they are missing or stale"""
+        with self._building_peaks(filename):
+            if not self.is_fresh(filename):
+                self._generate(filename)
+        return WaveformPeaks(self.path_for(filename))
+
+    def remove(self, filename):
+        try:
+            os.remove(self.path_for(filename))
+        except OSError:
+            pass